@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Generator of synthetic records shaped like the INSPIRE collections.
+
+The records have the skew of the real data rather than uniform relations:
+
+* citations follow a power law, as every paper cites older papers either
+  uniformly or by copying a reference of another paper, which makes the
+  most cited papers the most likely to be cited again;
+* author productivity follows a power law too;
+* a share of the papers are signed by every member of one of a few large
+  collaborations, thousands of authors each;
+* authors belong to institutions in a fixed ratio.
+
+The output is deterministic for a seed, so that benchmarks are repeatable.
+It can be written as a JSON lines dump, to be loaded by ``relations
+reload`` or ``INSPIRE_RELATIONS_MEMORY_DUMP``:
+
+.. code-block:: console
+
+   $ python benchmarks/generator.py --papers 100000 > records.jsonl
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import random
+import sys
+
+import click
+
+SCHEMAS = 'http://localhost:5000/schemas/records/{0}.json'
+API = 'http://localhost:5000/api/{0}/{1}'
+
+
+def _ref(endpoint, recid):
+    return {'$ref': API.format(endpoint, recid)}
+
+
+def _skewed(random_, size, skew):
+    """Return an index below ``size`` drawn from a power law.
+
+    Small indexes are the most likely, the larger the ``skew`` the more.
+    """
+    return min(int(size * random_.random() ** skew), size - 1)
+
+
+class Shape(object):
+    """Sizes of a synthetic collection of records."""
+
+    def __init__(self, papers, references=20, authors_per_paper=4,
+                 papers_per_author=8, collaborations=4,
+                 collaboration_size=3000, collaboration_share=0.005,
+                 authors_per_institution=25, uniform_citations=0.3,
+                 refereed_share=0.6):
+        """Initialize the shape of a collection of ``papers`` records.
+
+        :param references: mean number of references of a paper.
+        :param authors_per_paper: mean number of authors of a paper outside
+            of the collaborations.
+        :param papers_per_author: mean number of papers of an author.
+        :param collaboration_share: share of the papers signed by a whole
+            collaboration.
+        :param uniform_citations: share of the references drawn uniformly
+            rather than copied from another paper.
+        """
+        self.papers = papers
+        self.references = references
+        self.authors_per_paper = authors_per_paper
+        self.collaborations = collaborations
+        self.collaboration_size = collaboration_size
+        self.collaboration_share = collaboration_share
+        self.uniform_citations = uniform_citations
+        self.refereed_share = refereed_share
+        self.authors = collaborations * collaboration_size + max(
+            papers * authors_per_paper // papers_per_author, 1)
+        self.institutions = max(self.authors // authors_per_institution, 1)
+
+    def paper_recid(self, index):
+        """Return the record id of a paper."""
+        return index + 1
+
+    def author_recid(self, index):
+        """Return the record id of an author."""
+        return self.papers + index + 1
+
+    def institution_recid(self, index):
+        """Return the record id of an institution."""
+        return self.papers + self.authors + index + 1
+
+    def institution(self, author):
+        """Return the index of the institution of an author."""
+        return author * 7919 % self.institutions
+
+
+def _author(shape, index):
+    recid = shape.author_recid(index)
+    return {
+        'full_name': 'Author {0}'.format(recid),
+        'record': _ref('authors', recid),
+        'affiliations': [{'record': _ref(
+            'institutions',
+            shape.institution_recid(shape.institution(index)))}],
+    }
+
+
+def generate(shape, seed=0):
+    """Yield the records of a synthetic collection.
+
+    Papers come first, in publication order, then the authors and the
+    institutions.
+    """
+    random_ = random.Random(seed)
+    members = shape.collaboration_size
+    # The members of the collaborations are the first authors, and the
+    # other papers draw their authors from the remaining ones.
+    collaborators = shape.collaborations * members
+    independent = shape.authors - collaborators
+    cited = []
+    for index in range(shape.papers):
+        recid = shape.paper_recid(index)
+        record = {
+            '$schema': SCHEMAS.format('hep'),
+            'control_number': recid,
+            'earliest_date': str(1970 + 46 * index // shape.papers),
+            'titles': [{'title': 'Paper {0}'.format(recid)}],
+        }
+        if random_.random() < shape.refereed_share:
+            record['refereed'] = True
+
+        if index and random_.random() < shape.collaboration_share:
+            collaboration = random_.randrange(shape.collaborations)
+            record['collaborations'] = [
+                {'value': 'Collaboration {0}'.format(collaboration)}]
+            authors = range(collaboration * members,
+                            (collaboration + 1) * members)
+        else:
+            count = 1 + int(random_.expovariate(
+                1.0 / max(shape.authors_per_paper - 1, 1)))
+            authors = sorted(set(
+                collaborators + _skewed(random_, independent, 2)
+                for _ in range(count)))
+        record['authors'] = [_author(shape, author) for author in authors]
+
+        references = set()
+        if index:
+            count = int(random_.expovariate(1.0 / shape.references))
+            for _ in range(min(count, index)):
+                if not cited or random_.random() < shape.uniform_citations:
+                    references.add(random_.randrange(index))
+                else:
+                    references.add(random_.choice(cited))
+        cited.extend(references)
+        record['references'] = [
+            {'record': _ref('literature', shape.paper_recid(reference))}
+            for reference in sorted(references)]
+        yield record
+
+    for index in range(shape.authors):
+        yield {
+            '$schema': SCHEMAS.format('authors'),
+            'control_number': shape.author_recid(index),
+            'positions': [{'institution': {'record': _ref(
+                'institutions',
+                shape.institution_recid(shape.institution(index)))}}],
+        }
+
+    for index in range(shape.institutions):
+        yield {
+            '$schema': SCHEMAS.format('institutions'),
+            'control_number': shape.institution_recid(index),
+        }
+
+
+def shape_options(command):
+    """Add the options of a :class:`Shape` to a command."""
+    options = [
+        click.option('--papers', type=int, default=20000, show_default=True),
+        click.option('--references', type=int, default=20,
+                     show_default=True),
+        click.option('--authors-per-paper', type=int, default=4,
+                     show_default=True),
+        click.option('--papers-per-author', type=int, default=8,
+                     show_default=True),
+        click.option('--collaborations', type=int, default=4,
+                     show_default=True),
+        click.option('--collaboration-size', type=int, default=3000,
+                     show_default=True),
+        click.option('--collaboration-share', type=float, default=0.005,
+                     show_default=True),
+        click.option('--authors-per-institution', type=int, default=25,
+                     show_default=True),
+        click.option('--seed', type=int, default=0, show_default=True),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+@click.command()
+@shape_options
+def main(seed, **sizes):
+    """Write a synthetic collection of records as JSON lines."""
+    for record in generate(Shape(**sizes), seed=seed):
+        sys.stdout.write(json.dumps(record) + '\n')
+
+
+if __name__ == '__main__':
+    main()
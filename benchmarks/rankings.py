@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Benchmark of the citation rankings on a synthetic citation graph.
+
+Every record cites ``--references`` older records, drawn uniformly, which
+is roughly the shape and density of the HEP citation graph at a given
+number of records:
+
+.. code-block:: console
+
+   $ pip install -e .[analytics]
+   $ python benchmarks/rankings.py --records 1000000 --references 20
+"""
+
+from __future__ import absolute_import, print_function
+
+import time
+
+import click
+import numpy as np
+
+from inspire_relations.analytics import citation_graph, pagerank, \
+    time_decayed_rank
+
+
+def synthetic_graph(records, references, seed=0):
+    """Return a citation graph where records only cite older ones."""
+    random = np.random.RandomState(seed)
+    citing = np.repeat(np.arange(1, records, dtype=np.int64), references)
+    cited = (random.random_sample(len(citing)) * citing).astype(np.int64)
+    years = 1970 + np.arange(records) * 50 // records
+    return citation_graph(
+        np.arange(records), np.column_stack([citing, cited]), years)
+
+
+@click.command()
+@click.option('--records', type=int, default=100000, show_default=True)
+@click.option('--references', type=int, default=20, show_default=True)
+@click.option('--tol', type=float, default=1e-6, show_default=True)
+@click.option('--max-iter', type=int, default=100, show_default=True)
+def main(records, references, tol, max_iter):
+    """Time the loading and ranking of a synthetic citation graph."""
+    start = time.time()
+    graph = synthetic_graph(records, references)
+    click.echo('Built {0} citations of {1} records in {2:.2f}s.'.format(
+        graph.matrix.nnz, records, time.time() - start))
+    for name, rank in [('PageRank', pagerank),
+                       ('CiteRank', time_decayed_rank)]:
+        start = time.time()
+        ranking = rank(graph, tol=tol, max_iter=max_iter)
+        click.echo('{0}: {1} iterations in {2:.2f}s{3}.'.format(
+            name, ranking.iterations, time.time() - start,
+            '' if ranking.converged else ', not converged'))
+
+
+if __name__ == '__main__':
+    main()
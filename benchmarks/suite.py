@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Benchmarks of the relations code paths on a synthetic INSPIRE graph.
+
+The records of :mod:`generator` are loaded in the in-process memory
+backend, and the following are measured:
+
+* ``ingestion``: records loaded per second from JSON lines, including the
+  building of the adjacency indexes;
+* ``one_hop``: latency of every lookup, for records drawn with the skewed
+  popularity of real traffic, where highly cited papers are requested the
+  most;
+* ``multi_hop``: latency of bounded traversals, the citations of the
+  citations of a paper and the co-authors of the co-authors of an author;
+* ``cache``: hit rate and latency of the cached lookups of
+  :class:`inspire_relations.query.RelationsQuery` for the same traffic;
+* ``memory``: memory held by the loaded backend, traced in a separate load.
+
+Timings keep the best of ``--repeat`` runs. The report can be saved with
+``--output`` and compared to a previous one with ``--baseline``, in which
+case the command fails when a measure regressed by more than
+``--tolerance``:
+
+.. code-block:: console
+
+   $ python benchmarks/suite.py --papers 20000 --output baseline.json
+   $ python benchmarks/suite.py --papers 20000 --baseline baseline.json
+"""
+
+from __future__ import absolute_import, division, print_function
+
+import gc
+import json
+import random
+import sys
+from timeit import default_timer
+
+import click
+from generator import Shape, generate, shape_options
+
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.cache import TTLCache
+from inspire_relations.query import RelationsQuery
+from inspire_relations.records import AUTHOR, CITES, LITERATURE, WRITTEN_BY
+from inspire_relations.traversal import Hop, traverse
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+LOWER_IS_BETTER = ('_ms', '_us', '_bytes')
+"""Suffixes of the measures which regress when they grow."""
+
+TRAVERSALS = {
+    'citations_of_citations': (LITERATURE, [
+        Hop(CITES, LITERATURE, reverse=True),
+        Hop(CITES, LITERATURE, reverse=True)]),
+    'coauthors_of_coauthors': (AUTHOR, [
+        Hop(WRITTEN_BY, LITERATURE, reverse=True),
+        Hop(WRITTEN_BY, AUTHOR),
+        Hop(WRITTEN_BY, LITERATURE, reverse=True),
+        Hop(WRITTEN_BY, AUTHOR)]),
+}
+"""Start label and path of the benchmarked traversals."""
+
+
+def percentiles(durations):
+    """Return the median, 95th and 99th percentiles of durations in us."""
+    durations = sorted(durations)
+    last = len(durations) - 1
+    return dict(
+        ('p{0}_us'.format(rank),
+         round(durations[last * rank // 100] * 1e6, 1))
+        for rank in (50, 95, 99))
+
+
+def best(repeat, measure):
+    """Return the smallest result of repeated calls to ``measure``."""
+    return min(measure() for _ in range(repeat))
+
+
+def popular(keys, count, seed, skew=3):
+    """Return keys drawn with a skewed popularity, the first ones winning."""
+    random_ = random.Random(seed)
+    return [keys[min(int(len(keys) * random_.random() ** skew),
+                     len(keys) - 1)]
+            for _ in range(count)]
+
+
+def load(lines):
+    """Return a memory backend holding records, with its indexes built."""
+    backend = MemoryBackend()
+    backend.load(lines)
+    for name in ('citations', 'references', 'coauthors', 'author_papers'):
+        backend.lookup(name, 0)
+    return backend
+
+
+def bench_ingestion(lines, repeat):
+    """Measure the loading of the records."""
+    def measure():
+        gc.collect()
+        start = default_timer()
+        load(lines)
+        return default_timer() - start
+    seconds = best(repeat, measure)
+    return {
+        'records': len(lines),
+        'seconds_ms': round(seconds * 1e3, 1),
+        'records_per_second': round(len(lines) / seconds),
+    }
+
+
+def bench_one_hop(backend, papers, authors, lookups, repeat, seed):
+    """Measure the latency of the lookups."""
+    results = {}
+    for name, keys in [('citation_count', papers), ('citations', papers),
+                       ('references', papers), ('coauthors', authors),
+                       ('author_papers', authors)]:
+        sample = popular(keys, lookups, seed)
+
+        def measure():
+            durations = []
+            for key in sample:
+                start = default_timer()
+                backend.lookup(name, key)
+                durations.append(default_timer() - start)
+            return sorted(durations)
+        results[name] = percentiles(best(repeat, measure))
+    return results
+
+
+def bench_multi_hop(backend, papers, authors, traversals, repeat, seed):
+    """Measure the latency of bounded traversals."""
+    results = {}
+    for name, (label, path) in sorted(TRAVERSALS.items()):
+        keys = papers if label == LITERATURE else authors
+        sample = popular(keys, traversals, seed)
+        truncated = []
+
+        def measure():
+            durations = []
+            del truncated[:]
+            for key in sample:
+                start = default_timer()
+                traversal = traverse(backend, (label, key), path)
+                durations.append(default_timer() - start)
+                truncated.append(bool(traversal.truncated))
+            return sorted(durations)
+        results[name] = percentiles(best(repeat, measure))
+        results[name]['truncated_share'] = round(
+            sum(truncated) / len(truncated), 3)
+    return results
+
+
+def bench_cache(backend, papers, authors, lookups, cache_size, seed):
+    """Measure the cached lookups of the same traffic."""
+    random_ = random.Random(seed)
+    names = [random_.choice(['citations', 'references', 'coauthors'])
+             for _ in range(lookups)]
+    requests = list(zip(names, popular(papers, lookups, seed),
+                        popular(authors, lookups, seed)))
+    query = RelationsQuery(backend, TTLCache(maxsize=cache_size, ttl=3600))
+    start = default_timer()
+    for name, paper, author in requests:
+        getattr(query, name)(author if name == 'coauthors' else paper)
+    seconds = default_timer() - start
+    return {
+        'cache_size': cache_size,
+        'hit_rate': round(query.cache.hit_rate(), 3),
+        'mean_us': round(seconds / len(requests) * 1e6, 1),
+    }
+
+
+def bench_memory(lines):
+    """Measure the memory held by the loaded backend."""
+    if tracemalloc is None:
+        return {}
+    gc.collect()
+    tracemalloc.start()
+    try:
+        backend = load(lines)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'backend_bytes': current,
+        'peak_bytes': peak,
+        'bytes_per_node': current // len(backend),
+    }
+
+
+def flatten(report, prefix=''):
+    """Return the measures of a report by dotted name."""
+    measures = {}
+    for name, value in report.items():
+        if isinstance(value, dict):
+            measures.update(flatten(value, prefix + name + '.'))
+        else:
+            measures[prefix + name] = value
+    return measures
+
+
+def regressions(report, baseline, tolerance):
+    """Return the measures of a report worse than a baseline's.
+
+    :returns: a list of ``(name, value, baseline value)`` tuples.
+    """
+    current = flatten(report)
+    worse = []
+    for name, previous in sorted(flatten(baseline).items()):
+        value = current.get(name)
+        if name.startswith('shape.') or name.endswith('_share') or \
+                not previous or not isinstance(value, (int, float)):
+            continue
+        if name.endswith(LOWER_IS_BETTER):
+            regressed = value > previous * (1 + tolerance)
+        else:
+            regressed = value < previous * (1 - tolerance)
+        if regressed:
+            worse.append((name, value, previous))
+    return worse
+
+
+@click.command()
+@shape_options
+@click.option('--repeat', type=int, default=3, show_default=True,
+              help='Number of runs of each timing, the best is kept.')
+@click.option('--lookups', type=int, default=10000, show_default=True,
+              help='Number of lookups per lookup name.')
+@click.option('--traversals', type=int, default=200, show_default=True,
+              help='Number of traversals per path.')
+@click.option('--cache-size', type=int, default=1000, show_default=True)
+@click.option('--memory/--no-memory', default=True, show_default=True,
+              help='Trace the memory held by the backend.')
+@click.option('--output', type=click.File('w'), default=None,
+              help='Save the report as JSON.')
+@click.option('--baseline', type=click.File('r'), default=None,
+              help='Compare the report to a previously saved one.')
+@click.option('--tolerance', type=float, default=0.2, show_default=True,
+              help='Relative change of a measure reported as regression.')
+def main(seed, repeat, lookups, traversals, cache_size, memory, output,
+         baseline, tolerance, **sizes):
+    """Benchmark the memory backend on a synthetic INSPIRE graph."""
+    shape = Shape(**sizes)
+    start = default_timer()
+    lines = [json.dumps(record) for record in generate(shape, seed=seed)]
+    click.echo('Generated {0} records in {1:.2f}s.'.format(
+        len(lines), default_timer() - start), err=True)
+
+    report = {'shape': dict(sizes, seed=seed)}
+    report['ingestion'] = bench_ingestion(lines, repeat)
+    backend = load(lines)
+    papers = sorted(
+        (shape.paper_recid(index) for index in range(shape.papers)),
+        key=lambda recid: -backend.lookup('citation_count', recid))
+    authors = sorted(
+        (shape.author_recid(index) for index in range(shape.authors)),
+        key=lambda recid: -len(backend.lookup('author_papers', recid)))
+    report['one_hop'] = bench_one_hop(
+        backend, papers, authors, lookups, repeat, seed)
+    report['multi_hop'] = bench_multi_hop(
+        backend, papers, authors, traversals, repeat, seed)
+    report['cache'] = bench_cache(
+        backend, papers, authors, lookups, cache_size, seed)
+    if memory:
+        del backend
+        report['memory'] = bench_memory(lines)
+
+    for name, value in sorted(flatten(report).items()):
+        click.echo('{0:<50} {1}'.format(name, value))
+    if output:
+        json.dump(report, output, indent=2, sort_keys=True)
+    if baseline:
+        worse = regressions(report, json.load(baseline), tolerance)
+        for name, value, previous in worse:
+            click.secho('Regression of {0}: {1} instead of {2}.'.format(
+                name, value, previous), fg='red', err=True)
+        if worse:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Generation of ``neo4j-admin import`` files from a records dump.
+
+The dump is read once, in a single streaming pass that partitions the
+nodes and relations of every record by a hash of their (start) node key
+into temporary shard files. Every shard is then deduplicated and written as
+a CSV data file by a pool of worker processes. The rows of a shard are
+streamed to its data file, only the line numbers of the rows kept being
+held in memory, so memory use is bounded by the number of distinct nodes or
+relations of one shard rather than by the size of the dump.
+
+For every node label and relation group, a header file is written next to
+the data files, in the format expected by the Neo4j bulk importer.
+"""
+
+from __future__ import absolute_import, print_function
+
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from functools import partial
+from multiprocessing import Pool
+
+from .records import NODE_KEYS, get_node, get_relations
+
+NODE_COLUMNS = {
+    'Author': [('recid', 'long'), ('orcid', None)],
+    'Literature': [('recid', 'long'), ('year', 'int'),
+                   ('refereed', 'boolean'), ('arxiv_eprints', 'string[]'),
+                   ('dois', 'string[]'), ('pubnotes', 'string[]'),
+                   ('report_numbers', 'string[]')],
+    'Collaboration': [('name', None)],
+}
+"""Properties exported for each label, with their importer types."""
+
+DEFAULT_NODE_COLUMNS = [('recid', 'long')]
+
+RELATION_COLUMNS = {
+    'CITES': [('date', None)],
+    'AFFILIATED_WITH': [('date', None), ('start_date', None),
+                        ('end_date', None)],
+}
+"""Properties exported for each relation type, with their importer types."""
+
+
+def _shard(key, shards):
+    """Return the shard of a node key, stable across processes."""
+    return zlib.crc32(str(key).encode('utf-8')) % shards
+
+
+def _relation_file(group):
+    return '-'.join(group)
+
+
+def _column(name, type_):
+    return '{0}:{1}'.format(name, type_) if type_ else name
+
+
+def node_header(label):
+    """Return the CSV header of the nodes of a label."""
+    return [':ID({0})'.format(label)] + [
+        _column(name, type_)
+        for name, type_ in NODE_COLUMNS.get(label, DEFAULT_NODE_COLUMNS)]
+
+
+def relation_header(group):
+    """Return the CSV header of a ``(type, start, end)`` relation group."""
+    type_, start, end = group
+    return [':START_ID({0})'.format(start), ':END_ID({0})'.format(end)] + [
+        _column(name, type_) for name, type_ in RELATION_COLUMNS.get(type_, [])
+    ]
+
+
+class _ShardWriter(object):
+    """Append rows to lazily opened temporary shard files."""
+
+    def __init__(self, directory, shards):
+        self.directory = directory
+        self.shards = shards
+        self.files = {}
+
+    def write(self, kind, name, key, row):
+        shard = _shard(key, self.shards)
+        path = os.path.join(
+            self.directory, '{0}.{1}.{2:04d}'.format(kind, name, shard))
+        if path not in self.files:
+            self.files[path] = io.open(path, 'w', encoding='utf-8')
+        self.files[path].write(json.dumps(row) + u'\n')
+
+    def close(self):
+        for fp in self.files.values():
+            fp.close()
+        return sorted(self.files)
+
+
+def partition(records, directory, shards):
+    """Partition the nodes and relations of records into shard files.
+
+    Nodes referenced by a relation are also written, without properties,
+    so that every relation has both of its ends in the node files.
+
+    :returns: the paths of the shard files written.
+    """
+    writer = _ShardWriter(directory, shards)
+    try:
+        for record in records:
+            node = get_node(record)
+            if node is None:
+                continue
+            writer.write('nodes', node.label, node.key,
+                         [node.key, node.properties])
+            for relation in get_relations(record):
+                end_label, end_key = relation.end
+                writer.write('nodes', end_label, end_key, [end_key, None])
+                group = _relation_file(
+                    (relation.type, relation.start[0], end_label))
+                writer.write('relations', group, relation.start[1],
+                             [relation.start[1], end_key,
+                              relation.properties])
+    finally:
+        paths = writer.close()
+    return paths
+
+
+def _cell(value):
+    """Return a CSV cell, joining arrays with the importer delimiter."""
+    if isinstance(value, list):
+        return ';'.join(str(item) for item in value)
+    return value
+
+
+def _node_row(label, key, properties):
+    """Return the CSV row of a node, from its key if it has no properties."""
+    properties = properties or {NODE_KEYS[label]: key}
+    return [key] + [_cell(properties.get(name, '')) for name, _
+                    in NODE_COLUMNS.get(label, DEFAULT_NODE_COLUMNS)]
+
+
+def _relation_row(type_, start, end, properties):
+    """Return the CSV row of a relation."""
+    return [start, end] + [properties.get(name, '')
+                           for name, _ in RELATION_COLUMNS.get(type_, [])]
+
+
+def _kept_lines(path, kind):
+    """Return the numbers of the lines of a shard file kept in its CSV.
+
+    Nodes keep their last row with properties, or their first row if they
+    have none. Relations keep their last row.
+    """
+    kept = {}
+    with io.open(path, encoding='utf-8') as fp:
+        for number, line in enumerate(fp):
+            row = json.loads(line)
+            if kind != 'nodes':
+                kept[row[0], row[1]] = number
+            elif row[1] is not None or row[0] not in kept:
+                kept[row[0]] = number
+    return set(kept.values())
+
+
+def write_shard(args):
+    """Write the CSV data file of a shard, deduplicating its rows.
+
+    The shard file is read twice: once to find the rows to keep, then to
+    write them as they are read.
+
+    :param args: a ``(shard path, output directory)`` tuple.
+    :returns: the path of the data file written.
+    """
+    path, output = args
+    kind, name, shard = os.path.basename(path).split('.')
+    kept = _kept_lines(path, kind)
+    if kind == 'nodes':
+        format_row = partial(_node_row, name)
+    else:
+        format_row = partial(_relation_row, name.split('-')[0])
+    target = os.path.join(output, '{0}-{1}.csv'.format(name, shard))
+    with io.open(path, encoding='utf-8') as lines, \
+            io.open(target, 'w', encoding='utf-8', newline='') as fp:
+        writer = csv.writer(fp)
+        for number, line in enumerate(lines):
+            if number in kept:
+                writer.writerow(format_row(*json.loads(line)))
+    return target
+
+
+def _write_headers(output, data_files):
+    """Write the header files and return the importer arguments."""
+    groups = {}
+    for path in data_files:
+        name = os.path.basename(path).rsplit('-', 1)[0]
+        groups.setdefault(name, []).append(path)
+
+    arguments = []
+    for name in sorted(groups):
+        parts = name.split('-')
+        if len(parts) == 1:
+            option, header = '--nodes', node_header(name)
+        else:
+            option, header = '--relationships', relation_header(parts)
+        header_path = os.path.join(output, '{0}-header.csv'.format(name))
+        with io.open(header_path, 'w', encoding='utf-8', newline='') as fp:
+            csv.writer(fp).writerow(header)
+        arguments.append('{0}={1}={2}'.format(
+            option, parts[0], ','.join([header_path] + sorted(groups[name]))))
+    return arguments
+
+
+def generate_import_files(records, output, shards=8, processes=None):
+    """Write ``neo4j-admin import`` files for the records of a dump.
+
+    :param records: an iterable of record JSON, consumed lazily.
+    :param output: the directory receiving the CSV files.
+    :param shards: number of data files per node label and relation group.
+    :param processes: number of worker processes writing the data files,
+        defaults to the number of CPUs.
+    :returns: the ``neo4j-admin import`` arguments loading the files.
+    """
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    tmp = tempfile.mkdtemp(prefix='inspire-relations-', dir=output)
+    try:
+        paths = partition(records, tmp, shards)
+        pool = Pool(processes)
+        try:
+            data_files = pool.map(
+                write_shard, [(path, output) for path in paths])
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(tmp)
+    return _write_headers(output, data_files)
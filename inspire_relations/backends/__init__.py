@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Storage engines of the relations graph.
+
+The extension only talks to the graph through a :class:`GraphBackend`,
+chosen by ``INSPIRE_RELATIONS_BACKEND``: either the name of one of the
+:data:`BACKENDS` or the import path of a backend class.
+"""
+
+from __future__ import absolute_import, print_function
+
+from werkzeug.utils import import_string
+
+from .base import CITATION_FILTERS, LOOKUPS, RELATION_COUNTS, GraphBackend
+
+BACKENDS = {
+    'neo4j': 'inspire_relations.backends.neo4j:Neo4jBackend',
+    'memory': 'inspire_relations.backends.memory:MemoryBackend',
+    'sharded': 'inspire_relations.backends.sharded:ShardedBackend',
+}
+"""Import paths of the bundled backends, by name."""
+
+
+def load_backend(config, graph):
+    """Create the backend selected by ``INSPIRE_RELATIONS_BACKEND``.
+
+    :param config: the application configuration.
+    :param graph: the :class:`inspire_relations.graph.GraphPool` of the
+        application, used by the Neo4j backend.
+    """
+    backend = config['INSPIRE_RELATIONS_BACKEND']
+    if isinstance(backend, str):
+        backend = import_string(BACKENDS.get(backend, backend))
+    return backend.from_config(config, graph)
+
+
+__all__ = ('BACKENDS', 'CITATION_FILTERS', 'GraphBackend', 'LOOKUPS',
+           'RELATION_COUNTS', 'load_backend')
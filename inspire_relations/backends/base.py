@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Interface of the storage engines of the relations graph."""
+
+from __future__ import absolute_import, print_function
+
+import heapq
+from itertools import islice
+
+from ..records import AUTHOR, LITERATURE
+
+LOOKUPS = ('author_papers', 'citation_count', 'citations', 'coauthors',
+           'references')
+"""Names of the one-hop lookups answered by every backend.
+
+``citation_count`` is a number, the others are sorted tuples of record ids.
+"""
+
+CITATION_FILTERS = ('exclude_collaboration', 'exclude_self', 'refereed_only')
+"""Names of the filters of citations.
+
+``exclude_self`` drops the citations between papers sharing an author,
+``exclude_collaboration`` those between papers of the same collaboration,
+and ``refereed_only`` keeps the citations from refereed papers.
+"""
+
+RELATION_COUNTS = {
+    LITERATURE: ('citation_count', 'reference_count'),
+    AUTHOR: ('coauthor_count', 'paper_count'),
+}
+"""Names of the relation counts of the nodes of each label."""
+
+UPDATED = 'relations_updated'
+"""Property stamping the nodes with the time their relations changed."""
+
+_COUNT_LOOKUPS = {
+    'citation_count': 'citation_count',
+    'reference_count': 'references',
+    'coauthor_count': 'coauthors',
+    'paper_count': 'author_papers',
+}
+
+
+class GraphBackend(object):
+    """Storage of the nodes and relations of the records.
+
+    Writes receive the rows built by :mod:`inspire_relations.ingest` and
+    :mod:`inspire_relations.sync`, so that any backend can be loaded by the
+    ingestion and kept in sync with record changes.
+    """
+
+    process_local = False
+    """Whether the graph lives in the memory of the process, so that writes
+    made by other processes are not seen."""
+
+    @classmethod
+    def from_config(cls, config, graph):
+        """Create the backend from the application configuration."""
+        raise NotImplementedError
+
+    def check_schema(self):
+        """Raise :class:`inspire_relations.schema.SchemaError` if unusable."""
+
+    def write_batch(self, nodes, relations):
+        """Merge nodes and relations grouped into rows for the ingestion.
+
+        The batch is built by :func:`inspire_relations.ingest.prepare_batch`.
+        Citation metrics are not maintained, see :meth:`recompute_metrics`.
+        """
+        raise NotImplementedError
+
+    def write_changes(self, changes):
+        """Write changes built by :func:`inspire_relations.sync.merge_diffs`.
+
+        Writing the same changes twice must be harmless.
+
+        :returns: whether anything was written.
+        """
+        raise NotImplementedError
+
+    def iter_nodes(self, label, properties=()):
+        """Yield the key of every node of a label and the given properties.
+
+        :returns: an iterator of ``(key, properties)`` tuples.
+        """
+        raise NotImplementedError
+
+    def properties_many(self, label, keys):
+        """Return the properties of many nodes of a label.
+
+        :returns: a dictionary mapping each of the ``keys`` of an existing
+            node to the dictionary of its properties.
+        """
+        raise NotImplementedError
+
+    def iter_relations(self, type_, start_label, end_label):
+        """Yield the ``(start, end)`` keys of all relations of a type."""
+        raise NotImplementedError
+
+    def neighbours_many(self, type_, start_label, end_label, keys,
+                        reverse=False, limit=None, timeout=None):
+        """Return the neighbours of many nodes through relations of a type.
+
+        :param keys: keys of nodes of ``start_label``, or of ``end_label``
+            if ``reverse``.
+        :param limit: the maximum number of neighbours returned per node.
+        :param timeout: the seconds after which a database server may abort
+            the call, raising :class:`inspire_relations.graph.QueryTimeout`.
+        :returns: a dictionary mapping each of the ``keys`` having
+            neighbours to the tuple of their keys.
+        """
+        raise NotImplementedError
+
+    def ranked_neighbours(self, type_, start_label, end_label, key, weight,
+                          limit=10):
+        """Return the neighbours of a node ranked by a relation property.
+
+        :param weight: the name of the property of the relations, by
+            decreasing value of which the neighbours are ranked.
+        :returns: a list of at most ``limit`` ``(key, properties)`` tuples,
+            with the properties of the relation to each neighbour.
+        """
+        raise NotImplementedError
+
+    def lookup(self, name, recid):
+        """Answer one of the :data:`LOOKUPS` for a record."""
+        raise NotImplementedError
+
+    def lookup_many(self, recids):
+        """Answer several lookups for many records at once.
+
+        :param recids: a dictionary mapping lookup names to record ids.
+        :returns: a dictionary mapping lookup names to dictionaries of
+            results by record id.
+        """
+        return dict(
+            (name, dict((recid, self.lookup(name, recid)) for recid in ids))
+            for name, ids in recids.items())
+
+    def page(self, name, recid, after=None, limit=25):
+        """Yield the ids of a lookup following ``after``, in order."""
+        raise NotImplementedError
+
+    def filtered_citations(self, label, recid, filters=(), after=None,
+                           limit=25):
+        """Return a page of the records citing a paper or an author.
+
+        :param label: ``'Literature'``, or ``'Author'`` for the citations of
+            the papers of an author.
+        :param filters: names of :data:`CITATION_FILTERS`.
+        :returns: a sorted tuple of the distinct citing record ids following
+            ``after``.
+        """
+        raise NotImplementedError
+
+    def filtered_citation_count(self, label, recid, filters=()):
+        """Return the number of filtered citations of a paper or an author."""
+        raise NotImplementedError
+
+    def changed_keys(self, label, since):
+        """Return the keys of the nodes whose relations changed since a time.
+
+        Changes written by :meth:`write_changes` stamp the nodes whose
+        :data:`RELATION_COUNTS` they may change with the time of the write,
+        in milliseconds, as their ``relations_updated`` property. Bulk
+        writes are not stamped.
+
+        :returns: a sorted list of the keys of the nodes stamped at or after
+            ``since``.
+        """
+        return sorted(
+            key for key, values in self.iter_nodes(label, [UPDATED])
+            if values[UPDATED] is not None and values[UPDATED] >= since)
+
+    def iter_relation_counts(self, label, batch_size=1000, since=None):
+        """Yield the :data:`RELATION_COUNTS` of the nodes of a label.
+
+        The nodes are read ``batch_size`` at a time, by answering the
+        lookups of every batch at once.
+
+        :param since: if given, only the nodes whose relations changed
+            since this time are read, see :meth:`changed_keys`.
+        :returns: an iterator of ``(key, counts)`` tuples, ``counts`` being a
+            dictionary of the counts by name.
+        """
+        names = RELATION_COUNTS[label]
+        if since is None:
+            keys = (key for key, _ in self.iter_nodes(label))
+        else:
+            keys = iter(self.changed_keys(label, since))
+        while True:
+            batch = list(islice(keys, batch_size))
+            if not batch:
+                return
+            answers = self.lookup_many(dict(
+                (_COUNT_LOOKUPS[name], batch) for name in names))
+            for key in batch:
+                counts = {}
+                for name in names:
+                    value = answers[_COUNT_LOOKUPS[name]][key]
+                    counts[name] = value if name == 'citation_count' \
+                        else len(value)
+                yield key, counts
+
+    def monthly_citations_many(self, recids, from_relations=False):
+        """Return the number of dated citations of papers per month.
+
+        :param from_relations: whether to count the dates of the citations
+            rather than read counts maintained on the nodes, if any.
+        :returns: a dictionary mapping each of the ``recids`` having dated
+            citations to a dictionary of their number by ``YYYYMM`` month.
+        """
+        raise NotImplementedError
+
+    def rising_papers(self, since, limit=25, batch_size=1000):
+        """Return the papers most cited since a month.
+
+        The citations per month of all papers are read ``batch_size`` at a
+        time.
+
+        :param since: the first ``YYYYMM`` month counted.
+        :returns: a list of at most ``limit`` ``(recid, citations)`` tuples,
+            by decreasing number of citations.
+        """
+        keys = (key for key, _ in self.iter_nodes(LITERATURE))
+        counts = []
+        while True:
+            batch = list(islice(keys, batch_size))
+            if not batch:
+                break
+            for recid, months in self.monthly_citations_many(batch).items():
+                citations = sum(count for month, count in months.items()
+                                if month >= since)
+                if citations:
+                    counts.append((-citations, recid))
+            counts = heapq.nsmallest(limit, counts)
+        return [(recid, -citations) for citations, recid in counts]
+
+    def affiliations_at(self, recid, date):
+        """Return the institutions an author was affiliated with at a date.
+
+        :param date: a ``YYYY-MM-DD`` date.
+        :returns: a sorted tuple of institution record ids.
+        """
+        raise NotImplementedError
+
+    def literature_metrics(self, recid):
+        """Return the citation metrics of a literature record, or ``None``."""
+        raise NotImplementedError
+
+    def author_metrics(self, recid):
+        """Return the citation metrics of an author, or ``None``."""
+        raise NotImplementedError
+
+    def recompute_metrics(self, batch_size=1000):
+        """Recompute the citation metrics of all nodes.
+
+        :returns: a :class:`collections.Counter` with the number of
+            ``literature`` and ``authors`` nodes updated.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release the resources held by the backend."""
@@ -0,0 +1,694 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Relations graph held in the memory of the process.
+
+Nodes are interned: every ``(label, key)`` gets a dense integer id, and
+their properties are kept in columns, one list per property indexed by node
+id. The relations of each type are stored in :class:`Adjacency` arrays,
+compressed sparse rows of their starts and of their ends, with the
+properties of the relations in columns along the rows of their starts. A
+one-hop lookup is then a slice of an array.
+
+Writes go to a small buffer of changes per type, overlaid on the rows of the
+nodes they touch, and merged into new arrays once it grows past a fraction
+of them, so that the cost of rebuilding the arrays is shared by many writes.
+
+Citation metrics are not materialized but computed from the arrays when
+they are read.
+"""
+
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from itertools import islice
+
+from ..ingest import ingest, iter_dump
+from ..records import AFFILIATED_WITH, AUTHOR, CITES, IN_COLLABORATION, \
+    INSTITUTION, LITERATURE, WRITTEN_BY
+from ..sync import counted_nodes
+from ..temporal import to_month
+from .base import UPDATED, GraphBackend
+
+OUT = 'out'
+IN = 'in'
+
+MERGE_SIZE = 1024
+"""Number of buffered relation changes always allowed before a merge."""
+
+MERGE_RATIO = 4
+"""Merge the buffered changes of a type once they exceed the relations in
+its arrays divided by this ratio."""
+
+_HOPS = {
+    'citations': (LITERATURE, CITES, IN),
+    'references': (LITERATURE, CITES, OUT),
+    'author_papers': (AUTHOR, WRITTEN_BY, IN),
+}
+
+
+class Adjacency(object):
+    """Neighbours of every node, in compressed sparse rows.
+
+    The neighbours of the node ``i`` are ``targets[offsets[i]:offsets[i +
+    1]]``, sorted by key, then by id.
+    """
+
+    __slots__ = ('offsets', 'targets', 'sort_key')
+
+    def __init__(self, size, pairs, sort_key):
+        """Build the rows of ``size`` nodes from ``(source, target)`` pairs.
+
+        :param sort_key: callable returning the key of a node id.
+        """
+        pairs = sorted(pairs, key=lambda pair: (
+            pair[0], sort_key(pair[1]), pair[1]))
+        offsets = array('l', [0]) * (size + 1)
+        for source, _ in pairs:
+            offsets[source + 1] += 1
+        for node in range(size):
+            offsets[node + 1] += offsets[node]
+        self.offsets = offsets
+        self.targets = array('l', [target for _, target in pairs])
+        self.sort_key = sort_key
+
+    def __len__(self):
+        """Return the number of pairs."""
+        return len(self.targets)
+
+    def neighbours(self, node):
+        """Return the neighbours of a node."""
+        if node + 1 >= len(self.offsets):
+            return self.targets[:0]
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def position(self, source, target):
+        """Return the index of a pair in :attr:`targets`, or ``None``."""
+        if source + 1 >= len(self.offsets):
+            return None
+        low, high = self.offsets[source], self.offsets[source + 1]
+        key = (self.sort_key(target), target)
+        while low < high:
+            middle = (low + high) // 2
+            other = self.targets[middle]
+            if (self.sort_key(other), other) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.offsets[source + 1] and self.targets[low] == target:
+            return low
+        return None
+
+
+class Relations(object):
+    """Relations of a type, in arrays and a buffer of changes.
+
+    The buffer holds the pairs added since the last merge, by node in
+    either direction, the pairs of the arrays removed since, and the
+    properties of the pairs changed since. All the changes and the reads
+    of the rows they touch are made under ``lock``.
+    """
+
+    def __init__(self, sort_key, lock):
+        """Initialize the relations, with no pairs."""
+        self.sort_key = sort_key
+        self.lock = lock
+        self.rows = {OUT: Adjacency(0, (), sort_key),
+                     IN: Adjacency(0, (), sort_key)}
+        self.columns = {}
+        self.added = {OUT: defaultdict(set), IN: defaultdict(set)}
+        self.removed = set()
+        self.changed = {}
+        self.touched = {OUT: set(), IN: set()}
+        self.pending = 0
+
+    def _in_rows(self, start, end):
+        return self.rows[OUT].position(start, end) is not None and \
+            (start, end) not in self.removed
+
+    def _in_buffer(self, start, end):
+        targets = self.added[OUT].get(start)
+        return targets is not None and end in targets
+
+    def _touch(self, start, end):
+        self.pending += 1
+        self.touched[OUT].add(start)
+        self.touched[IN].add(end)
+
+    def add(self, start, end, properties):
+        """Add a pair, or replace the properties of an existing one."""
+        pair = (start, end)
+        if not self._in_rows(start, end) and \
+                not self._in_buffer(start, end):
+            if pair in self.removed:
+                self.removed.discard(pair)
+            else:
+                self.added[OUT][start].add(end)
+                self.added[IN][end].add(start)
+            self._touch(start, end)
+        if self.properties(start, end) != properties:
+            self.changed[pair] = dict(properties)
+            self.pending += 1
+
+    def remove(self, start, end):
+        """Remove a pair, if present."""
+        pair = (start, end)
+        if self._in_buffer(start, end):
+            self.added[OUT][start].discard(end)
+            self.added[IN][end].discard(start)
+        elif self._in_rows(start, end):
+            self.removed.add(pair)
+        else:
+            return
+        self.changed.pop(pair, None)
+        self._touch(start, end)
+
+    def properties(self, start, end):
+        """Return a copy of the properties of a pair."""
+        with self.lock:
+            changed = self.changed.get((start, end))
+            if changed is not None:
+                return dict(changed)
+            position = self.rows[OUT].position(start, end)
+            if position is None:
+                return {}
+            return dict((name, column[position])
+                        for name, column in self.columns.items()
+                        if column[position] is not None)
+
+    def neighbours(self, node, direction=OUT):
+        """Return the neighbours of a node, sorted by key."""
+        if node not in self.touched[direction]:
+            return self.rows[direction].neighbours(node)
+        with self.lock:
+            if direction == OUT:
+                kept = [target for target
+                        in self.rows[OUT].neighbours(node)
+                        if (node, target) not in self.removed]
+            else:
+                kept = [source for source
+                        in self.rows[IN].neighbours(node)
+                        if (source, node) not in self.removed]
+            kept.extend(self.added[direction].get(node, ()))
+        kept.sort(key=lambda other: (self.sort_key(other), other))
+        return array('l', kept)
+
+    def pairs(self):
+        """Return all the pairs."""
+        with self.lock:
+            rows = self.rows[OUT]
+            pairs = [(source, target)
+                     for source in range(len(rows.offsets) - 1)
+                     for target in rows.neighbours(source)
+                     if (source, target) not in self.removed]
+            pairs.extend((source, target)
+                         for source, targets in self.added[OUT].items()
+                         for target in targets)
+        return pairs
+
+    def _row_properties(self):
+        """Return the properties in the columns, by pair."""
+        rows = self.rows[OUT]
+        properties = defaultdict(dict)
+        for name, column in self.columns.items():
+            for source in range(len(rows.offsets) - 1):
+                for position in range(rows.offsets[source],
+                                      rows.offsets[source + 1]):
+                    if column[position] is not None:
+                        properties[(source, rows.targets[position])][name] = \
+                            column[position]
+        return properties
+
+    def merge(self, size, force=False):
+        """Merge the buffer into new arrays for ``size`` nodes.
+
+        Unless ``force``, the buffer is only merged once it grows past
+        :data:`MERGE_SIZE` and a :data:`MERGE_RATIO` of the arrays.
+        """
+        if not self.pending or not force and self.pending <= max(
+                MERGE_SIZE, len(self.rows[OUT]) // MERGE_RATIO):
+            return
+        with self.lock:
+            pairs = self.pairs()
+            out = Adjacency(size, pairs, self.sort_key)
+            properties = self._row_properties()
+            properties.update(self.changed)
+            columns = {}
+            position = 0
+            for source in range(size):
+                for target in out.neighbours(source):
+                    for name, value in properties.get(
+                            (source, target), {}).items():
+                        columns.setdefault(name, [None] * len(out))
+                        columns[name][position] = value
+                    position += 1
+            self.rows = {
+                OUT: out,
+                IN: Adjacency(size, ((target, source)
+                                     for source, target in pairs),
+                              self.sort_key),
+            }
+            self.columns = columns
+            self.added = {OUT: defaultdict(set), IN: defaultdict(set)}
+            self.removed = set()
+            self.changed = {}
+            self.touched = {OUT: set(), IN: set()}
+            self.pending = 0
+
+
+class _Direction(object):
+    """Neighbours of the relations of a type in a direction."""
+
+    __slots__ = ('relations', 'direction')
+
+    def __init__(self, relations, direction):
+        """Initialize the view."""
+        self.relations = relations
+        self.direction = direction
+
+    def neighbours(self, node):
+        """Return the neighbours of a node, sorted by key."""
+        return self.relations.neighbours(node, self.direction)
+
+
+def _bisect_right(nodes, key, sort_key):
+    """Return the position following the nodes with a key up to ``key``."""
+    low, high = 0, len(nodes)
+    while low < high:
+        middle = (low + high) // 2
+        if key < sort_key(nodes[middle]):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+class MemoryBackend(GraphBackend):
+    """Relations graph indexed in compact adjacency arrays."""
+
+    process_local = True
+
+    def __init__(self, dump=None):
+        """Initialize an empty graph.
+
+        :param dump: path of a JSON lines dump of records, loaded on first
+            use of the graph.
+        """
+        self.dump = dump
+        self._lock = threading.RLock()
+        self._ids = {}
+        self._keys = []
+        self._columns = {}
+        self._relations = {}
+        self._merging = True
+
+    @classmethod
+    def from_config(cls, config, graph=None):
+        """Create the graph, loaded from ``INSPIRE_RELATIONS_MEMORY_DUMP``."""
+        return cls(dump=config['INSPIRE_RELATIONS_MEMORY_DUMP'])
+
+    def __len__(self):
+        """Return the number of nodes."""
+        self._ensure_loaded()
+        return len(self._keys)
+
+    def load(self, lines, batch_size=1000):
+        """Ingest the records of a JSON lines dump.
+
+        The changes are only merged into the arrays once all the records
+        are written.
+
+        :returns: the statistics of :func:`inspire_relations.ingest.ingest`.
+        """
+        with self._lock:
+            self._merging = False
+            try:
+                stats = ingest(self, iter_dump(lines), batch_size=batch_size)
+            finally:
+                self._merging = True
+            for relations in self._relations.values():
+                relations.merge(len(self._keys), force=True)
+        return stats
+
+    def _ensure_loaded(self):
+        if self.dump is None:
+            return
+        with self._lock:
+            dump, self.dump = self.dump, None
+            if dump is not None:
+                with open(dump) as lines:
+                    self.load(lines)
+
+    def _intern(self, label, key):
+        node = self._ids.get((label, key))
+        if node is None:
+            node = len(self._keys)
+            self._keys.append((label, key))
+            for column in self._columns.values():
+                column.append(None)
+            self._ids[(label, key)] = node
+        return node
+
+    def _sort_key(self, node):
+        return self._keys[node][1]
+
+    def _property(self, node, name):
+        column = self._columns.get(name)
+        return None if column is None else column[node]
+
+    def _properties(self, node):
+        return dict((name, column[node])
+                    for name, column in self._columns.items()
+                    if column[node] is not None)
+
+    def _merge_nodes(self, nodes):
+        for label, rows in nodes.items():
+            for row in rows:
+                node = self._intern(label, row['key'])
+                for name, value in row['properties'].items():
+                    column = self._columns.get(name)
+                    if column is None:
+                        column = self._columns[name] = \
+                            [None] * len(self._keys)
+                    column[node] = value
+
+    def _relations_of(self, type_):
+        relations = self._relations.get(type_)
+        if relations is None:
+            with self._lock:
+                relations = self._relations.get(type_)
+                if relations is None:
+                    relations = self._relations[type_] = Relations(
+                        self._sort_key, self._lock)
+        return relations
+
+    def _merge_relations(self, type_, start, end, rows):
+        relations = self._relations_of(type_)
+        for row in rows:
+            relations.add(self._intern(start, row['start']),
+                          self._intern(end, row['end']), row['properties'])
+        if self._merging:
+            relations.merge(len(self._keys))
+
+    def _remove_relations(self, type_, start, end, rows):
+        relations = self._relations_of(type_)
+        for row in rows:
+            start_node = self._ids.get((start, row['start']))
+            end_node = self._ids.get((end, row['end']))
+            if start_node is not None and end_node is not None:
+                relations.remove(start_node, end_node)
+        if self._merging:
+            relations.merge(len(self._keys))
+
+    def write_batch(self, nodes, relations):
+        """Merge a batch of nodes and relations."""
+        self._ensure_loaded()
+        with self._lock:
+            self._merge_nodes(nodes)
+            for (type_, start, end), rows in relations.items():
+                self._merge_relations(type_, start, end, rows)
+
+    def _stamp(self, changes):
+        """Stamp the nodes of :func:`inspire_relations.sync.counted_nodes`."""
+        nodes, papers = counted_nodes(changes)
+        authors = self._relations_of(WRITTEN_BY)
+        for paper in papers:
+            node = self._ids.get((LITERATURE, paper))
+            if node is not None:
+                nodes[AUTHOR].update(self._keys[author][1] for author
+                                     in authors.neighbours(node, OUT))
+        stamp = int(time.time() * 1000)
+        self._merge_nodes(dict(
+            (label, [{'key': key, 'properties': {UPDATED: stamp}}
+                     for key in keys])
+            for label, keys in nodes.items()))
+
+    def write_changes(self, changes):
+        """Write changes, metrics being computed when read."""
+        if not changes['nodes'] and not changes['added'] and \
+                not changes['removed']:
+            return False
+        self._ensure_loaded()
+        with self._lock:
+            self._merge_nodes(changes['nodes'])
+            for type_, start, end, rows in changes['removed']:
+                self._remove_relations(type_, start, end, rows)
+            for type_, start, end, rows in changes['added']:
+                self._merge_relations(type_, start, end, rows)
+            self._stamp(changes)
+        return True
+
+    def iter_nodes(self, label, properties=()):
+        """Yield the keys and properties of the nodes of a label."""
+        self._ensure_loaded()
+        for node in range(len(self._keys)):
+            if self._keys[node][0] == label:
+                yield self._keys[node][1], dict(
+                    (property_, self._property(node, property_))
+                    for property_ in properties)
+
+    def properties_many(self, label, keys):
+        """Return copies of the properties of the nodes."""
+        self._ensure_loaded()
+        nodes = ((key, self._ids.get((label, key))) for key in keys)
+        return dict((key, self._properties(node))
+                    for key, node in nodes if node is not None)
+
+    def iter_relations(self, type_, start_label, end_label):
+        """Yield the keys of the relations of a type."""
+        self._ensure_loaded()
+        for start, end in self._relations_of(type_).pairs():
+            if self._keys[start][0] == start_label and \
+                    self._keys[end][0] == end_label:
+                yield self._keys[start][1], self._keys[end][1]
+
+    def adjacency(self, type_, direction=OUT):
+        """Return the neighbours of the relations of a type.
+
+        :param direction: :data:`OUT` to read the relations by start node,
+            :data:`IN` by end node.
+        :returns: an object whose ``neighbours(node)`` method returns the
+            neighbours of a node id, sorted by key.
+        """
+        self._ensure_loaded()
+        return _Direction(self._relations_of(type_), direction)
+
+    def neighbours_many(self, type_, start_label, end_label, keys,
+                        reverse=False, limit=None, timeout=None):
+        """Read the neighbours of all nodes from the adjacency index.
+
+        The reads are never aborted, the ``timeout`` is ignored.
+        """
+        self._ensure_loaded()
+        if reverse:
+            label, other, direction = end_label, start_label, IN
+        else:
+            label, other, direction = start_label, end_label, OUT
+        adjacency = self.adjacency(type_, direction)
+        neighbours = {}
+        for key in keys:
+            node = self._ids.get((label, key))
+            if node is None:
+                continue
+            row = tuple(islice(
+                (self._keys[neighbour][1]
+                 for neighbour in adjacency.neighbours(node)
+                 if self._keys[neighbour][0] == other), limit))
+            if row:
+                neighbours[key] = row
+        return neighbours
+
+    def ranked_neighbours(self, type_, start_label, end_label, key, weight,
+                          limit=10):
+        """Sort the neighbours of the node by a property of the relations."""
+        self._ensure_loaded()
+        node = self._ids.get((start_label, key))
+        if node is None:
+            return []
+        relations = self._relations_of(type_)
+        ranked = [
+            (self._keys[neighbour][1], relations.properties(node, neighbour))
+            for neighbour in self.adjacency(type_, OUT).neighbours(node)
+            if self._keys[neighbour][0] == end_label]
+        ranked.sort(key=lambda item: (-item[1].get(weight, 0), item[0]))
+        return ranked[:limit]
+
+    def _neighbours(self, label, key, type_, direction):
+        node = self._ids.get((label, key))
+        if node is None:
+            return []
+        return self.adjacency(type_, direction).neighbours(node)
+
+    def _related(self, name, recid):
+        """Return the node ids answering a lookup, sorted by key."""
+        self._ensure_loaded()
+        if name == 'coauthors':
+            author = self._ids.get((AUTHOR, recid))
+            written_by = self.adjacency(WRITTEN_BY, OUT)
+            coauthors = set()
+            for paper in self._neighbours(AUTHOR, recid, WRITTEN_BY, IN):
+                coauthors.update(written_by.neighbours(paper))
+            coauthors.discard(author)
+            return sorted(coauthors, key=self._sort_key)
+        label, type_, direction = _HOPS[name]
+        return self._neighbours(label, recid, type_, direction)
+
+    def lookup(self, name, recid):
+        """Answer a lookup from the adjacency indexes."""
+        if name == 'citation_count':
+            return len(self._related('citations', recid))
+        return tuple(self._keys[node][1]
+                     for node in self._related(name, recid))
+
+    def page(self, name, recid, after=None, limit=25):
+        """Yield a keyset page, found by bisecting the sorted neighbours."""
+        related = self._related(name, recid)
+        start = 0 if after is None else _bisect_right(
+            related, after, self._sort_key)
+        for node in related[start:start + limit]:
+            yield self._keys[node][1]
+
+    def _citation_counts(self, paper):
+        """Return the citers of a paper and how many are self-citations."""
+        written_by = self.adjacency(WRITTEN_BY, OUT)
+        authors = set(written_by.neighbours(paper))
+        citers = self.adjacency(CITES, IN).neighbours(paper)
+        self_citations = sum(
+            1 for citer in citers
+            if authors.intersection(written_by.neighbours(citer)))
+        return citers, self_citations
+
+    def _filtered_citers(self, label, recid, filters):
+        """Yield the citers of every citation kept by the filters."""
+        if label == AUTHOR:
+            papers = self._neighbours(AUTHOR, recid, WRITTEN_BY, IN)
+        else:
+            paper = self._ids.get((LITERATURE, recid))
+            papers = [] if paper is None else [paper]
+        citations = self.adjacency(CITES, IN)
+        checks = []
+        if 'exclude_self' in filters:
+            checks.append(self.adjacency(WRITTEN_BY, OUT))
+        if 'exclude_collaboration' in filters:
+            checks.append(self.adjacency(IN_COLLABORATION, OUT))
+        refereed_only = 'refereed_only' in filters
+        for paper in papers:
+            for citer in citations.neighbours(paper):
+                if refereed_only and \
+                        not self._property(citer, 'refereed'):
+                    continue
+                if any(set(check.neighbours(paper)).intersection(
+                        check.neighbours(citer)) for check in checks):
+                    continue
+                yield citer
+
+    def filtered_citations(self, label, recid, filters=(), after=None,
+                           limit=25):
+        """Filter the citations with the adjacency indexes."""
+        self._ensure_loaded()
+        citers = sorted(set(self._filtered_citers(label, recid, filters)),
+                        key=self._sort_key)
+        start = 0 if after is None else _bisect_right(
+            citers, after, self._sort_key)
+        return tuple(self._keys[citer][1]
+                     for citer in citers[start:start + limit])
+
+    def filtered_citation_count(self, label, recid, filters=()):
+        """Count the filtered citations with the adjacency indexes."""
+        self._ensure_loaded()
+        return sum(1 for _ in self._filtered_citers(label, recid, filters))
+
+    def monthly_citations_many(self, recids, from_relations=False):
+        """Count the citations per month from the dates of the relations."""
+        self._ensure_loaded()
+        citations = self._relations_of(CITES)
+        monthly = {}
+        for recid in recids:
+            paper = self._ids.get((LITERATURE, recid))
+            if paper is None:
+                continue
+            months = Counter(
+                to_month(citations.properties(citer, paper).get('date'))
+                for citer in self._neighbours(LITERATURE, recid, CITES, IN))
+            months.pop(None, None)
+            if months:
+                monthly[recid] = dict(months)
+        return monthly
+
+    def affiliations_at(self, recid, date):
+        """Filter the affiliations of the author by their period."""
+        self._ensure_loaded()
+        author = self._ids.get((AUTHOR, recid))
+        affiliations = self._relations_of(AFFILIATED_WITH)
+        institutions = []
+        for institution in self._neighbours(
+                AUTHOR, recid, AFFILIATED_WITH, OUT):
+            label, key = self._keys[institution]
+            period = affiliations.properties(author, institution)
+            if label == INSTITUTION and \
+                    period.get('start_date', '') <= date and \
+                    period.get('end_date', date) >= date:
+                institutions.append(key)
+        return tuple(institutions)
+
+    def literature_metrics(self, recid):
+        """Compute the citation metrics of a literature record."""
+        self._ensure_loaded()
+        paper = self._ids.get((LITERATURE, recid))
+        if paper is None:
+            return None
+        citers, self_citations = self._citation_counts(paper)
+        years = Counter(self._property(citer, 'year') for citer in citers)
+        years.pop(None, None)
+        return {
+            'citation_count': len(citers),
+            'citation_count_without_self_citations':
+                len(citers) - self_citations,
+            'citations_per_year': dict(years),
+        }
+
+    def author_metrics(self, recid):
+        """Compute the citation metrics of an author."""
+        self._ensure_loaded()
+        if (AUTHOR, recid) not in self._ids:
+            return None
+        counts = []
+        without_self = 0
+        for paper in self._neighbours(AUTHOR, recid, WRITTEN_BY, IN):
+            citers, self_citations = self._citation_counts(paper)
+            counts.append(len(citers))
+            without_self += len(citers) - self_citations
+        counts.sort(reverse=True)
+        return {
+            'citation_count': sum(counts),
+            'citation_count_without_self_citations': without_self,
+            'h_index': sum(1 for i, count in enumerate(counts) if count > i),
+        }
+
+    def recompute_metrics(self, batch_size=1000):
+        """Do nothing, metrics are always computed when read."""
+        return Counter(literature=0, authors=0)
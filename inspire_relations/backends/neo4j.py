@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Relations graph stored in a Neo4j server."""
+
+from __future__ import absolute_import, print_function
+
+from .. import cypher
+from ..graph import GraphPool
+from ..ingest import write_batch
+from ..metrics import recompute_metrics
+from ..schema import check_schema
+from ..sync import write_changes
+from .base import GraphBackend
+
+
+def _recids(rows):
+    return tuple(row['recid'] for row in rows)
+
+
+def _count(rows):
+    return rows[0]['count'] if rows else 0
+
+
+_LOOKUPS = {
+    'citation_count': (cypher.CITATION_COUNT, _count),
+    'citations': (cypher.CITATIONS, _recids),
+    'references': (cypher.REFERENCES, _recids),
+    'coauthors': (cypher.COAUTHORS, _recids),
+    'author_papers': (cypher.AUTHOR_PAPERS, _recids),
+}
+
+
+def _batch_value(name, value):
+    return value if name == 'citation_count' else tuple(value)
+
+
+class Neo4jBackend(GraphBackend):
+    """Relations graph queried with Cypher through a connection pool."""
+
+    def __init__(self, graph):
+        """Initialize the backend.
+
+        :param graph: the :class:`inspire_relations.graph.GraphPool` to use.
+        """
+        self.graph = graph
+
+    @classmethod
+    def from_config(cls, config, graph=None):
+        """Create the backend, with a pool configured by ``config``."""
+        return cls(graph or GraphPool.from_config(config))
+
+    def check_schema(self):
+        """Check the constraints required by the ingestion are online."""
+        check_schema(self.graph)
+
+    def write_batch(self, nodes, relations):
+        """Merge a batch of nodes and relations in one transaction."""
+        write_batch(self.graph, nodes, relations)
+
+    def write_changes(self, changes):
+        """Write changes in one transaction, maintaining metrics."""
+        return write_changes(self.graph, changes)
+
+    def iter_nodes(self, label, properties=()):
+        """Stream the keys and properties of the nodes of a label."""
+        for row in self.graph.stream(cypher.node_keys(label, properties)):
+            yield row.pop('key'), row
+
+    def properties_many(self, label, keys):
+        """Read the properties of all nodes with a single statement."""
+        rows = self.graph.run(cypher.node_properties(label), keys=list(keys))
+        return dict((row['key'], row['properties']) for row in rows)
+
+    def iter_relations(self, type_, start_label, end_label):
+        """Stream the keys of the relations of a type."""
+        rows = self.graph.stream(
+            cypher.relation_keys(type_, start_label, end_label))
+        for row in rows:
+            yield row['start'], row['end']
+
+    def neighbours_many(self, type_, start_label, end_label, keys,
+                        reverse=False, limit=None, timeout=None):
+        """Collect the neighbours of all nodes with a single statement.
+
+        If ``limit`` is given, the neighbours of the nodes with more
+        relations are read with one more statement each, in the same
+        transaction, so that the server stops expanding their relations at
+        the limit.
+        """
+        if limit is None and timeout is None:
+            rows = self.graph.run(
+                cypher.neighbour_keys(type_, start_label, end_label, reverse),
+                keys=list(keys))
+            return dict((row['key'], tuple(row['neighbours']))
+                        for row in rows)
+        with self.graph.transaction(timeout=timeout) as tx:
+            rows = [dict(record.items()) for record in tx.run(
+                cypher.neighbour_keys(type_, start_label, end_label, reverse,
+                                      limited=limit is not None),
+                {'keys': list(keys), 'limit': limit})]
+            hubs = [row['key'] for row in rows if row['neighbours'] is None]
+            results = [tx.run(
+                cypher.hub_neighbour_keys(type_, start_label, end_label,
+                                          reverse),
+                {'key': key, 'limit': limit}) for key in hubs]
+            neighbours = dict(
+                (key, tuple(record['key'] for record in result))
+                for key, result in zip(hubs, results))
+        neighbours.update((row['key'], tuple(row['neighbours']))
+                          for row in rows if row['neighbours'] is not None)
+        return neighbours
+
+    def ranked_neighbours(self, type_, start_label, end_label, key, weight,
+                          limit=10):
+        """Read the top neighbours of the node with a single statement."""
+        rows = self.graph.run(
+            cypher.ranked_neighbours(type_, start_label, end_label),
+            key=key, weight=weight, limit=limit)
+        return [(row['key'], row['properties']) for row in rows]
+
+    def lookup(self, name, recid):
+        """Answer a lookup with a single statement."""
+        statement, extract = _LOOKUPS[name]
+        return extract(self.graph.run(statement, recid=recid))
+
+    def lookup_many(self, recids):
+        """Answer lookups with one statement each, sent together."""
+        names = sorted(recids)
+        answers = self.graph.run_many(
+            [(cypher.BATCHES[name], {'recids': recids[name]})
+             for name in names]) if names else []
+        return dict(
+            (name, dict((row['recid'], _batch_value(name, row['value']))
+                        for row in rows))
+            for name, rows in zip(names, answers))
+
+    def page(self, name, recid, after=None, limit=25):
+        """Stream a keyset page, the server never skips previous pages."""
+        rows = self.graph.stream(
+            cypher.PAGES[name], recid=recid,
+            after=-1 if after is None else after, limit=limit)
+        for row in rows:
+            yield row['recid']
+
+    def filtered_citations(self, label, recid, filters=(), after=None,
+                           limit=25):
+        """Filter the citations in the graph, with the citation flags."""
+        return _recids(self.graph.run(
+            cypher.filtered_citations(label, filters), recid=recid,
+            after=-1 if after is None else after, limit=limit))
+
+    def filtered_citation_count(self, label, recid, filters=()):
+        """Count the filtered citations in the graph."""
+        return _count(self.graph.run(
+            cypher.filtered_citations(label, filters, count=True),
+            recid=recid))
+
+    def changed_keys(self, label, since):
+        """Read the nodes stamped since a time, using their index."""
+        return sorted(row['key'] for row in self.graph.run(
+            cypher.changed_keys(label), since=since))
+
+    def iter_relation_counts(self, label, batch_size=1000, since=None):
+        """Read the relation counts by keyset pages of nodes."""
+        statement = cypher.relation_counts(label, changed=since is not None)
+        after = -1
+        while True:
+            rows = self.graph.run(statement, after=after, limit=batch_size,
+                                  since=since)
+            for row in rows:
+                row = dict(row)
+                yield row.pop('recid'), row
+            if len(rows) < batch_size:
+                return
+            after = rows[-1]['recid']
+
+    def monthly_citations_many(self, recids, from_relations=False):
+        """Read the citations per month materialized on the nodes."""
+        statement = cypher.COUNT_MONTHLY_CITATIONS if from_relations else \
+            cypher.MONTHLY_CITATIONS
+        rows = self.graph.run(statement, recids=list(recids))
+        monthly = {}
+        for row in rows:
+            months = dict(
+                (month, count) for month, count in zip(
+                    row['months'] or [], row['counts'] or []) if count)
+            if months:
+                monthly[row['recid']] = months
+        return monthly
+
+    def rising_papers(self, since, limit=25, batch_size=1000):
+        """Sum the recent citations of the recently cited papers."""
+        rows = self.graph.run(cypher.RISING_PAPERS, since=since, limit=limit)
+        return [(row['recid'], row['citations']) for row in rows]
+
+    def affiliations_at(self, recid, date):
+        """Filter the affiliations of the author by their period."""
+        return _recids(self.graph.run(
+            cypher.AFFILIATIONS_AT, recid=recid, date=date))
+
+    def literature_metrics(self, recid):
+        """Read the metrics materialized on a literature node."""
+        rows = self.graph.run(cypher.LITERATURE_METRICS, recid=recid)
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            'citation_count': row['citation_count'] or 0,
+            'citation_count_without_self_citations':
+                row['citation_count_without_self_citations'] or 0,
+            'citations_per_year': dict(
+                (year, count) for year, count in zip(
+                    row['citation_years'] or [],
+                    row['citations_per_year'] or []) if count),
+        }
+
+    def author_metrics(self, recid):
+        """Read the metrics materialized on an author node."""
+        rows = self.graph.run(cypher.AUTHOR_METRICS, recid=recid)
+        if not rows:
+            return None
+        return dict((key, value or 0) for key, value in rows[0].items())
+
+    def recompute_metrics(self, batch_size=1000):
+        """Recompute the metrics materialized on the nodes."""
+        return recompute_metrics(self.graph, batch_size=batch_size)
+
+    def close(self):
+        """Close the connections of the pool."""
+        self.graph.close()
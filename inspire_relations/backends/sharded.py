@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Relations graph partitioned across several backends.
+
+Every node belongs to one shard, chosen by consistent hashing of its key,
+see :class:`HashRing`, so that adding a shard only moves a fraction of the
+nodes. The nodes of a record, with their properties, are written to their
+shard only.
+
+A relation is written to the shards of both its ends. When they differ,
+each shard holds a ghost of the other end, a node with its key only. The
+relations of a node are then all on its shard, and one-hop lookups are
+answered by a single shard. Reads needing more than one hop, such as the
+co-authors of an author, the filtered citations and the citation metrics,
+are scattered to the shards owning the nodes of each hop, and their results
+gathered and merged. Citation metrics, including the citations per month,
+are therefore always computed when read, as in the memory backend, rather
+than read from counters of the shards that bulk writes do not maintain.
+
+Writes to several shards are not atomic, but they can be retried, as any
+write of a :class:`GraphBackend`.
+"""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import os
+import struct
+import threading
+from bisect import bisect
+from collections import Counter, defaultdict
+from multiprocessing.pool import ThreadPool
+
+from ..graph import GraphPool
+from ..records import AUTHOR, CITES, COLLABORATION, IN_COLLABORATION, \
+    LITERATURE, WRITTEN_BY
+from . import load_backend
+from .base import GraphBackend
+
+_LOOKUP_LABELS = {
+    'author_papers': AUTHOR,
+    'citation_count': LITERATURE,
+    'citations': LITERATURE,
+    'coauthors': AUTHOR,
+    'references': LITERATURE,
+}
+
+
+def _hash(value):
+    """Return a hash of a string, stable across processes and versions."""
+    digest = hashlib.md5(value.encode('utf-8')).digest()
+    return struct.unpack('>Q', digest[:8])[0]
+
+
+class HashRing(object):
+    """Consistent hashing of node keys to shards.
+
+    Every shard owns ``replicas`` points of a ring of hashes, and a key
+    belongs to the shard of the first point following its hash.
+    """
+
+    def __init__(self, shards, replicas=100):
+        """Place ``shards`` shards, numbered from zero, on the ring."""
+        points = sorted(
+            (_hash('{0}-{1}'.format(shard, replica)), shard)
+            for shard in range(shards) for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard(self, key):
+        """Return the shard owning a node key."""
+        position = bisect(self._hashes, _hash(str(key)))
+        return self._shards[position % len(self._shards)]
+
+
+class ShardedBackend(GraphBackend):
+    """Relations graph partitioned across backends by node key."""
+
+    def __init__(self, shards, replicas=100):
+        """Initialize the backend.
+
+        :param shards: the :class:`GraphBackend` of every shard. The order
+            matters, as it numbers the shards on the ring.
+        """
+        self.shards = list(shards)
+        self.ring = HashRing(len(self.shards), replicas=replicas)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, graph=None):
+        """Create a backend for every entry of ``INSPIRE_RELATIONS_SHARDS``.
+
+        Each entry overrides the application configuration for its shard,
+        e.g. with its own ``INSPIRE_RELATIONS_GRAPH_URI``. The shards share
+        the query profiler of ``graph``.
+        """
+        shards = []
+        for overrides in config['INSPIRE_RELATIONS_SHARDS'] or ():
+            shard_config = dict(config)
+            shard_config.update(overrides)
+            if shard_config['INSPIRE_RELATIONS_BACKEND'] == 'sharded':
+                shard_config['INSPIRE_RELATIONS_BACKEND'] = 'neo4j'
+            shard_graph = GraphPool.from_config(shard_config)
+            shard_graph.profiler = getattr(graph, 'profiler', None)
+            shards.append(load_backend(shard_config, shard_graph))
+        if not shards:
+            raise ValueError('No shards configured.')
+        return cls(shards,
+                   replicas=config['INSPIRE_RELATIONS_SHARD_REPLICAS'])
+
+    def __getstate__(self):
+        """Pickle the shards only, threads are never shared."""
+        state = self.__dict__.copy()
+        state.update(_pool=None, _pool_pid=None)
+        del state['_pool_lock']
+        return state
+
+    def __setstate__(self, state):
+        """Restore the shards, with threads of their own."""
+        self.__dict__.update(state)
+        self._pool_lock = threading.Lock()
+
+    @property
+    def process_local(self):
+        """Whether any shard lives in the memory of the process."""
+        return any(shard.process_local for shard in self.shards)
+
+    def owner(self, key):
+        """Return the index of the shard owning a node key."""
+        return self.ring.shard(key)
+
+    def _call(self, call):
+        shard, method, args = call
+        return getattr(self.shards[shard], method)(*args)
+
+    def _scatter(self, calls):
+        """Run ``(shard, method name, args)`` calls, in parallel if several.
+
+        :returns: the results, in the order of the calls.
+        """
+        calls = list(calls)
+        if len(calls) <= 1:
+            return [self._call(call) for call in calls]
+        pid = os.getpid()
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != pid:
+                # The threads of a pool inherited through ``fork`` did not
+                # survive it, so the pool is forgotten, like the drivers of
+                # :class:`inspire_relations.graph.GraphPool`.
+                self._pool = ThreadPool(len(self.shards))
+                self._pool_pid = pid
+            pool = self._pool
+        return pool.map(self._call, calls)
+
+    def _by_owner(self, keys):
+        groups = defaultdict(list)
+        for key in keys:
+            groups[self.owner(key)].append(key)
+        return groups
+
+    def check_schema(self):
+        """Check the schema of every shard."""
+        for shard in self.shards:
+            shard.check_schema()
+
+    def _split_rows(self, rows, shards):
+        """Add relation rows to the rows of the shards of both their ends."""
+        for row in rows:
+            for shard in {self.owner(row['start']), self.owner(row['end'])}:
+                shards[shard].append(row)
+
+    def _split_nodes(self, nodes):
+        split = defaultdict(dict)
+        for label, rows in nodes.items():
+            for row in rows:
+                split[self.owner(row['key'])].setdefault(
+                    label, []).append(row)
+        return split
+
+    def _split_groups(self, groups):
+        split = defaultdict(list)
+        for type_, start, end, rows in groups:
+            shards = defaultdict(list)
+            self._split_rows(rows, shards)
+            for shard, shard_rows in shards.items():
+                split[shard].append([type_, start, end, shard_rows])
+        return split
+
+    def write_batch(self, nodes, relations):
+        """Write the nodes to their shard and the relations to both ends'."""
+        split_nodes = self._split_nodes(nodes)
+        split_relations = defaultdict(dict)
+        for (type_, start, end), rows in relations.items():
+            shards = defaultdict(list)
+            self._split_rows(rows, shards)
+            for shard, shard_rows in shards.items():
+                split_relations[shard][(type_, start, end)] = shard_rows
+        self._scatter(
+            (shard, 'write_batch',
+             (split_nodes.get(shard, {}), split_relations.get(shard, {})))
+            for shard in sorted(set(split_nodes) | set(split_relations)))
+
+    def write_changes(self, changes):
+        """Split changes by shard, relations going to both ends' shards."""
+        nodes = self._split_nodes(changes['nodes'])
+        removed = self._split_groups(changes['removed'])
+        added = self._split_groups(changes['added'])
+        shards = sorted(set(nodes) | set(removed) | set(added))
+        return any(self._scatter(
+            (shard, 'write_changes', ({
+                'nodes': nodes.get(shard, {}),
+                'removed': removed.get(shard, []),
+                'added': added.get(shard, []),
+            },)) for shard in shards))
+
+    def changed_keys(self, label, since):
+        """Gather the nodes stamped on any shard, ghosts included.
+
+        Changes are only written to the shards of the ends of their
+        relations, so a node may only be stamped as a ghost, e.g. a coauthor
+        on the shard of a paper.
+        """
+        return sorted(set().union(*self._scatter(
+            (shard, 'changed_keys', (label, since))
+            for shard in range(len(self.shards)))))
+
+    def iter_nodes(self, label, properties=()):
+        """Yield the nodes of every shard, without their ghosts."""
+        for index, shard in enumerate(self.shards):
+            for key, values in shard.iter_nodes(label, properties):
+                if self.owner(key) == index:
+                    yield key, values
+
+    def properties_many(self, label, keys):
+        """Gather the properties of the nodes from their shards."""
+        groups = self._by_owner(keys)
+        properties = {}
+        for result in self._scatter(
+                (shard, 'properties_many', (label, shard_keys))
+                for shard, shard_keys in groups.items()):
+            properties.update(result)
+        return properties
+
+    def iter_relations(self, type_, start_label, end_label):
+        """Yield the relations of every shard, once from their start's."""
+        for index, shard in enumerate(self.shards):
+            for start, end in shard.iter_relations(
+                    type_, start_label, end_label):
+                if self.owner(start) == index:
+                    yield start, end
+
+    def neighbours_many(self, type_, start_label, end_label, keys,
+                        reverse=False, limit=None, timeout=None):
+        """Gather the neighbours of the nodes from their shards."""
+        groups = self._by_owner(keys)
+        neighbours = {}
+        for result in self._scatter(
+                (shard, 'neighbours_many',
+                 (type_, start_label, end_label, shard_keys, reverse, limit,
+                  timeout))
+                for shard, shard_keys in groups.items()):
+            neighbours.update(result)
+        return neighbours
+
+    def ranked_neighbours(self, type_, start_label, end_label, key, weight,
+                          limit=10):
+        """Read the top neighbours of the node from its shard."""
+        return self.shards[self.owner(key)].ranked_neighbours(
+            type_, start_label, end_label, key, weight, limit=limit)
+
+    def monthly_citations_many(self, recids, from_relations=True):
+        """Count the citations per month on the shards of the papers.
+
+        They are always counted from the dates of the citations, which are
+        all on the shard of the cited paper.
+        """
+        monthly = {}
+        for result in self._scatter(
+                (shard, 'monthly_citations_many', (keys, True))
+                for shard, keys in self._by_owner(recids).items()):
+            monthly.update(result)
+        return monthly
+
+    def affiliations_at(self, recid, date):
+        """Read the affiliations from the shard of the author."""
+        return self.shards[self.owner(recid)].affiliations_at(recid, date)
+
+    def _coauthors_many(self, recids):
+        """Return the co-authors of authors, through their papers."""
+        papers = self.neighbours_many(WRITTEN_BY, LITERATURE, AUTHOR,
+                                      recids, reverse=True)
+        authors = self.neighbours_many(
+            WRITTEN_BY, LITERATURE, AUTHOR,
+            set(paper for keys in papers.values() for paper in keys))
+        coauthors = {}
+        for recid in recids:
+            found = set()
+            for paper in papers.get(recid, ()):
+                found.update(authors.get(paper, ()))
+            found.discard(recid)
+            coauthors[recid] = tuple(sorted(found))
+        return coauthors
+
+    def lookup(self, name, recid):
+        """Answer a lookup from the shard of the record."""
+        if name == 'coauthors':
+            return self._coauthors_many([recid])[recid]
+        return self.shards[self.owner(recid)].lookup(name, recid)
+
+    def lookup_many(self, recids):
+        """Answer the lookups of every shard at once."""
+        answers = dict((name, {}) for name in recids)
+        groups = defaultdict(dict)
+        for name, ids in recids.items():
+            if name == 'coauthors':
+                answers[name] = self._coauthors_many(ids)
+                continue
+            for shard, shard_ids in self._by_owner(ids).items():
+                groups[shard][name] = shard_ids
+        for result in self._scatter(
+                (shard, 'lookup_many', (shard_recids,))
+                for shard, shard_recids in groups.items()):
+            for name, values in result.items():
+                answers[name].update(values)
+        return answers
+
+    def page(self, name, recid, after=None, limit=25):
+        """Yield a keyset page from the shard of the record."""
+        if name == 'coauthors':
+            coauthors = self.lookup(name, recid)
+            page = [key for key in coauthors if after is None or key > after]
+            return iter(page[:limit])
+        return self.shards[self.owner(recid)].page(
+            name, recid, after=after, limit=limit)
+
+    def _papers(self, label, recid):
+        if label == AUTHOR:
+            return self.lookup('author_papers', recid)
+        return (recid,)
+
+    def _citation_pairs(self, papers, filters=()):
+        """Return the ``(paper, citer)`` citations kept by the filters."""
+        citers = self.neighbours_many(CITES, LITERATURE, LITERATURE, papers,
+                                      reverse=True)
+        pairs = [(paper, citer) for paper in papers
+                 for citer in citers.get(paper, ())]
+        keys = set(papers) | set(citer for _, citer in pairs)
+        checks = []
+        if 'exclude_self' in filters:
+            checks.append(self.neighbours_many(
+                WRITTEN_BY, LITERATURE, AUTHOR, keys))
+        if 'exclude_collaboration' in filters:
+            checks.append(self.neighbours_many(
+                IN_COLLABORATION, LITERATURE, COLLABORATION, keys))
+        if 'refereed_only' in filters:
+            properties = self.properties_many(
+                LITERATURE, set(citer for _, citer in pairs))
+            pairs = [(paper, citer) for paper, citer in pairs
+                     if properties.get(citer, {}).get('refereed')]
+        return [
+            (paper, citer) for paper, citer in pairs
+            if not any(set(check.get(paper, ())).intersection(
+                check.get(citer, ())) for check in checks)]
+
+    def filtered_citations(self, label, recid, filters=(), after=None,
+                           limit=25):
+        """Filter the citations gathered from the shards."""
+        citers = sorted(set(
+            citer for _, citer in self._citation_pairs(
+                self._papers(label, recid), filters)))
+        if after is not None:
+            citers = [citer for citer in citers if citer > after]
+        return tuple(citers[:limit])
+
+    def filtered_citation_count(self, label, recid, filters=()):
+        """Count the filtered citations gathered from the shards."""
+        return len(self._citation_pairs(self._papers(label, recid), filters))
+
+    def _citation_counts(self, papers):
+        """Return the citations and self-citations of papers."""
+        counts = Counter((paper, 'all') for paper, _ in
+                         self._citation_pairs(papers))
+        for paper, _ in self._citation_pairs(papers, ('exclude_self',)):
+            counts[(paper, 'without_self')] += 1
+        return counts
+
+    def literature_metrics(self, recid):
+        """Compute the citation metrics from the shards."""
+        if not self.properties_many(LITERATURE, [recid]):
+            return None
+        citers = [citer for _, citer in self._citation_pairs([recid])]
+        without_self = self._citation_pairs([recid], ('exclude_self',))
+        years = Counter(
+            properties.get('year') for properties in
+            self.properties_many(LITERATURE, citers).values())
+        years.pop(None, None)
+        return {
+            'citation_count': len(citers),
+            'citation_count_without_self_citations': len(without_self),
+            'citations_per_year': dict(years),
+        }
+
+    def author_metrics(self, recid):
+        """Compute the citation metrics from the shards."""
+        if not self.properties_many(AUTHOR, [recid]):
+            return None
+        papers = self.lookup('author_papers', recid)
+        counts = self._citation_counts(papers)
+        citations = sorted((counts[(paper, 'all')] for paper in papers),
+                           reverse=True)
+        return {
+            'citation_count': sum(citations),
+            'citation_count_without_self_citations': sum(
+                counts[(paper, 'without_self')] for paper in papers),
+            'h_index': sum(
+                1 for i, count in enumerate(citations) if count > i),
+        }
+
+    def recompute_metrics(self, batch_size=1000):
+        """Do nothing, metrics are always computed when read."""
+        return Counter(literature=0, authors=0)
+
+    def close(self):
+        """Close every shard and the scatter threads."""
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.close()
+            self._pool = None
+        for shard in self.shards:
+            shard.close()
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""In-process caching of relation lookups.
+
+Besides the :class:`TTLCache` itself, which can be put in front of a cache
+shared by all the processes with a :class:`TieredCache`, concurrent misses
+of the same lookup are coalesced by a :class:`SingleFlight`, and the most
+requested lookups are counted by an :class:`AccessLog` persisted across
+restarts, so that a new process can warm its cache before serving requests.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+"""Returned by :meth:`TTLCache.get` for keys that are not cached."""
+
+
+class TTLCache(object):
+    """Thread-safe, bounded LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize=10000, ttl=300, timer=time.time):
+        """Initialize an empty cache."""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.stats = Counter()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of entries, including expired ones."""
+        return len(self._data)
+
+    def get(self, key):
+        """Return the value of a key, or :data:`MISSING`."""
+        with self._lock:
+            item = self._data.get(key, MISSING)
+            if item is not MISSING:
+                value, expires = item
+                if expires > self.timer():
+                    self._data[key] = self._data.pop(key)
+                    self.stats['hits'] += 1
+                    return value
+                del self._data[key]
+            self.stats['misses'] += 1
+            return MISSING
+
+    def get_many(self, keys):
+        """Return a dictionary of the values of the cached keys."""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not MISSING:
+                values[key] = value
+        return values
+
+    def set(self, key, value):
+        """Cache a value, evicting the least recently used entries."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, self.timer() + self.ttl)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def set_many(self, items):
+        """Cache the values of ``(key, value)`` items."""
+        for key, value in items:
+            self.set(key, value)
+
+    def delete_many(self, keys):
+        """Remove keys from the cache."""
+        with self._lock:
+            for key in keys:
+                if self._data.pop(key, MISSING) is not MISSING:
+                    self.stats['invalidations'] += 1
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def hit_rate(self):
+        """Return the ratio of lookups answered from the cache."""
+        lookups = self.stats['hits'] + self.stats['misses']
+        return float(self.stats['hits']) / lookups if lookups else 0.0
+
+
+class TieredCache(object):
+    """A process cache in front of a cache shared by all the processes.
+
+    Values found in the shared cache, e.g. a
+    :class:`inspire_relations.shared_cache.RedisCache`, are copied to the
+    process cache. Values are written to and invalidated in both.
+    """
+
+    def __init__(self, local, shared):
+        """Initialize the tiers.
+
+        :param local: the :class:`TTLCache` of the process.
+        :param shared: the cache shared by the processes.
+        """
+        self.local = local
+        self.shared = shared
+
+    def __len__(self):
+        """Return the number of entries of the process cache."""
+        return len(self.local)
+
+    @property
+    def stats(self):
+        """Return the statistics of the process cache and the shared one.
+
+        Those of the shared cache are prefixed by ``shared_``.
+        """
+        stats = Counter(self.local.stats)
+        stats.update(dict(('shared_' + name, count)
+                          for name, count in self.shared.stats.items()))
+        return stats
+
+    def get(self, key):
+        """Return the value of a key, or :data:`MISSING`."""
+        value = self.local.get(key)
+        if value is MISSING:
+            value = self.shared.get(key)
+            if value is not MISSING:
+                self.local.set(key, value)
+        return value
+
+    def get_many(self, keys):
+        """Return a dictionary of the values of the cached keys.
+
+        The keys missing from the process cache are read from the shared
+        cache at once.
+        """
+        keys = list(keys)
+        values = self.local.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            shared = self.shared.get_many(missing)
+            self.local.set_many(shared.items())
+            values.update(shared)
+        return values
+
+    def set(self, key, value):
+        """Cache a value in both tiers."""
+        self.local.set(key, value)
+        self.shared.set(key, value)
+
+    def set_many(self, items):
+        """Cache the values of ``(key, value)`` items in both tiers."""
+        items = list(items)
+        self.local.set_many(items)
+        self.shared.set_many(items)
+
+    def delete_many(self, keys):
+        """Remove keys from both tiers."""
+        keys = list(keys)
+        self.local.delete_many(keys)
+        self.shared.delete_many(keys)
+
+    def clear(self):
+        """Remove all entries of both tiers."""
+        self.local.clear()
+        self.shared.clear()
+
+    def hit_rate(self):
+        """Return the ratio of lookups answered from either tier."""
+        stats = self.stats
+        lookups = stats['hits'] + stats['misses']
+        hits = stats['hits'] + stats['shared_hits']
+        return float(hits) / lookups if lookups else 0.0
+
+
+class _Call(object):
+    """A call in flight, and its outcome once done."""
+
+    def __init__(self):
+        """Initialize a call not done yet."""
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Coalesce the concurrent calls made for the same key.
+
+    The first caller of a key runs the function while the others wait for
+    it, and all get its result or its exception. Calls made once it is
+    done run the function again, they are expected to find the result in a
+    cache by then.
+    """
+
+    def __init__(self):
+        """Initialize without calls in flight."""
+        self.stats = Counter()
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Return ``function()``, shared with the concurrent calls of key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.stats['coalesced'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        try:
+            call.value = function()
+            return call.value
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AccessLog(object):
+    """Counts of the requested lookups, persisted in a JSON file.
+
+    The counts are merged into the file every ``flush_interval`` seconds
+    and by :meth:`flush`, so that the processes sharing the file add up
+    their counts. Only the ``size`` most requested keys are kept.
+    """
+
+    def __init__(self, path, size=10000, flush_interval=300,
+                 timer=time.time):
+        """Initialize a log without counts."""
+        self.path = path
+        self.size = size
+        self.flush_interval = flush_interval
+        self.timer = timer
+        self._counts = Counter()
+        self._flushed = timer()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a log at ``INSPIRE_RELATIONS_ACCESS_LOG``, if set."""
+        path = config['INSPIRE_RELATIONS_ACCESS_LOG']
+        if not path:
+            return None
+        return cls(
+            path, size=config['INSPIRE_RELATIONS_ACCESS_LOG_SIZE'],
+            flush_interval=config[
+                'INSPIRE_RELATIONS_ACCESS_LOG_FLUSH_INTERVAL'])
+
+    def record(self, keys):
+        """Count requests of ``(name, recid)`` keys."""
+        with self._lock:
+            self._counts.update(keys)
+            flush = self.timer() - self._flushed >= self.flush_interval
+        if flush:
+            self.flush()
+
+    def read(self):
+        """Return the persisted counts by key."""
+        try:
+            with open(self.path) as fileobj:
+                rows = json.load(fileobj)
+        except (IOError, OSError, ValueError):
+            return Counter()
+        return Counter(dict(((name, recid), count)
+                            for name, recid, count in rows))
+
+    def top(self, limit):
+        """Return the ``limit`` most requested persisted keys."""
+        return [key for key, _ in self.read().most_common(limit)]
+
+    def flush(self):
+        """Merge the counts into the file, and reset them.
+
+        The file is written next to ``path`` and renamed over it, so that
+        readers never see a partial file. Concurrent flushes of several
+        processes may lose the counts of one of them.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed = self.timer()
+        if not counts:
+            return
+        counts.update(self.read())
+        rows = [[name, recid, count] for (name, recid), count
+                in counts.most_common(self.size)]
+        temporary = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        try:
+            with open(temporary, 'w') as fileobj:
+                json.dump(rows, fileobj)
+            os.rename(temporary, self.path)
+        except (IOError, OSError):
+            logger.exception('Can not write the access log %s.', self.path)
+            if os.path.exists(temporary):
+                os.remove(temporary)
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Command line interface for Inspire-Relations."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .admin_import import generate_import_files
+from .backends.neo4j import Neo4jBackend
+from .backends.sharded import ShardedBackend
+from .enrichment import bulk_body
+from .ingest import iter_dump
+from .schema import SchemaError, create_schema, get_schema_report, \
+    get_schema_version, migrate
+
+
+@click.group()
+def relations():
+    """Inspire-Relations commands."""
+
+
+@relations.command()
+@click.argument('dump', type=click.File('r'))
+@click.option('--batch-size', type=int, default=None,
+              help='Number of records written per transaction.')
+@click.option('--metrics/--no-metrics', default=True, show_default=True,
+              help='Recompute the citation metrics once loaded.')
+@click.option('--resolve/--no-resolve', default=None,
+              help='Link the references without record by their '
+                   'identifiers, defaults to the configuration.')
+@with_appcontext
+def reload(dump, batch_size, metrics, resolve):
+    """Load the relations of the records in a JSON lines DUMP."""
+    ext = current_app.extensions['inspire-relations']
+    try:
+        stats = ext.ingest(iter_dump(dump), batch_size=batch_size,
+                           resolve=resolve)
+    except SchemaError as exc:
+        raise click.ClickException(str(exc))
+    click.secho(
+        'Loaded {records} records: {nodes} nodes and {relations} relations '
+        'in {batches} batches.'.format(**stats),
+        fg='green')
+    if 'resolved' in stats:
+        click.secho('Resolved {resolved} references.'.format(**stats),
+                    fg='green')
+    if metrics:
+        _recompute_metrics(ext)
+
+
+def _recompute_metrics(ext):
+    stats = ext.recompute_metrics()
+    click.secho(
+        'Recomputed the metrics of {literature} literature records and '
+        '{authors} authors.'.format(**stats),
+        fg='green')
+
+
+@relations.command('recompute-metrics')
+@with_appcontext
+def recompute_metrics():
+    """Recompute the citation metrics materialized on the graph."""
+    _recompute_metrics(current_app.extensions['inspire-relations'])
+
+
+@relations.command()
+@click.option('--batch-size', type=int, default=None,
+              help='Number of nodes written per transaction.')
+@with_appcontext
+def rank(batch_size):
+    """Compute the PageRank and CiteRank of the literature."""
+    stats = current_app.extensions['inspire-relations'].compute_rankings(
+        batch_size=batch_size)
+    click.secho(
+        'Ranked {literature} literature records in {pagerank_iterations} '
+        'PageRank and {citerank_iterations} CiteRank iterations.'.format(
+            **stats),
+        fg='green')
+
+
+@relations.command()
+@click.option('--full', is_flag=True, default=False,
+              help='Recompute the similar papers of all the literature.')
+@click.option('--batch-size', type=int, default=None,
+              help='Number of nodes written per transaction.')
+@with_appcontext
+def similar(full, batch_size):
+    """Compute the similar papers of the literature, by co-citation."""
+    stats = current_app.extensions['inspire-relations'].compute_similar(
+        full=full, batch_size=batch_size)
+    click.secho(
+        'Computed the similar papers of {literature} literature records: '
+        '{similar} relations.'.format(**stats),
+        fg='green')
+
+
+@relations.command('candidate-features')
+@click.argument('blocks', type=click.File('r'))
+@click.argument('output', type=click.File('w'))
+@with_appcontext
+def candidate_features(blocks, output):
+    """Write the relation features of the candidates of signature BLOCKS.
+
+    BLOCKS is a JSON lines file of ``{"block": ..., "signatures": [[id,
+    paper recid], ...]}`` objects. A JSON line is written to OUTPUT for
+    every signature.
+    """
+    ext = current_app.extensions['inspire-relations']
+    blocks = ((block['block'], block['signatures'])
+              for block in iter_dump(blocks))
+    for block, signature, candidates in ext.candidate_features(blocks):
+        output.write(json.dumps({
+            'block': block,
+            'signature': signature,
+            'candidates': dict(
+                (candidate, features._asdict())
+                for candidate, features in candidates.items()),
+        }, sort_keys=True) + '\n')
+
+
+@relations.command('export-snapshot')
+@click.argument('path', type=click.Path(dir_okay=False), required=False)
+@with_appcontext
+def export_snapshot(path):
+    """Publish a citation snapshot to PATH.
+
+    PATH defaults to INSPIRE_RELATIONS_SNAPSHOT.
+    """
+    ext = current_app.extensions['inspire-relations']
+    try:
+        version = ext.export_snapshot(path)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+    click.secho('Published snapshot version {0}.'.format(version),
+                fg='green')
+
+
+@relations.command('warm-cache')
+@click.option('--limit', type=int, default=None,
+              help='Number of lookups cached, defaults to '
+                   'INSPIRE_RELATIONS_WARM_START.')
+@with_appcontext
+def warm_cache(limit):
+    """Cache the lookups most requested according to the access log."""
+    ext = current_app.extensions['inspire-relations']
+    try:
+        cached = ext.warm_cache(limit)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+    click.secho('Cached {0} lookups.'.format(cached), fg='green')
+
+
+@relations.command()
+@click.option('--output', type=click.File('w'), default=None,
+              help='Write the bulk requests to a file instead of sending '
+              'them with INSPIRE_RELATIONS_ENRICHMENT_SENDER.')
+@click.option('--full', is_flag=True,
+              help='Update every record, not only the changed ones, '
+              'e.g. after a reload of the graph.')
+@with_appcontext
+def enrich(output, full):
+    """Update the relation counts embedded in the search index."""
+    ext = current_app.extensions['inspire-relations']
+    send = (lambda actions: output.write(bulk_body(actions))) \
+        if output else None
+    try:
+        stats = ext.export_enrichment(send=send, full=full)
+    except ValueError as exc:
+        raise click.UsageError(str(exc))
+    click.secho(
+        'Updated {literature} literature records and {authors} authors, '
+        '{unresolved} without document.'.format(
+            **stats),
+        fg='green')
+
+
+@relations.group()
+def schema():
+    """Graph schema commands."""
+
+
+def _schema_graphs():
+    """Return the Neo4j graphs holding a schema, with their output prefix.
+
+    A sharded backend has one graph per Neo4j shard.
+    """
+    ext = current_app.extensions['inspire-relations']
+    if not isinstance(ext.backend, ShardedBackend):
+        return [('', ext.graph)]
+    return [('Shard {0}: '.format(index), shard.graph)
+            for index, shard in enumerate(ext.backend.shards)
+            if isinstance(shard, Neo4jBackend)]
+
+
+@schema.command()
+@with_appcontext
+def status():
+    """Show the schema version and the state of constraints and indexes."""
+    for prefix, graph in _schema_graphs():
+        click.echo('{0}Schema version: {1}'.format(
+            prefix, get_schema_version(graph)))
+        for definition, state in get_schema_report(graph):
+            click.echo('{0}{1} {2}.{3}: {4}'.format(
+                prefix, type(definition).__name__, definition.label,
+                definition.property, state or 'MISSING'))
+
+
+@schema.command()
+@with_appcontext
+def create():
+    """Create the missing constraints and indexes."""
+    for prefix, graph in _schema_graphs():
+        for definition in create_schema(graph):
+            click.echo('{0}Created {1} {2}.{3}'.format(
+                prefix, type(definition).__name__, *definition))
+
+
+@schema.command('migrate')
+@with_appcontext
+def migrate_schema():
+    """Apply the pending migrations."""
+    for prefix, graph in _schema_graphs():
+        for migration in migrate(graph):
+            click.echo('{0}Applied migration {1}: {2}'.format(
+                prefix, migration.version, migration.description))
+        click.secho('{0}Schema version: {1}'.format(
+            prefix, get_schema_version(graph)), fg='green')
+
+
+@click.command()
+@click.argument('dump', type=click.File('r'))
+@click.argument('output', type=click.Path(file_okay=False))
+@click.option('--shards', type=int, default=8, show_default=True,
+              help='Number of data files per label and relation type.')
+@click.option('--processes', type=int, default=None,
+              help='Number of worker processes, defaults to the CPU count.')
+def import_files(dump, output, shards, processes):
+    """Write neo4j-admin import files for the records in a JSON lines DUMP.
+
+    The files are written to the OUTPUT directory, and the arguments to pass
+    to ``neo4j-admin import`` are printed.
+    """
+    arguments = generate_import_files(
+        iter_dump(dump), output, shards=shards, processes=processes)
+    click.echo('neo4j-admin import {0}'.format(' '.join(arguments)))
+
+
+relations.add_command(import_files, name='import-files')
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Default configuration for Inspire-Relations."""
+
+from __future__ import absolute_import, print_function
+
+INSPIRE_RELATIONS_BACKEND = 'neo4j'
+"""Storage engine of the relations graph.
+
+Either ``'neo4j'``, ``'memory'`` for a graph held in the memory of each
+process, ``'sharded'`` for a graph partitioned across the
+``INSPIRE_RELATIONS_SHARDS``, or the import path of a
+:class:`inspire_relations.backends.GraphBackend` class. The memory backend
+can not be shared with write-behind worker processes.
+"""
+
+INSPIRE_RELATIONS_SHARDS = None
+"""Configuration of the shards of the ``'sharded'`` backend.
+
+A list with a dictionary per shard, overriding the application configuration
+for that shard, e.g. ``[{'INSPIRE_RELATIONS_GRAPH_URI': 'bolt://graph1'},
+{'INSPIRE_RELATIONS_GRAPH_URI': 'bolt://graph2'}]``. The shards use Neo4j
+unless they set their own ``INSPIRE_RELATIONS_BACKEND``. Records are placed
+by consistent hashing, so the order of the shards must not change, and new
+shards are appended.
+
+See :mod:`inspire_relations.backends.sharded`.
+"""
+
+INSPIRE_RELATIONS_SHARD_REPLICAS = 100
+"""Number of points of each shard on the consistent hashing ring."""
+
+INSPIRE_RELATIONS_MEMORY_DUMP = None
+"""JSON lines dump of records loaded by the memory backend on first use."""
+
+INSPIRE_RELATIONS_SNAPSHOT = None
+"""Path of the citation snapshot answering the citation lookups, if any.
+
+See :mod:`inspire_relations.snapshot`. The snapshot is only as recent as its
+last export, record changes are not reflected until the next one.
+"""
+
+INSPIRE_RELATIONS_SNAPSHOT_CHECK_INTERVAL = 10.0
+"""Seconds between checks for a newly published citation snapshot."""
+
+INSPIRE_RELATIONS_ENRICHMENT_STATE = None
+"""Path of the state of the exports of relation counts to the search index.
+
+See :mod:`inspire_relations.enrichment`. Without a state, every export sends
+the counts of all records.
+"""
+
+INSPIRE_RELATIONS_ENRICHMENT_INDEXES = {
+    'Literature': 'records-hep',
+    'Author': 'records-authors',
+}
+"""Search index of the documents enriched with relation counts, by label."""
+
+INSPIRE_RELATIONS_ENRICHMENT_DOC_TYPES = {
+    'Literature': 'hep',
+    'Author': 'authors',
+}
+"""Document type of the enriched documents, by label."""
+
+INSPIRE_RELATIONS_ENRICHMENT_SENDER = None
+"""Callable, or import path of one, sending a list of bulk actions.
+
+For instance a function passing them to :func:`elasticsearch.helpers.bulk`.
+"""
+
+INSPIRE_RELATIONS_ENRICHMENT_ID_RESOLVER = None
+"""Callable, or import path of one, returning the document ids of records.
+
+It is called with a label and a list of record ids and returns a dictionary
+of the document ids of the record ids. Defaults to the record ids.
+"""
+
+INSPIRE_RELATIONS_ENRICHMENT_BATCH_SIZE = 5000
+"""Number of nodes whose relation counts are read per statement."""
+
+INSPIRE_RELATIONS_ENRICHMENT_CHUNK_SIZE = 500
+"""Maximum number of partial updates sent per bulk request."""
+
+INSPIRE_RELATIONS_ENRICHMENT_OVERLAP = 60
+"""Seconds before the watermark of the last export read again.
+
+It covers the synchronization transactions committed after the export
+started, and the clock skew between the hosts writing to the graph.
+"""
+
+INSPIRE_RELATIONS_GRAPH_URI = 'bolt://localhost:7687'
+"""Bolt URI of the Neo4j server holding the relations graph."""
+
+INSPIRE_RELATIONS_GRAPH_AUTH = None
+"""Credentials for the graph database as a ``(user, password)`` tuple."""
+
+INSPIRE_RELATIONS_GRAPH_POOL_SIZE = 50
+"""Maximum number of connections kept open by each process."""
+
+INSPIRE_RELATIONS_GRAPH_ACQUIRE_TIMEOUT = 10
+"""Seconds to wait for a free pooled connection before giving up."""
+
+INSPIRE_RELATIONS_GRAPH_MAX_CONNECTION_LIFETIME = 3600
+"""Seconds after which a pooled connection is closed and replaced."""
+
+INSPIRE_RELATIONS_GRAPH_DRIVER_FACTORY = None
+"""Callable, or import path of one, creating the graph database driver.
+
+It is called with the URI and the Neo4j driver keyword arguments. Defaults
+to :func:`neo4j.GraphDatabase.driver`.
+"""
+
+INSPIRE_RELATIONS_PROFILING = True
+"""Time the graph queries, and expose their metrics at ``/relations/metrics``.
+
+The metrics are those of the process answering the request, see
+:mod:`inspire_relations.profiling`.
+"""
+
+INSPIRE_RELATIONS_PROFILING_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Upper bounds, in seconds, of the buckets of the query duration histogram.
+"""
+
+INSPIRE_RELATIONS_SLOW_QUERY_THRESHOLD = 1.0
+"""Seconds above which a graph query is logged, ``None`` to never log them."""
+
+INSPIRE_RELATIONS_SLOW_QUERY_PLANS = True
+"""Log the plans of the slow queries, which costs one more query each.
+
+The plans are requested with the lists of the parameters cut to their first
+item, so that the rows of batches are not sent again.
+"""
+
+INSPIRE_RELATIONS_INGEST_BATCH_SIZE = 1000
+"""Number of records written to the graph per ingestion transaction."""
+
+INSPIRE_RELATIONS_SYNC_SIGNALS = True
+"""Keep the graph in sync with record changes through Invenio-Records signals.
+
+Has no effect when Invenio-Records is not installed.
+"""
+
+INSPIRE_RELATIONS_WRITE_BEHIND = None
+"""Executor writing buffered record changes to the graph.
+
+``'celery'`` sends batches to Celery workers, ``'local'`` writes them in
+local worker processes, and ``None`` writes every change inline. The
+``'local'`` workers can not write to the ``'memory'`` backend. Celery
+workers invalidate the cached lookups once they wrote a batch, which only
+reaches the other processes through ``INSPIRE_RELATIONS_REDIS_CACHE_URL``.
+"""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_WINDOW = 2.0
+"""Seconds during which changes to the same record are coalesced."""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_BATCH_SIZE = 500
+"""Maximum number of records whose changes are written per transaction."""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_MAX_DEPTH = 10000
+"""Maximum number of records pending or being written before producers wait.
+"""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_PUT_TIMEOUT = 5.0
+"""Seconds a producer waits for room before writing its change inline."""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_MAX_RETRIES = 5
+"""Number of times a failed batch is retried."""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_PROCESSES = 1
+"""Number of worker processes of the ``'local'`` executor, each writing the
+changes of a partition of the records."""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_QUEUE = 'inspire-relations-writes'
+"""Prefix of the Celery queues of the ``'celery'`` executor.
+
+The changes of a partition of the records are sent to the
+``'<prefix>-<partition>'`` queue, which must be consumed by a single worker
+process, e.g. ``celery worker -Q inspire-relations-writes-0 -c 1``, so
+that they are written in order.
+"""
+
+INSPIRE_RELATIONS_WRITE_BEHIND_PARTITIONS = 1
+"""Number of partitions, and queues, of the ``'celery'`` executor."""
+
+INSPIRE_RELATIONS_CACHE_SIZE = 10000
+"""Maximum number of relation lookups cached by each process."""
+
+INSPIRE_RELATIONS_CACHE_TTL = 300
+"""Seconds during which a cached relation lookup is used."""
+
+INSPIRE_RELATIONS_REDIS_CACHE_URL = None
+"""URL of a Redis server caching the relation lookups for all the processes,
+behind the cache of each process, e.g. ``'redis://localhost:6379/0'``, or
+``None``. Requires the ``redis`` extra."""
+
+INSPIRE_RELATIONS_REDIS_CACHE_TTL = 3600
+"""Seconds during which a relation lookup is cached in Redis."""
+
+INSPIRE_RELATIONS_REDIS_CACHE_PREFIX = 'inspire-relations'
+"""Prefix of the keys of the relation lookups cached in Redis."""
+
+INSPIRE_RELATIONS_REDIS_CACHE_CLIENT_FACTORY = None
+"""Callable, or import path of one, creating the Redis client from the URL.
+
+Defaults to :func:`inspire_relations.shared_cache.redis_client`.
+"""
+
+INSPIRE_RELATIONS_ACCESS_LOG = None
+"""Path of the file counting the most requested lookups, shared by all the
+processes, or ``None`` not to count them."""
+
+INSPIRE_RELATIONS_ACCESS_LOG_SIZE = 10000
+"""Maximum number of lookups counted in the access log."""
+
+INSPIRE_RELATIONS_ACCESS_LOG_FLUSH_INTERVAL = 300
+"""Seconds between two merges of the counts of a process in the access
+log."""
+
+INSPIRE_RELATIONS_WARM_START = 0
+"""Number of the most requested lookups of the access log cached when the
+application starts."""
+
+INSPIRE_RELATIONS_PAGE_SIZE = 25
+"""Default number of relations returned per page by the REST endpoints."""
+
+INSPIRE_RELATIONS_MAX_PAGE_SIZE = 1000
+"""Maximum number of relations that can be requested per page."""
+
+INSPIRE_RELATIONS_MAX_BATCH_SIZE = 250
+"""Maximum number of records answered by one batch lookup request."""
+
+INSPIRE_RELATIONS_METRICS_BATCH_SIZE = 1000
+"""Number of nodes whose citation metrics are recomputed per transaction."""
+
+INSPIRE_RELATIONS_RANKING_DAMPING = 0.85
+"""Probability of following a citation in the ``pagerank`` computation."""
+
+INSPIRE_RELATIONS_RANKING_DECAY = 2.6
+"""Characteristic age in years of the records favoured by ``citerank``."""
+
+INSPIRE_RELATIONS_RANKING_TOLERANCE = 1e-6
+"""Change of the scores, in L1 norm, below which rankings stop iterating."""
+
+INSPIRE_RELATIONS_RANKING_MAX_ITERATIONS = 100
+"""Maximum number of iterations of a ranking computation."""
+
+INSPIRE_RELATIONS_SIMILAR_LIMIT = 10
+"""Number of similar papers stored, and at most returned, per paper."""
+
+INSPIRE_RELATIONS_SIMILAR_BLOCK_SIZE = 1000
+"""Number of papers whose similar papers are computed together."""
+
+INSPIRE_RELATIONS_DISAMBIGUATION_PROCESSES = None
+"""Number of processes extracting candidate features, defaults to the CPUs.
+"""
+
+INSPIRE_RELATIONS_DISAMBIGUATION_CHUNK_SIZE = 100
+"""Number of signature blocks whose features are extracted together."""
+
+INSPIRE_RELATIONS_DISAMBIGUATION_MAX_NEIGHBOURS = 1000
+"""Size above which a neighbourhood is ignored by the candidate features."""
+
+INSPIRE_RELATIONS_RESOLVE_REFERENCES = False
+"""Whether ingestion links references without record by their identifiers.
+"""
+
+INSPIRE_RELATIONS_RESOLVER_PROCESSES = None
+"""Number of processes matching references, defaults to the CPUs."""
+
+INSPIRE_RELATIONS_RESOLVER_CHUNK_SIZE = 1000
+"""Number of references matched together by a process."""
+
+INSPIRE_RELATIONS_RESOLVER_MAX_PENDING = 100000
+"""Number of collected references kept in memory before spilling to disk."""
+
+INSPIRE_RELATIONS_TRAVERSAL_MAX_DEPTH = 3
+"""Maximum number of hops of a traversal."""
+
+INSPIRE_RELATIONS_TRAVERSAL_FAN_OUT = 100
+"""Maximum number of neighbours followed from a node at each hop."""
+
+INSPIRE_RELATIONS_TRAVERSAL_MAX_NODES = 10000
+"""Maximum number of nodes expanded by a traversal at each depth."""
+
+INSPIRE_RELATIONS_TRAVERSAL_LIMIT = 1000
+"""Maximum number of nodes returned by a traversal."""
+
+INSPIRE_RELATIONS_TRAVERSAL_TIMEOUT = 5.0
+"""Seconds after which a traversal stops and returns its partial results."""
+
+INSPIRE_RELATIONS_SCHEMA_CHECK = True
+"""Refuse to ingest records unless the required constraints are online."""
@@ -0,0 +1,704 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cypher statements used to read and write the relations graph.
+
+Labels and relationship types cannot be passed as parameters, so they are
+formatted into the statements; they are checked against the known node
+labels to never interpolate arbitrary input.
+"""
+
+from __future__ import absolute_import, print_function
+
+from .records import AUTHOR, CITES, LITERATURE, NODE_KEYS
+
+
+def _check_label(label):
+    if label not in NODE_KEYS:
+        raise ValueError('Unknown node label {0!r}.'.format(label))
+
+
+def node_pattern(variable, label, key):
+    """Return a pattern matching a node by the value of its key property."""
+    _check_label(label)
+    return '({0}:{1} {{{2}: {3}}})'.format(
+        variable, label, NODE_KEYS[label], key)
+
+
+def merge_nodes(label):
+    """Return a statement merging a batch of ``$rows`` nodes.
+
+    Each row is a mapping with the ``key`` of the node and the
+    ``properties`` to set on it.
+    """
+    return (
+        'UNWIND $rows AS row '
+        'MERGE {0} '
+        'SET n += row.properties'
+    ).format(node_pattern('n', label, 'row.key'))
+
+
+def merge_relations(type_, start_label, end_label):
+    """Return a statement merging a batch of ``$rows`` relations.
+
+    Each row is a mapping with the ``start`` and ``end`` node keys and the
+    ``properties`` replacing those of the relation. Missing end nodes are
+    created, so that relations can be written before the record they point
+    to.
+    """
+    return (
+        'UNWIND $rows AS row '
+        'MERGE {0} '
+        'MERGE {1} '
+        'MERGE (a)-[r:{2}]->(b) '
+        'SET r = row.properties'
+    ).format(
+        node_pattern('a', start_label, 'row.start'),
+        node_pattern('b', end_label, 'row.end'),
+        type_,
+    )
+
+
+def delete_relations(type_, start_label, end_label):
+    """Return a statement deleting a batch of ``$rows`` relations.
+
+    Each row is a mapping with the ``start`` and ``end`` node keys. Only the
+    matched relations are locked and removed, their nodes are kept.
+    """
+    return (
+        'UNWIND $rows AS row '
+        'MATCH {0}-[r:{2}]->{1} '
+        'DELETE r'
+    ).format(
+        node_pattern('a', start_label, 'row.start'),
+        node_pattern('b', end_label, 'row.end'),
+        type_,
+    )
+
+
+def node_keys(label, properties=()):
+    """Return a statement listing the ``key`` and properties of all nodes."""
+    _check_label(label)
+    return 'MATCH (n:{0}) RETURN {1}'.format(label, ', '.join(
+        ['n.{0} AS key'.format(NODE_KEYS[label])] +
+        ['n.{0} AS {0}'.format(property_) for property_ in properties]))
+
+
+def node_properties(label):
+    """Return a statement listing the properties of a batch of ``$keys``."""
+    _check_label(label)
+    return (
+        'UNWIND $keys AS key '
+        'MATCH (n:{0} {{{1}: key}}) '
+        'RETURN key, properties(n) AS properties'
+    ).format(label, NODE_KEYS[label])
+
+
+def _neighbour_relations(type_, start_label, end_label, reverse):
+    """Return the labels of ``n`` and its neighbours, and their relations.
+
+    The relations are a pattern from ``n``, to be followed by the node of
+    the neighbour.
+    """
+    if reverse:
+        return end_label, start_label, '(n)<-[:{0}]-'.format(type_)
+    return start_label, end_label, '(n)-[:{0}]->'.format(type_)
+
+
+def neighbour_keys(type_, start_label, end_label, reverse=False,
+                   limited=False):
+    """Return a statement listing the neighbours of a batch of ``$keys``.
+
+    The neighbours are the ends of the relations starting at the given
+    nodes, or their starts if ``reverse``.
+
+    If ``limited``, the nodes with more than ``$limit`` relations of the
+    type are listed with ``null`` neighbours, without expanding their
+    relations, which are only counted from the degree of the node. Their
+    neighbours are read with :func:`hub_neighbour_keys` instead.
+    """
+    label, other, relations = _neighbour_relations(
+        type_, start_label, end_label, reverse)
+    keys = '[{0}(m:{1}) | m.{2}]'.format(relations, other, NODE_KEYS[other])
+    if not limited:
+        return (
+            'UNWIND $keys AS key '
+            'MATCH {0} '
+            'WITH key, {1} AS neighbours '
+            'WHERE size(neighbours) > 0 '
+            'RETURN key, neighbours'
+        ).format(node_pattern('n', label, 'key'), keys)
+    return (
+        'UNWIND $keys AS key '
+        'MATCH {0} '
+        'WITH key, n, size({1}()) AS degree '
+        'WHERE degree > 0 '
+        'WITH key, CASE WHEN degree <= $limit THEN {2} END AS neighbours '
+        'WHERE neighbours IS NULL OR size(neighbours) > 0 '
+        'RETURN key, neighbours'
+    ).format(node_pattern('n', label, 'key'), relations, keys)
+
+
+def hub_neighbour_keys(type_, start_label, end_label, reverse=False):
+    """Return a statement listing ``$limit`` neighbours of a ``$key`` node.
+
+    The relations of the node are only expanded until ``$limit`` neighbours
+    are found, see :func:`neighbour_keys`.
+    """
+    label, other, relations = _neighbour_relations(
+        type_, start_label, end_label, reverse)
+    return (
+        'MATCH {0} '
+        'MATCH {1}(m:{2}) '
+        'RETURN m.{3} AS key LIMIT $limit'
+    ).format(node_pattern('n', label, '$key'), relations, other,
+             NODE_KEYS[other])
+
+
+def ranked_neighbours(type_, start_label, end_label):
+    """Return a statement listing the neighbours of a ``$key`` node.
+
+    The ends of the relations starting at the node are listed with the
+    properties of the relation, by decreasing ``$weight`` property, at most
+    ``$limit`` of them.
+    """
+    _check_label(end_label)
+    return (
+        'MATCH {0}-[r:{1}]->(m:{2}) '
+        'RETURN m.{3} AS key, properties(r) AS properties '
+        'ORDER BY r[$weight] DESC, key LIMIT $limit'
+    ).format(node_pattern('n', start_label, '$key'), type_, end_label,
+             NODE_KEYS[end_label])
+
+
+def relation_keys(type_, start_label, end_label):
+    """Return a statement listing the end keys of all relations of a type."""
+    _check_label(start_label)
+    _check_label(end_label)
+    return (
+        'MATCH (a:{0})-[:{2}]->(b:{1}) '
+        'RETURN a.{3} AS start, b.{4} AS end'
+    ).format(start_label, end_label, type_,
+             NODE_KEYS[start_label], NODE_KEYS[end_label])
+
+
+CITATION_COUNT = (
+    'MATCH (:Literature {recid: $recid})<-[:CITES]-(c:Literature) '
+    'RETURN count(c) AS count'
+)
+
+CITATIONS = (
+    'MATCH (:Literature {recid: $recid})<-[:CITES]-(c:Literature) '
+    'RETURN c.recid AS recid ORDER BY recid'
+)
+
+REFERENCES = (
+    'MATCH (:Literature {recid: $recid})-[:CITES]->(r:Literature) '
+    'RETURN r.recid AS recid ORDER BY recid'
+)
+
+AUTHOR_PAPERS = (
+    'MATCH (:Author {recid: $recid})<-[:WRITTEN_BY]-(l:Literature) '
+    'RETURN l.recid AS recid ORDER BY recid'
+)
+
+COAUTHORS = (
+    'MATCH (a:Author {recid: $recid})<-[:WRITTEN_BY]-(:Literature)'
+    '-[:WRITTEN_BY]->(c:Author) '
+    'WHERE c <> a '
+    'RETURN DISTINCT c.recid AS recid ORDER BY recid'
+)
+
+
+PAGES = {
+    'citations': (
+        'MATCH (:Literature {recid: $recid})<-[:CITES]-(x:Literature) '
+        'WHERE x.recid > $after '
+        'RETURN x.recid AS recid ORDER BY recid LIMIT $limit'
+    ),
+    'references': (
+        'MATCH (:Literature {recid: $recid})-[:CITES]->(x:Literature) '
+        'WHERE x.recid > $after '
+        'RETURN x.recid AS recid ORDER BY recid LIMIT $limit'
+    ),
+    'author_papers': (
+        'MATCH (:Author {recid: $recid})<-[:WRITTEN_BY]-(x:Literature) '
+        'WHERE x.recid > $after '
+        'RETURN x.recid AS recid ORDER BY recid LIMIT $limit'
+    ),
+    'coauthors': (
+        'MATCH (a:Author {recid: $recid})<-[:WRITTEN_BY]-(:Literature)'
+        '-[:WRITTEN_BY]->(x:Author) '
+        'WHERE x <> a AND x.recid > $after '
+        'RETURN DISTINCT x.recid AS recid ORDER BY recid LIMIT $limit'
+    ),
+}
+"""Keyset paginated versions of the lookups, starting after a record id."""
+
+CITATION_FILTERS = {
+    'exclude_self': 'NOT coalesce(r.self_citation, false)',
+    'exclude_collaboration': 'NOT coalesce(r.same_collaboration, false)',
+    'refereed_only': 'coalesce(x.refereed, false)',
+}
+"""Conditions on the citations ``r`` and the citing records ``x``."""
+
+_CITED = {
+    LITERATURE: '(:Literature {recid: $recid})',
+    AUTHOR: '(:Author {recid: $recid})<-[:WRITTEN_BY]-(:Literature)',
+}
+
+
+def filtered_citations(label, filters, count=False):
+    """Return a statement listing the records citing a node, filtered.
+
+    The citations of an author are those of its papers. Records are listed
+    as a keyset page of the distinct citing records after ``$after``, at
+    most ``$limit``, or, if ``count``, the citations are counted.
+
+    :param filters: names of :data:`CITATION_FILTERS` to apply.
+    """
+    conditions = [CITATION_FILTERS[name] for name in sorted(filters)]
+    if not count:
+        conditions.append('x.recid > $after')
+    statement = 'MATCH {0}<-[r:CITES]-(x:Literature) '.format(_CITED[label])
+    if conditions:
+        statement += 'WHERE {0} '.format(' AND '.join(conditions))
+    if count:
+        return statement + 'RETURN count(r) AS count'
+    return statement + (
+        'RETURN DISTINCT x.recid AS recid ORDER BY recid LIMIT $limit')
+
+
+BATCHES = {
+    'citation_count': (
+        'UNWIND $recids AS recid '
+        'OPTIONAL MATCH (:Literature {recid: recid})<-[:CITES]-(x:Literature) '
+        'RETURN recid, count(x) AS value'
+    ),
+    'citations': (
+        'UNWIND $recids AS recid '
+        'OPTIONAL MATCH (:Literature {recid: recid})<-[:CITES]-(x:Literature) '
+        'WITH recid, x ORDER BY x.recid '
+        'RETURN recid, collect(x.recid) AS value'
+    ),
+    'references': (
+        'UNWIND $recids AS recid '
+        'OPTIONAL MATCH (:Literature {recid: recid})-[:CITES]->(x:Literature) '
+        'WITH recid, x ORDER BY x.recid '
+        'RETURN recid, collect(x.recid) AS value'
+    ),
+    'author_papers': (
+        'UNWIND $recids AS recid '
+        'OPTIONAL MATCH (:Author {recid: recid})'
+        '<-[:WRITTEN_BY]-(x:Literature) '
+        'WITH recid, x ORDER BY x.recid '
+        'RETURN recid, collect(x.recid) AS value'
+    ),
+    'coauthors': (
+        'UNWIND $recids AS recid '
+        'OPTIONAL MATCH (a:Author {recid: recid})<-[:WRITTEN_BY]-(:Literature)'
+        '-[:WRITTEN_BY]->(x:Author) '
+        'WHERE x <> a '
+        'WITH DISTINCT recid, x ORDER BY x.recid '
+        'RETURN recid, collect(x.recid) AS value'
+    ),
+}
+"""Versions of the lookups answering many records at once."""
+
+
+_RELATION_COUNTS = {
+    LITERATURE: (
+        'RETURN n.recid AS recid, '
+        'size((n)<-[:CITES]-()) AS citation_count, '
+        'size((n)-[:CITES]->()) AS reference_count'
+    ),
+    AUTHOR: (
+        'OPTIONAL MATCH (n)<-[:WRITTEN_BY]-(:Literature)'
+        '-[:WRITTEN_BY]->(c:Author) WHERE c <> n '
+        'RETURN n.recid AS recid, count(DISTINCT c) AS coauthor_count, '
+        'size((n)<-[:WRITTEN_BY]-()) AS paper_count ORDER BY recid'
+    ),
+}
+
+
+def relation_counts(label, changed=False):
+    """Return a keyset page of the relation counts of nodes after ``$after``.
+
+    If ``changed``, only the nodes whose relations were updated since the
+    ``$since`` timestamp are read, see :func:`stamp_nodes`.
+    """
+    return (
+        'MATCH (n:{0}) WHERE {1}n.recid > $after '
+        'WITH n ORDER BY n.recid LIMIT $limit '
+        '{2}'
+    ).format(label, 'n.relations_updated >= $since AND ' if changed else '',
+             _RELATION_COUNTS[label])
+
+
+def stamp_nodes(label):
+    """Return a statement stamping the nodes of ``$keys`` as updated.
+
+    The ``relations_updated`` property of the nodes is set to ``$stamp``,
+    the time of the change in milliseconds.
+    """
+    return (
+        'UNWIND $keys AS key '
+        'MATCH {0} '
+        'SET n.relations_updated = $stamp'
+    ).format(node_pattern('n', label, 'key'))
+
+
+STAMP_PAPER_AUTHORS = (
+    'UNWIND $keys AS key '
+    'MATCH (:Literature {recid: key})-[:WRITTEN_BY]->(n:Author) '
+    'SET n.relations_updated = $stamp'
+)
+"""Stamp all the authors of the papers of ``$keys`` as updated."""
+
+
+def changed_keys(label):
+    """Return a statement listing the nodes updated since ``$since``."""
+    _check_label(label)
+    return (
+        'MATCH (n:{0}) WHERE n.relations_updated >= $since '
+        'RETURN n.{1} AS key'
+    ).format(label, NODE_KEYS[label])
+
+
+_H_INDEX = (
+    'WITH DISTINCT au WHERE au IS NOT NULL '
+    'MATCH (au)<-[:WRITTEN_BY]-(p:Literature) '
+    'WITH au, coalesce(p.citation_count, 0) AS c ORDER BY c DESC '
+    'WITH au, collect(c) AS counts '
+    'SET au.h_index = size([i IN range(0, size(counts) - 1) '
+    'WHERE counts[i] > i])'
+)
+
+
+def _histogram_update(op, keys='citation_years',
+                      counts='citations_per_year', value='a.year'):
+    """Return ``SET`` items counting a citation from ``value`` on ``b``.
+
+    The histogram is kept in the aligned ``keys`` and ``counts`` lists, by
+    default the ``citation_years`` and ``citations_per_year`` of the citing
+    papers. They are read where they are written, so that several citations
+    of the same node in one batch add up.
+    """
+    if op == '+':
+        missing_key = (
+            'ELSE coalesce(b.{counts}, []) + 1 END, '
+            'b.{keys} = CASE '
+            'WHEN {value} IS NULL OR {value} IN coalesce(b.{keys}, []) '
+            'THEN b.{keys} '
+            'ELSE coalesce(b.{keys}, []) + {value} END'
+        )
+    else:
+        missing_key = 'ELSE b.{counts} END'
+    return (
+        'b.{counts} = CASE '
+        'WHEN {value} IS NULL THEN b.{counts} '
+        'WHEN {value} IN coalesce(b.{keys}, []) '
+        'THEN [i IN range(0, size(b.{keys}) - 1) | '
+        'b.{counts}[i] {op} '
+        'CASE WHEN b.{keys}[i] = {value} THEN 1 ELSE 0 END] '
+        + missing_key
+    ).format(op=op, keys=keys, counts=counts, value=value)
+
+
+def _month(date):
+    """Return the ``YYYYMM`` integer of a ``YYYY-MM-DD`` date expression."""
+    return (
+        'toInteger(substring({0}, 0, 4)) * 100 + '
+        'toInteger(substring({0}, 5, 2))'
+    ).format(date)
+
+
+_MONTHS = {'keys': 'citation_months', 'counts': 'citations_per_month',
+           'value': 'month'}
+
+
+def _last_month(month='month'):
+    """Return the ``SET`` item raising the last citation month of ``b``."""
+    return (
+        'b.last_citation_month = CASE '
+        'WHEN {0} IS NULL OR {0} < coalesce(b.last_citation_month, 0) '
+        'THEN b.last_citation_month ELSE {0} END'
+    ).format(month)
+
+
+def _year(date):
+    """Return the year integer of a ``YYYY-MM-DD`` date expression."""
+    return 'toInteger(substring({0}, 0, 4))'.format(date)
+
+
+def _count_update(variable, op):
+    """Return ``SET`` items counting a citation on a node."""
+    return (
+        '{0}.citation_count = coalesce({0}.citation_count, 0) {1} 1, '
+        '{0}.citation_count_without_self_citations = '
+        'coalesce({0}.citation_count_without_self_citations, 0) {1} '
+        'CASE WHEN self THEN 0 ELSE 1 END'
+    ).format(variable, op)
+
+
+_CITATION_FRAGMENTS = {
+    'count': _count_update('b', '+'),
+    'uncount': _count_update('b', '-'),
+    'count_authors': _count_update('au', '+'),
+    'uncount_authors': _count_update('au', '-'),
+    'h_index': _H_INDEX,
+    'count_year': _histogram_update('+'),
+    'uncount_year': _histogram_update('-'),
+    'count_month': _histogram_update('+', **_MONTHS),
+    'uncount_month': _histogram_update('-', **_MONTHS),
+    'last_month': _last_month(),
+    'month': _month('row.properties.date'),
+    'year': _year('row.properties.date'),
+    'old_month': _month('existing.date'),
+    'old_year': _year('existing.date'),
+    'removed_month': _month('r.date'),
+    'move_out_year': _histogram_update('-', value='old_year'),
+    'move_out_month': _histogram_update(
+        '-', 'citation_months', 'citations_per_month', 'old_month'),
+    'move_in_year': _histogram_update('+', value='year'),
+}
+"""Named parts of the citation statements, see :data:`ADD_CITATIONS`."""
+
+ADD_CITATIONS = (
+    'UNWIND $rows AS row '
+    'MERGE (a:Literature {{recid: row.start}}) '
+    'MERGE (b:Literature {{recid: row.end}}) '
+    'WITH a, b, row '
+    'OPTIONAL MATCH (a)-[existing:CITES]->(b) '
+    'WITH a, b, row, existing, '
+    '{old_month} AS old_month, {month} AS month, '
+    '{old_year} AS old_year, {year} AS year, '
+    'existing.self_citation AS self_citation, '
+    'existing.same_collaboration AS same_collaboration '
+    # Replace the properties of an existing citation, keeping its flags.
+    'FOREACH (e IN CASE WHEN existing IS NULL THEN [] ELSE [existing] END | '
+    'SET e = row.properties, e.self_citation = self_citation, '
+    'e.same_collaboration = same_collaboration) '
+    # Move an existing citation whose date changed, from or to no date.
+    'FOREACH (moved IN CASE WHEN existing IS NOT NULL AND '
+    'coalesce(old_month, 0) <> coalesce(month, 0) THEN [1] ELSE [] END | '
+    'SET {move_out_year}, {move_out_month} '
+    'SET {move_in_year}, {count_month}, {last_month}) '
+    # Count the new citations.
+    'WITH a, b, row, month WHERE existing IS NULL '
+    'WITH a, b, row, month, '
+    'exists((a)-[:WRITTEN_BY]->(:Author)<-[:WRITTEN_BY]-(b)) AS self, '
+    'exists((a)-[:IN_COLLABORATION]->(:Collaboration)'
+    '<-[:IN_COLLABORATION]-(b)) AS collaboration '
+    'CREATE (a)-[r:CITES]->(b) '
+    'SET r = row.properties, r.self_citation = self, '
+    'r.same_collaboration = collaboration, '
+    '{count}, {count_year}, {count_month}, {last_month} '
+    'WITH b, self '
+    'OPTIONAL MATCH (b)-[:WRITTEN_BY]->(au:Author) '
+    'SET {count_authors} '
+    '{h_index}'
+).format(**_CITATION_FRAGMENTS)
+"""Merge a batch of citations, maintaining the metrics of the cited nodes.
+
+Only citations that did not exist yet are counted, so that the statement
+can be safely retried. The ``self_citation`` and ``same_collaboration``
+flags are set from the authors and collaborations linked to both papers at
+that time. The properties of existing citations are replaced, and those
+whose ``date`` changed are moved from the month and year of their previous
+date to those of the new one; a missing date has no month nor year, and is
+neither uncounted nor counted.
+"""
+
+REMOVE_CITATIONS = (
+    'UNWIND $rows AS row '
+    'MATCH (a:Literature {{recid: row.start}})-[r:CITES]->'
+    '(b:Literature {{recid: row.end}}) '
+    'WITH a, b, r, coalesce(r.self_citation, false) AS self, '
+    '{removed_month} AS month '
+    'DELETE r '
+    'SET {uncount}, {uncount_year}, {uncount_month} '
+    'WITH b, self '
+    'OPTIONAL MATCH (b)-[:WRITTEN_BY]->(au:Author) '
+    'SET {uncount_authors} '
+    '{h_index}'
+).format(**_CITATION_FRAGMENTS)
+"""Delete a batch of citations, maintaining the metrics of the cited nodes.
+"""
+
+
+def add_relations(type_, start_label, end_label):
+    """Return a statement merging relations while maintaining metrics.
+
+    Used for incremental changes; bulk loads rather use
+    :func:`merge_relations` and recompute the metrics afterwards.
+    """
+    if (type_, start_label, end_label) == (CITES, LITERATURE, LITERATURE):
+        return ADD_CITATIONS
+    return merge_relations(type_, start_label, end_label)
+
+
+def remove_relations(type_, start_label, end_label):
+    """Return a statement deleting relations while maintaining metrics."""
+    if (type_, start_label, end_label) == (CITES, LITERATURE, LITERATURE):
+        return REMOVE_CITATIONS
+    return delete_relations(type_, start_label, end_label)
+
+
+NEXT_KEYS = (
+    'MATCH (n:{0}) WHERE n.recid > $after '
+    'RETURN n.recid AS recid ORDER BY recid LIMIT $limit'
+)
+"""Keyset paginated ids of all the nodes of a label."""
+
+RECOMPUTE_CITATION_FLAGS = (
+    'UNWIND $recids AS recid '
+    'MATCH (a:Literature {recid: recid})-[r:CITES]->(b:Literature) '
+    'SET r.self_citation = '
+    'exists((a)-[:WRITTEN_BY]->(:Author)<-[:WRITTEN_BY]-(b)), '
+    'r.same_collaboration = exists((a)-[:IN_COLLABORATION]->(:Collaboration)'
+    '<-[:IN_COLLABORATION]-(b))'
+)
+
+RECOMPUTE_LITERATURE_METRICS = (
+    'UNWIND $recids AS recid '
+    'MATCH (b:Literature {recid: recid}) '
+    'OPTIONAL MATCH (b)<-[r:CITES]-(a:Literature) '
+    'WITH b, a.year AS year, count(r) AS n, '
+    'sum(CASE WHEN r.self_citation THEN 1 ELSE 0 END) AS self '
+    'ORDER BY year '
+    'WITH b, sum(n) AS total, sum(self) AS self, '
+    'collect(CASE WHEN n > 0 THEN year END) AS years, '
+    'collect(CASE WHEN n > 0 AND year IS NOT NULL THEN n END) AS counts '
+    'SET b.citation_count = total, '
+    'b.citation_count_without_self_citations = total - self, '
+    'b.citation_years = years, b.citations_per_year = counts'
+)
+
+RECOMPUTE_CITATION_MONTHS = (
+    'UNWIND $recids AS recid '
+    'MATCH (b:Literature {{recid: recid}}) '
+    'OPTIONAL MATCH (b)<-[r:CITES]-(:Literature) '
+    'WITH b, {0} AS month, count(r) AS n '
+    'ORDER BY month '
+    'WITH b, collect(CASE WHEN n > 0 THEN month END) AS months, '
+    'collect(CASE WHEN n > 0 AND month IS NOT NULL THEN n END) AS counts '
+    'SET b.citation_months = months, b.citations_per_month = counts, '
+    'b.last_citation_month = months[-1]'
+).format(_month('r.date'))
+"""Recompute the per month histogram of the dated citations of nodes."""
+
+RECOMPUTE_AUTHOR_METRICS = (
+    'UNWIND $recids AS recid '
+    'MATCH (au:Author {recid: recid}) '
+    'OPTIONAL MATCH (au)<-[:WRITTEN_BY]-(p:Literature) '
+    'WITH au, coalesce(p.citation_count, 0) AS c, '
+    'coalesce(p.citation_count_without_self_citations, 0) AS s '
+    'ORDER BY c DESC '
+    'WITH au, collect(c) AS counts, sum(c) AS total, sum(s) AS without_self '
+    'SET au.citation_count = total, '
+    'au.citation_count_without_self_citations = without_self, '
+    'au.h_index = size([i IN range(0, size(counts) - 1) '
+    'WHERE counts[i] > i])'
+)
+
+LITERATURE_METRICS = (
+    'MATCH (n:Literature {recid: $recid}) '
+    'RETURN n.citation_count AS citation_count, '
+    'n.citation_count_without_self_citations '
+    'AS citation_count_without_self_citations, '
+    'n.citation_years AS citation_years, '
+    'n.citations_per_year AS citations_per_year'
+)
+
+AUTHOR_METRICS = (
+    'MATCH (n:Author {recid: $recid}) '
+    'RETURN n.citation_count AS citation_count, '
+    'n.citation_count_without_self_citations '
+    'AS citation_count_without_self_citations, '
+    'n.h_index AS h_index'
+)
+
+
+MONTHLY_CITATIONS = (
+    'UNWIND $recids AS recid '
+    'MATCH (n:Literature {recid: recid}) '
+    'RETURN recid, n.citation_months AS months, '
+    'n.citations_per_month AS counts'
+)
+
+COUNT_MONTHLY_CITATIONS = (
+    'UNWIND $recids AS recid '
+    'MATCH (:Literature {{recid: recid}})<-[r:CITES]-(:Literature) '
+    'WITH recid, {0} AS month, count(r) AS n WHERE month IS NOT NULL '
+    'ORDER BY month '
+    'RETURN recid, collect(month) AS months, collect(n) AS counts'
+).format(_month('r.date'))
+"""Citations per month of papers, counted from the dates of the citations
+rather than read from the nodes."""
+
+RISING_PAPERS = (
+    'MATCH (n:Literature) WHERE n.last_citation_month >= $since '
+    'WITH n, reduce(total = 0, i IN range(0, size(n.citation_months) - 1) | '
+    'total + CASE WHEN n.citation_months[i] >= $since '
+    'THEN n.citations_per_month[i] ELSE 0 END) AS citations '
+    'WHERE citations > 0 '
+    'RETURN n.recid AS recid, citations '
+    'ORDER BY citations DESC, recid LIMIT $limit'
+)
+"""Papers most cited since the ``$since`` month, found by the index of the
+month of their last citation."""
+
+AFFILIATIONS_AT = (
+    'MATCH (:Author {recid: $recid})-[r:AFFILIATED_WITH]->(i:Institution) '
+    "WHERE coalesce(r.start_date, '') <= $date "
+    "AND (coalesce(r.end_date, '') = '' OR r.end_date >= $date) "
+    'RETURN i.recid AS recid ORDER BY recid'
+)
+"""Institutions of an author at a ``$date``, periods without a start or an
+end being open."""
+
+
+def create_constraint(label, property_):
+    """Return a statement creating a uniqueness constraint."""
+    _check_label(label)
+    return 'CREATE CONSTRAINT ON (n:{0}) ASSERT n.{1} IS UNIQUE'.format(
+        label, property_)
+
+
+def create_index(label, property_):
+    """Return a statement creating an index."""
+    _check_label(label)
+    return 'CREATE INDEX ON :{0}({1})'.format(label, property_)
+
+
+INDEXES = 'CALL db.indexes()'
+
+SCHEMA_VERSION = (
+    'MATCH (v:SchemaVersion {name: $name}) RETURN v.version AS version'
+)
+
+SET_SCHEMA_VERSION = (
+    'MERGE (v:SchemaVersion {name: $name}) SET v.version = $version'
+)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Relation features of the candidate authors of ambiguous signatures.
+
+A signature is an author of a paper that is not reliably linked to an
+author record yet. Author disambiguation compares it to the candidate
+authors close to its paper in the relations graph, namely:
+
+* the authors who wrote a paper with one of the linked authors of the
+  paper,
+* the authors affiliated with one of the institutions of the paper,
+* the authors of a paper of one of the collaborations of the paper.
+
+Instead of querying the graph once per signature, the signatures are
+handled in chunks: the neighbourhoods of all the papers of a chunk are
+fetched hop by hop with one backend call per relation, and chunks are
+spread across a pool of worker processes. Neighbourhoods larger than
+``max_neighbours``, such as the papers of the largest collaborations, carry
+little information and are skipped.
+"""
+
+from __future__ import absolute_import, print_function
+
+from collections import deque, namedtuple
+from multiprocessing import Pool, cpu_count
+
+from .ingest import chunked
+from .records import AFFILIATED_WITH, AUTHOR, COLLABORATION, \
+    IN_COLLABORATION, INSTITUTION, LITERATURE, WRITTEN_BY
+
+Features = namedtuple('Features', ['coauthors', 'affiliations',
+                                   'collaborations'])
+"""Number of co-authors, institutions and collaborations of a signature
+shared by a candidate author."""
+
+
+def _drop_large(neighbours, max_neighbours):
+    return dict((key, row) for key, row in neighbours.items()
+                if len(row) <= max_neighbours)
+
+
+def _union(keys, neighbours):
+    """Return the neighbours of all the ``keys``."""
+    result = set()
+    for key in keys:
+        result.update(neighbours.get(key, ()))
+    return result
+
+
+def extract_features(backend, blocks, max_neighbours=1000):
+    """Compute the features of the candidates of signature blocks.
+
+    :param blocks: ``(block, signatures)`` pairs, where ``signatures`` are
+        ``(signature, paper recid)`` pairs.
+    :returns: a list of ``(block, signature, candidates)`` tuples, where
+        ``candidates`` maps the candidate author ids to their
+        :class:`Features`. The linked authors of the paper are not
+        candidates.
+    """
+    blocks = list(blocks)
+    papers = set(paper for _, signatures in blocks
+                 for _, paper in signatures)
+
+    authors = backend.neighbours_many(WRITTEN_BY, LITERATURE, AUTHOR, papers)
+    institutions = backend.neighbours_many(
+        AFFILIATED_WITH, LITERATURE, INSTITUTION, papers)
+    collaborations = backend.neighbours_many(
+        IN_COLLABORATION, LITERATURE, COLLABORATION, papers)
+
+    coauthor_papers = _drop_large(backend.neighbours_many(
+        WRITTEN_BY, LITERATURE, AUTHOR, _union(papers, authors),
+        reverse=True), max_neighbours)
+    collaboration_papers = _drop_large(backend.neighbours_many(
+        IN_COLLABORATION, LITERATURE, COLLABORATION,
+        _union(papers, collaborations), reverse=True), max_neighbours)
+    members = _drop_large(backend.neighbours_many(
+        AFFILIATED_WITH, AUTHOR, INSTITUTION, _union(papers, institutions),
+        reverse=True), max_neighbours)
+    paper_authors = backend.neighbours_many(
+        WRITTEN_BY, LITERATURE, AUTHOR,
+        _union(coauthor_papers, coauthor_papers) |
+        _union(collaboration_papers, collaboration_papers))
+
+    networks = [
+        (authors, dict(
+            (author, _union(papers_, paper_authors))
+            for author, papers_ in coauthor_papers.items())),
+        (institutions, members),
+        (collaborations, dict(
+            (collaboration, _union(papers_, paper_authors))
+            for collaboration, papers_ in collaboration_papers.items())),
+    ]
+    results = []
+    for block, signatures in blocks:
+        for signature, paper in signatures:
+            counts = {}
+            for position, (links, network) in enumerate(networks):
+                for link in links.get(paper, ()):
+                    for candidate in network.get(link, ()):
+                        counts.setdefault(candidate, [0, 0, 0])
+                        counts[candidate][position] += 1
+            for author in authors.get(paper, ()):
+                counts.pop(author, None)
+            results.append((block, signature, dict(
+                (candidate, Features(*count))
+                for candidate, count in counts.items())))
+    return results
+
+
+_worker_backend = None
+
+
+def _init_worker(backend):
+    global _worker_backend
+    _worker_backend = backend
+
+
+def _extract_in_worker(blocks, max_neighbours):
+    return extract_features(_worker_backend, blocks,
+                            max_neighbours=max_neighbours)
+
+
+def stream_features(backend, blocks, processes=None, chunk_size=100,
+                    max_neighbours=1000):
+    """Lazily yield the features of the candidates of signature blocks.
+
+    Blocks are consumed lazily and handed to the workers in chunks of
+    ``chunk_size``, at most two chunks per worker being pending at a time.
+    Results are yielded in the order of the blocks.
+
+    :param processes: the number of worker processes, defaults to the
+        number of CPUs. With ``1``, features are extracted in the current
+        process.
+    :returns: an iterator of the tuples of :func:`extract_features`.
+    """
+    chunks = chunked(blocks, chunk_size)
+    if processes == 1:
+        for chunk in chunks:
+            for result in extract_features(
+                    backend, chunk, max_neighbours=max_neighbours):
+                yield result
+        return
+
+    processes = processes or cpu_count()
+    pool = Pool(processes, _init_worker, (backend,))
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(
+                _extract_in_worker, (chunk, max_neighbours)))
+            if len(pending) >= 2 * processes:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Partial updates of the search index with the relation counts.
+
+The documents of the records in Elasticsearch embed the counts of their
+relations, see :data:`inspire_relations.backends.RELATION_COUNTS`. Rather
+than reindexing the records to refresh them, :func:`export_enrichment`
+streams the counts out of the graph in large batches and produces bulk
+partial updates for the records whose relations changed since its last run.
+
+Changes written by the synchronization stamp the nodes whose counts they may
+change with the time of the write, see
+:meth:`inspire_relations.backends.GraphBackend.changed_keys`. The state file
+keeps the watermark of the last run, the time at which it started reading
+the graph, and a run only reads the counts of the nodes stamped since then,
+less an overlap covering the writes which were stamped before the watermark
+but committed after it. A run only replaces the state once all its updates
+were sent, so that a failed run is retried as a whole by the next one: the
+updates are partial and sending them twice is harmless.
+
+Bulk writes, such as the initial ingestion or a reload of the graph, do not
+stamp the nodes, so they are to be followed by a full export.
+"""
+
+from __future__ import absolute_import, print_function
+
+import errno
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+
+from .records import AUTHOR, LITERATURE
+
+STATE_FORMAT = 2
+
+STATS = {
+    LITERATURE: 'literature',
+    AUTHOR: 'authors',
+}
+"""Name of the number of updated records of each label in the statistics."""
+
+
+def load_state(path):
+    """Return the watermark of the last run.
+
+    :returns: the time at which the last run started, in milliseconds, or
+        ``None`` if there was no run yet or if the state was saved by a
+        version not keeping a watermark.
+    :raises ValueError: if the file is not an enrichment state.
+    """
+    try:
+        with open(path) as fileobj:
+            state = json.load(fileobj)
+    except IOError as exc:
+        if exc.errno == errno.ENOENT:
+            return None
+        raise
+    if not isinstance(state, dict) or \
+            state.get('format') not in (1, STATE_FORMAT):
+        raise ValueError('{0} is not an enrichment state.'.format(path))
+    return state.get('watermark')
+
+
+def save_state(path, watermark):
+    """Replace the state file with the watermark of a run."""
+    temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary, 'w') as fileobj:
+            json.dump({'format': STATE_FORMAT, 'watermark': watermark},
+                      fileobj, separators=(',', ':'))
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        os.rename(temporary, path)
+    except Exception:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def iter_changes(backend, labels, since=None, batch_size=1000):
+    """Yield the relation counts of the nodes whose relations changed.
+
+    :param since: the time from which the changes are read, in milliseconds,
+        or ``None`` to read the counts of every node.
+    :returns: an iterator of ``(label, key, counts)`` tuples, ``counts``
+        being a dictionary of the counts by name.
+    """
+    for label in labels:
+        for key, values in backend.iter_relation_counts(
+                label, batch_size=batch_size, since=since):
+            yield label, key, values
+
+
+def bulk_actions(changes, indexes, doc_types=None, resolve_ids=None):
+    """Return the bulk partial updates of the documents of changed records.
+
+    The actions are in the format of :func:`elasticsearch.helpers.bulk`.
+
+    :param changes: ``(label, key, counts)`` tuples.
+    :param indexes: the index of the documents of each label.
+    :param doc_types: the document type of each label, if any.
+    :param resolve_ids: a callable taking a label and a list of keys and
+        returning a dictionary of the document ids of the keys. Defaults to
+        the keys themselves. Records without a document are skipped.
+    """
+    keys = defaultdict(list)
+    for label, key, _ in changes:
+        keys[label].append(key)
+    ids = dict(
+        (label, resolve_ids(label, label_keys) if resolve_ids else
+         dict((key, key) for key in label_keys))
+        for label, label_keys in keys.items())
+
+    actions = []
+    for label, key, counts in changes:
+        id_ = ids[label].get(key)
+        if id_ is None:
+            continue
+        action = {
+            '_op_type': 'update',
+            '_index': indexes[label],
+            '_id': id_,
+            'doc': counts,
+        }
+        if doc_types and label in doc_types:
+            action['_type'] = doc_types[label]
+        actions.append(action)
+    return actions
+
+
+def bulk_body(actions):
+    """Return the body of a bulk API request sending actions."""
+    lines = []
+    for action in actions:
+        metadata = dict((name, value) for name, value in action.items()
+                        if name not in ('_op_type', 'doc'))
+        lines.append(json.dumps({action['_op_type']: metadata},
+                                sort_keys=True))
+        lines.append(json.dumps({'doc': action['doc']}, sort_keys=True))
+    return ''.join(line + '\n' for line in lines)
+
+
+def export_enrichment(backend, path, send, indexes, doc_types=None,
+                      resolve_ids=None, batch_size=1000, chunk_size=500,
+                      full=False, overlap=60, timer=time.time):
+    """Send the partial updates of the records whose relations changed.
+
+    :param path: the state file, or ``None`` to send the counts of every
+        record without keeping a state.
+    :param send: a callable sending a list of :func:`bulk_actions`.
+    :param indexes: the index of the documents of each label to update.
+    :param batch_size: the number of nodes whose counts are read at once.
+    :param chunk_size: the maximum number of actions sent at once.
+    :param full: whether to send the counts of every record, regardless of
+        the state.
+    :param overlap: the number of seconds before the watermark of the last
+        run from which the changes are read again.
+    :returns: a :class:`collections.Counter` of the ``literature`` and
+        ``authors`` whose relations changed, and of those ``unresolved`` to
+        a document.
+    """
+    watermark = int(timer() * 1000)
+    since = None if full or not path else load_state(path)
+    if since is not None:
+        since -= int(overlap * 1000)
+    changes = iter_changes(backend, sorted(indexes), since=since,
+                           batch_size=batch_size)
+    stats = Counter(dict((STATS[label], 0) for label in indexes))
+    stats.update(unresolved=0)
+    while True:
+        chunk = list(islice(changes, chunk_size))
+        if not chunk:
+            break
+        actions = bulk_actions(chunk, indexes, doc_types=doc_types,
+                               resolve_ids=resolve_ids)
+        if actions:
+            send(actions)
+        stats.update(STATS[label] for label, _, _ in chunk)
+        stats['unresolved'] += len(chunk) - len(actions)
+    if path:
+        save_state(path, watermark)
+    return stats
@@ -26,9 +26,37 @@
 
 from __future__ import absolute_import, print_function
 
+import atexit
+import logging
+
+from flask import current_app
 from flask_babelex import gettext as _
+from werkzeug.utils import import_string
 
+from . import config
+from .backends import load_backend
+from .cache import AccessLog, TieredCache, TTLCache
+from .disambiguation import stream_features
+from .enrichment import export_enrichment
+from .graph import GraphPool
+from .ingest import ingest
+from .profiling import QueryProfiler, operation
+from .query import RelationsQuery
+from .receivers import connect_receivers
+from .records import get_node
+from .resolver import ReferenceResolver
+from .snapshot import SnapshotReader, export_snapshot
+from .sync import apply_diff, diff_relations
+from .traversal import BOUNDS, traverse
 from .views import blueprint
+from .write_behind import QueueFull, WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+
+def _callable(value):
+    """Return a callable, or the one an import path points to."""
+    return import_string(value) if isinstance(value, str) else value
 
 
 class InspireRelations(object):
@@ -46,6 +74,37 @@ class InspireRelations(object):
     def init_app(self, app):
         """Flask application initialization."""
         self.init_config(app)
+        self.graph = GraphPool.from_config(app.config)
+        self.graph.profiler = QueryProfiler.from_config(app.config)
+        self.backend = load_backend(app.config, self.graph)
+        self.access_log = AccessLog.from_config(app.config)
+        if self.access_log is not None:
+            atexit.register(self.access_log.flush)
+        cache = TTLCache(
+            maxsize=app.config['INSPIRE_RELATIONS_CACHE_SIZE'],
+            ttl=app.config['INSPIRE_RELATIONS_CACHE_TTL'],
+        )
+        if app.config['INSPIRE_RELATIONS_REDIS_CACHE_URL']:
+            from .shared_cache import RedisCache
+            cache = TieredCache(cache, RedisCache.from_config(app.config))
+        self.query = RelationsQuery(
+            self.backend, cache,
+            snapshot=SnapshotReader.from_config(app.config),
+            access_log=self.access_log)
+        if self.access_log is not None and \
+                app.config['INSPIRE_RELATIONS_WARM_START']:
+            with app.app_context():
+                try:
+                    self.warm_cache()
+                except Exception:
+                    logger.exception('Can not warm the relations cache.')
+        self.write_behind = None
+        if app.config['INSPIRE_RELATIONS_WRITE_BEHIND']:
+            self.write_behind = WriteBehindQueue.from_config(
+                app.config, self.backend, on_written=self._written)
+            atexit.register(self.write_behind.close)
+        if app.config['INSPIRE_RELATIONS_SYNC_SIGNALS']:
+            connect_receivers()
         app.register_blueprint(blueprint)
         app.extensions['inspire-relations'] = self
 
@@ -55,3 +114,206 @@ class InspireRelations(object):
             "INSPIRE_RELATIONS_BASE_TEMPLATE",
             app.config.get("BASE_TEMPLATE",
                            "inspire_relations/base.html"))
+        for k in dir(config):
+            if k.startswith('INSPIRE_RELATIONS_'):
+                app.config.setdefault(k, getattr(config, k))
+
+    def ingest(self, records, batch_size=None, resolve=None):
+        """Write the nodes and relations of records to the graph.
+
+        See :func:`inspire_relations.ingest.ingest`; ``batch_size`` defaults
+        to ``INSPIRE_RELATIONS_INGEST_BATCH_SIZE``. References without
+        record are resolved if ``resolve``, which defaults to
+        ``INSPIRE_RELATIONS_RESOLVE_REFERENCES``.
+
+        :raises inspire_relations.schema.SchemaError: if the constraints
+            required by the ingestion are missing.
+        """
+        if current_app.config['INSPIRE_RELATIONS_SCHEMA_CHECK']:
+            self.backend.check_schema()
+        batch_size = batch_size or current_app.config[
+            'INSPIRE_RELATIONS_INGEST_BATCH_SIZE']
+        if resolve is None:
+            resolve = current_app.config[
+                'INSPIRE_RELATIONS_RESOLVE_REFERENCES']
+        resolver = None
+        if resolve:
+            resolver = ReferenceResolver(
+                processes=current_app.config[
+                    'INSPIRE_RELATIONS_RESOLVER_PROCESSES'],
+                chunk_size=current_app.config[
+                    'INSPIRE_RELATIONS_RESOLVER_CHUNK_SIZE'],
+                max_pending=current_app.config[
+                    'INSPIRE_RELATIONS_RESOLVER_MAX_PENDING'])
+        try:
+            with operation('ingest'):
+                return ingest(self.backend, records, batch_size=batch_size,
+                              resolver=resolver)
+        finally:
+            self.query.clear()
+
+    def warm_cache(self, limit=None):
+        """Cache the lookups most requested according to the access log.
+
+        See :meth:`inspire_relations.query.RelationsQuery.warm`; ``limit``
+        defaults to ``INSPIRE_RELATIONS_WARM_START``.
+
+        :returns: the number of results cached.
+        """
+        if self.access_log is None:
+            raise ValueError('No access log configured.')
+        config = current_app.config
+        keys = self.access_log.top(
+            limit or config['INSPIRE_RELATIONS_WARM_START'])
+        return self.query.warm(
+            keys, batch_size=config['INSPIRE_RELATIONS_MAX_BATCH_SIZE'])
+
+    def recompute_metrics(self, batch_size=None):
+        """Recompute the citation metrics materialized on the nodes.
+
+        See :meth:`inspire_relations.backends.GraphBackend.recompute_metrics`;
+        ``batch_size`` defaults to ``INSPIRE_RELATIONS_METRICS_BATCH_SIZE``.
+        """
+        batch_size = batch_size or current_app.config[
+            'INSPIRE_RELATIONS_METRICS_BATCH_SIZE']
+        with operation('recompute-metrics'):
+            return self.backend.recompute_metrics(batch_size=batch_size)
+
+    def compute_rankings(self, batch_size=None):
+        """Compute and store the rankings of the literature.
+
+        See :func:`inspire_relations.analytics.compute_rankings`, configured
+        by the ``INSPIRE_RELATIONS_RANKING_*`` settings; ``batch_size``
+        defaults to ``INSPIRE_RELATIONS_METRICS_BATCH_SIZE``.
+        """
+        from .analytics import compute_rankings
+        config = current_app.config
+        with operation('rankings'):
+            return compute_rankings(
+                self.backend,
+                batch_size=batch_size or config[
+                    'INSPIRE_RELATIONS_METRICS_BATCH_SIZE'],
+                damping=config['INSPIRE_RELATIONS_RANKING_DAMPING'],
+                decay=config['INSPIRE_RELATIONS_RANKING_DECAY'],
+                tol=config['INSPIRE_RELATIONS_RANKING_TOLERANCE'],
+                max_iter=config['INSPIRE_RELATIONS_RANKING_MAX_ITERATIONS'],
+            )
+
+    def compute_similar(self, full=False, batch_size=None):
+        """Compute and store the similar papers of the literature.
+
+        See :func:`inspire_relations.similarity.compute_similar`, configured
+        by the ``INSPIRE_RELATIONS_SIMILAR_*`` settings; ``batch_size``
+        defaults to ``INSPIRE_RELATIONS_METRICS_BATCH_SIZE``.
+        """
+        from .similarity import compute_similar
+        config = current_app.config
+        with operation('similar-papers'):
+            return compute_similar(
+                self.backend,
+                full=full,
+                limit=config['INSPIRE_RELATIONS_SIMILAR_LIMIT'],
+                batch_size=batch_size or config[
+                    'INSPIRE_RELATIONS_METRICS_BATCH_SIZE'],
+                block_size=config['INSPIRE_RELATIONS_SIMILAR_BLOCK_SIZE'],
+            )
+
+    def traverse(self, start, path, within=False, labels=None, **bounds):
+        """Traverse the graph from a start node along a path of hops.
+
+        See :func:`inspire_relations.traversal.traverse`. The bounds default
+        to the ``INSPIRE_RELATIONS_TRAVERSAL_*`` settings and can only be
+        lowered, a bound of ``None`` meaning the setting.
+        """
+        for name in BOUNDS:
+            ceiling = current_app.config[
+                'INSPIRE_RELATIONS_TRAVERSAL_' + name.upper()]
+            bound = bounds.get(name)
+            bounds[name] = ceiling if bound is None else min(bound, ceiling)
+        with operation('traversal'):
+            return traverse(self.backend, start, path, within=within,
+                            labels=labels, **bounds)
+
+    def candidate_features(self, blocks):
+        """Lazily yield the features of the candidates of signature blocks.
+
+        See :func:`inspire_relations.disambiguation.stream_features`,
+        configured by the ``INSPIRE_RELATIONS_DISAMBIGUATION_*`` settings.
+        """
+        config = current_app.config
+        return stream_features(
+            self.backend, blocks,
+            processes=config['INSPIRE_RELATIONS_DISAMBIGUATION_PROCESSES'],
+            chunk_size=config['INSPIRE_RELATIONS_DISAMBIGUATION_CHUNK_SIZE'],
+            max_neighbours=config[
+                'INSPIRE_RELATIONS_DISAMBIGUATION_MAX_NEIGHBOURS'],
+        )
+
+    def export_snapshot(self, path=None):
+        """Publish a citation snapshot of the backend.
+
+        See :func:`inspire_relations.snapshot.export_snapshot`; ``path``
+        defaults to ``INSPIRE_RELATIONS_SNAPSHOT``.
+
+        :returns: the version stamp of the snapshot.
+        """
+        path = path or current_app.config['INSPIRE_RELATIONS_SNAPSHOT']
+        if not path:
+            raise ValueError('No snapshot path configured.')
+        with operation('export-snapshot'):
+            return export_snapshot(self.backend, path)
+
+    def export_enrichment(self, send=None, full=False):
+        """Send the relation counts which changed to the search index.
+
+        See :func:`inspire_relations.enrichment.export_enrichment`,
+        configured by the ``INSPIRE_RELATIONS_ENRICHMENT_*`` settings;
+        ``send`` defaults to ``INSPIRE_RELATIONS_ENRICHMENT_SENDER``.
+        """
+        config = current_app.config
+        send = send or config['INSPIRE_RELATIONS_ENRICHMENT_SENDER']
+        if not send:
+            raise ValueError('No enrichment sender configured.')
+        resolve_ids = config['INSPIRE_RELATIONS_ENRICHMENT_ID_RESOLVER']
+        with operation('enrichment'):
+            return export_enrichment(
+                self.backend, config['INSPIRE_RELATIONS_ENRICHMENT_STATE'],
+                _callable(send),
+                config['INSPIRE_RELATIONS_ENRICHMENT_INDEXES'],
+                doc_types=config['INSPIRE_RELATIONS_ENRICHMENT_DOC_TYPES'],
+                resolve_ids=resolve_ids and _callable(resolve_ids),
+                batch_size=config['INSPIRE_RELATIONS_ENRICHMENT_BATCH_SIZE'],
+                chunk_size=config['INSPIRE_RELATIONS_ENRICHMENT_CHUNK_SIZE'],
+                full=full,
+                overlap=config['INSPIRE_RELATIONS_ENRICHMENT_OVERLAP'],
+            )
+
+    def sync_record(self, old, new):
+        """Write the relations that changed between two record versions.
+
+        With a write-behind queue, the change is buffered and written later,
+        unless the queue stays full in which case it is written inline.
+
+        :param old: the previous version, or ``None`` for a new record.
+        :param new: the new version, or ``None`` for a deleted record.
+        :returns: the applied :class:`inspire_relations.sync.RelationsDiff`,
+            or ``None`` if the change was buffered.
+        """
+        node = get_node(new or old or {})
+        if self.write_behind is not None and node is not None:
+            try:
+                self.write_behind.put((node.label, node.key), old, new)
+                return None
+            except QueueFull:
+                logger.warning('Writing relations of %s %s inline.',
+                               node.label, node.key)
+        diff = diff_relations(old, new)
+        with operation('sync-record'):
+            apply_diff(self.backend, diff)
+        self.query.invalidate(old, new)
+        return diff
+
+    def _written(self, changes):
+        """Invalidate the lookups affected by written record changes."""
+        for old, new in changes:
+            self.query.invalidate(old, new)
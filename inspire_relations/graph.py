@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Process-local connection pool to the graph database."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import threading
+from contextlib import contextmanager
+
+from werkzeug.utils import import_string
+
+
+class QueryTimeout(Exception):
+    """Raised when the server aborted a transaction past its timeout."""
+
+
+def _timed_out(error):
+    """Whether a driver error reports the timeout of the transaction."""
+    return str(getattr(error, 'code', '')).endswith(
+        '.Transaction.TransactionTimedOut')
+
+
+def neo4j_driver(uri, **options):
+    """Create a Neo4j driver, importing the client library on first use."""
+    from neo4j import GraphDatabase
+    return GraphDatabase.driver(uri, **options)
+
+
+class GraphPool(object):
+    """Lazily created, fork-safe pool of graph database connections.
+
+    The driver, which owns the actual connection pool, is only created on
+    first use and is created anew whenever the process id changes. Forked
+    workers therefore never share the sockets opened by their parent.
+    """
+
+    def __init__(self, uri, auth=None, max_pool_size=50, acquire_timeout=10,
+                 max_lifetime=3600, driver_factory=None, profiler=None):
+        """Initialize the pool without connecting.
+
+        :param profiler: a :class:`inspire_relations.profiling.QueryProfiler`
+            timing the queries, if any.
+        """
+        self.uri = uri
+        self.auth = auth
+        self.max_pool_size = max_pool_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        if isinstance(driver_factory, str):
+            driver_factory = import_string(driver_factory)
+        self.driver_factory = driver_factory or neo4j_driver
+        self.profiler = profiler
+        self._driver = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Pickle the settings only, connections are never shared.
+
+        The metrics of the profiler are not shared either.
+        """
+        state = self.__dict__.copy()
+        state.update(_driver=None, _pid=None, _lock=None, profiler=None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore the settings in a new process."""
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a pool from the ``INSPIRE_RELATIONS_GRAPH_*`` settings."""
+        return cls(
+            config['INSPIRE_RELATIONS_GRAPH_URI'],
+            auth=config['INSPIRE_RELATIONS_GRAPH_AUTH'],
+            max_pool_size=config['INSPIRE_RELATIONS_GRAPH_POOL_SIZE'],
+            acquire_timeout=config['INSPIRE_RELATIONS_GRAPH_ACQUIRE_TIMEOUT'],
+            max_lifetime=config[
+                'INSPIRE_RELATIONS_GRAPH_MAX_CONNECTION_LIFETIME'],
+            driver_factory=config['INSPIRE_RELATIONS_GRAPH_DRIVER_FACTORY'],
+        )
+
+    @property
+    def driver(self):
+        """Return the driver of the current process, creating it if needed."""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # A driver inherited through ``fork`` belongs to the
+                    # parent, closing it here would close the parent's
+                    # sockets, so it is simply forgotten.
+                    self._driver = self.driver_factory(
+                        self.uri,
+                        auth=self.auth,
+                        max_connection_pool_size=self.max_pool_size,
+                        connection_acquisition_timeout=self.acquire_timeout,
+                        max_connection_lifetime=self.max_lifetime,
+                    )
+                    self._pid = pid
+        return self._driver
+
+    @property
+    def connected(self):
+        """Whether the current process has already created its driver."""
+        return self._pid == os.getpid()
+
+    @contextmanager
+    def session(self):
+        """Borrow a session from the pool for the duration of the block."""
+        session = self.driver.session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    @contextmanager
+    def _profile(self, statements):
+        """Time the queries run in the block, if there is a profiler."""
+        if self.profiler is None:
+            yield
+        else:
+            with self.profiler.profile(self, statements):
+                yield
+
+    @contextmanager
+    def transaction(self, timeout=None):
+        """Run the block in a transaction, committed if no error is raised.
+
+        The transaction is timed as a single query.
+
+        :param timeout: the seconds after which the server aborts the
+            transaction, raising :class:`QueryTimeout`.
+        """
+        statements = []
+        options = {} if timeout is None else {'timeout': timeout}
+        with self._profile(statements), self.session() as session:
+            tx = session.begin_transaction(**options)
+            if self.profiler is not None:
+                tx = _RecordingTransaction(tx, statements)
+            try:
+                yield tx
+            except Exception as error:
+                if _timed_out(error):
+                    raise QueryTimeout(str(error))
+                tx.rollback()
+                raise
+            else:
+                tx.commit()
+
+    def run(self, statement, **parameters):
+        """Run a single statement and return its records as dictionaries."""
+        with self._profile([(statement, parameters)]), \
+                self.session() as session:
+            result = session.run(statement, parameters)
+            return [dict(record.items()) for record in result]
+
+    def run_many(self, statements):
+        """Run ``(statement, parameters)`` pairs in one transaction.
+
+        All the statements are run before any result is read. In an
+        explicit transaction, the driver only sends the buffered statements
+        when the first result is read, so that they travel together rather
+        than in a round trip each, as auto-commit statements would. The
+        transaction is timed as a single query.
+
+        :returns: the records of each statement, as lists of dictionaries.
+        """
+        with self.transaction() as tx:
+            results = [tx.run(statement, parameters)
+                       for statement, parameters in statements]
+            return [[dict(record.items()) for record in result]
+                    for result in results]
+
+    def stream(self, statement, **parameters):
+        """Run a statement and lazily yield its records as dictionaries.
+
+        The session is held, and the query timed, until the generator is
+        exhausted or closed.
+        """
+        with self._profile([(statement, parameters)]), \
+                self.session() as session:
+            for record in session.run(statement, parameters):
+                yield dict(record.items())
+
+    def explain(self, statement, parameters=None):
+        """Return the plan of a statement, without running it."""
+        with self.session() as session:
+            result = session.run('EXPLAIN ' + statement, parameters or {})
+            consume = getattr(result, 'consume', None) or result.summary
+            return consume().plan
+
+    def close(self):
+        """Close the driver owned by the current process, if any."""
+        with self._lock:
+            if self.connected:
+                self._driver.close()
+            self._driver = None
+            self._pid = None
+
+
+class _RecordingTransaction(object):
+    """Transaction recording its statements for the slow query log."""
+
+    def __init__(self, tx, statements):
+        self._tx = tx
+        self._statements = statements
+
+    def run(self, statement, parameters=None, **kwparameters):
+        self._statements.append(
+            (statement, dict(parameters or {}, **kwparameters)))
+        return self._tx.run(statement, parameters, **kwparameters)
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
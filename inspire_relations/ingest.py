@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Bulk ingestion of records into the relations graph.
+
+Records are consumed lazily and written in batches: the nodes and relations
+of each batch are grouped by label and type, and every group is written by
+a single parameterized ``UNWIND`` statement. Only one batch is held in
+memory at a time.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+from collections import Counter, defaultdict
+from itertools import islice
+
+from . import cypher
+from .profiling import operation
+from .records import get_node, get_relations
+
+
+def chunked(iterable, size):
+    """Yield lists of at most ``size`` consecutive items of ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_dump(lines):
+    """Yield the records of a JSON lines dump, skipping blank lines."""
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def prepare_batch(records):
+    """Group the nodes and relations of records by label and type.
+
+    :returns: a ``(nodes, relations)`` tuple. ``nodes`` maps every label
+        to the rows of its nodes, ``relations`` maps every
+        ``(type, start label, end label)`` triple to the rows of its
+        relations.
+    """
+    nodes = defaultdict(dict)
+    relations = []
+    for record in records:
+        node = get_node(record)
+        if node is None:
+            continue
+        nodes[node.label][node.key] = node.properties
+        relations.extend(get_relations(record))
+    nodes = dict(
+        (label, [{'key': key, 'properties': properties}
+                 for key, properties in rows.items()])
+        for label, rows in nodes.items()
+    )
+    return nodes, group_relations(relations)
+
+
+def group_relations(relations):
+    """Group relations by ``(type, start label, end label)`` into rows."""
+    groups = defaultdict(list)
+    for relation in relations:
+        group = (relation.type, relation.start[0], relation.end[0])
+        groups[group].append({
+            'start': relation.start[1],
+            'end': relation.end[1],
+            'properties': relation.properties,
+        })
+    return dict(groups)
+
+
+def write_batch(graph, nodes, relations):
+    """Write a prepared batch in a single transaction."""
+    with operation('ingest-batch'), graph.transaction() as tx:
+        for label, rows in sorted(nodes.items()):
+            tx.run(cypher.merge_nodes(label), {'rows': rows})
+        for (type_, start, end), rows in sorted(relations.items()):
+            tx.run(cypher.merge_relations(type_, start, end), {'rows': rows})
+
+
+def ingest(backend, records, batch_size=1000, resolver=None):
+    """Write the nodes and relations of records to the graph.
+
+    :param backend: the :class:`inspire_relations.backends.GraphBackend`
+        to write to.
+    :param records: an iterable of record JSON, consumed lazily.
+    :param batch_size: number of records written per transaction.
+    :param resolver: a :class:`inspire_relations.resolver.ReferenceResolver`
+        linking the references without record once all batches are
+        written, if any.
+    :returns: a :class:`collections.Counter` with the number of
+        ``records``, ``nodes``, ``relations`` and ``batches`` written, and
+        of references ``resolved`` with a resolver.
+    """
+    stats = Counter(records=0, nodes=0, relations=0, batches=0)
+    for chunk in chunked(records, batch_size):
+        nodes, relations = prepare_batch(chunk)
+        backend.write_batch(nodes, relations)
+        if resolver is not None:
+            resolver.collect(chunk)
+        stats['records'] += len(chunk)
+        stats['nodes'] += sum(len(rows) for rows in nodes.values())
+        stats['relations'] += sum(len(rows) for rows in relations.values())
+        stats['batches'] += 1
+    if resolver is not None:
+        with operation('resolve-references'):
+            stats['resolved'] = resolver.resolve(backend, batch_size)
+    return stats
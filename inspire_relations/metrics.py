@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Citation metrics materialized on the nodes of the graph.
+
+Literature nodes carry their ``citation_count``, their
+``citation_count_without_self_citations`` and a per year histogram of their
+citations in the aligned ``citation_years`` and ``citations_per_year``
+lists. The dated citations are also counted per month, in the aligned
+``citation_months`` and ``citations_per_month`` lists of ``YYYYMM``
+integers, and ``last_citation_month`` is the latest of these months, see
+:mod:`inspire_relations.temporal`. Author nodes carry the sum of the
+citation counts of their papers and their ``h_index``.
+
+These metrics are maintained incrementally whenever a citation is added or
+removed by a record change, see :func:`inspire_relations.cypher.add_relations`.
+Changes which are not citations, such as a new author of a paper, as well as
+bulk loads, are only accounted for by :func:`recompute_metrics`, which is
+meant to be run periodically.
+"""
+
+from __future__ import absolute_import, print_function
+
+from collections import Counter
+
+from . import cypher
+from .profiling import operation
+from .records import AUTHOR, LITERATURE
+
+
+def iter_keys(graph, label, batch_size):
+    """Yield the ids of all the nodes of a label, in sorted batches."""
+    after = -1
+    while True:
+        recids = [row['recid'] for row in graph.run(
+            cypher.NEXT_KEYS.format(label), after=after, limit=batch_size)]
+        if not recids:
+            return
+        yield recids
+        after = recids[-1]
+
+
+def recompute_metrics(graph, batch_size=1000):
+    """Recompute the citation metrics of all nodes from their relations.
+
+    The self-citation and same collaboration flags of the citations, then
+    the literature metrics and their monthly histograms and finally the
+    author metrics are recomputed, each in transactions of ``batch_size``
+    nodes.
+
+    :returns: a :class:`collections.Counter` with the number of
+        ``literature`` and ``authors`` nodes updated.
+    """
+    stats = Counter(literature=0, authors=0)
+    passes = [
+        (LITERATURE, cypher.RECOMPUTE_CITATION_FLAGS, None),
+        (LITERATURE, cypher.RECOMPUTE_LITERATURE_METRICS, 'literature'),
+        (LITERATURE, cypher.RECOMPUTE_CITATION_MONTHS, None),
+        (AUTHOR, cypher.RECOMPUTE_AUTHOR_METRICS, 'authors'),
+    ]
+    for label, statement, counter in passes:
+        for recids in iter_keys(graph, label, batch_size):
+            with operation('recompute-metrics'), \
+                    graph.transaction() as tx:
+                tx.run(statement, {'recids': recids})
+            if counter:
+                stats[counter] += len(recids)
+    return stats
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Timing of the graph queries, by logical operation.
+
+Code issuing graph queries tags them with the name of its logical operation,
+such as ``citations`` or ``ingest-batch``, with :func:`operation`. Every
+query run through a :class:`inspire_relations.graph.GraphPool` having a
+:class:`QueryProfiler` is timed and counted under:
+
+* its ``operation``, the innermost operation tag;
+* its ``source``, the endpoint of the request issuing it, or the outermost
+  operation tag outside of requests, e.g. the job running it.
+
+Queries slower than a threshold are logged with their plans, and the
+counters and histograms are rendered in the Prometheus text format by
+:meth:`QueryProfiler.render`.
+
+The metrics are kept in the memory of each process and only count the
+queries of the process answering the scrape. With several processes, such
+as the workers of a WSGI server, every process is to be scraped on its own,
+e.g. through a port of its own, and the series summed by the Prometheus
+queries, as the sums of the histograms of all processes are valid
+histograms.
+"""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""Default upper bounds, in seconds, of the query duration histogram."""
+
+UNTAGGED = 'other'
+"""Operation and source of the queries issued outside of any operation."""
+
+_tags = threading.local()
+
+
+def _stack():
+    if not hasattr(_tags, 'stack'):
+        _tags.stack = []
+    return _tags.stack
+
+
+@contextmanager
+def operation(name):
+    """Tag the graph queries issued in the block with an operation name."""
+    stack = _stack()
+    stack.append(name)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def iter_operation(name, iterable):
+    """Tag the graph queries issued while consuming an iterable.
+
+    Unlike a generator suspended in an :func:`operation` block, the tag is
+    only set while the next item is produced.
+    """
+    iterator = iter(iterable)
+    while True:
+        with operation(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def current_tags():
+    """Return the ``(operation, source)`` tags of the current queries."""
+    stack = _stack()
+    operation_ = stack[-1] if stack else UNTAGGED
+    if has_request_context() and request.endpoint:
+        return operation_, request.endpoint
+    return operation_, stack[0] if stack else UNTAGGED
+
+
+def format_plan(plan, depth=0):
+    """Return a query plan as indented lines of operators.
+
+    :param plan: the plan of a result summary of the Neo4j driver, as an
+        object or as a dictionary depending on its version.
+    """
+    if isinstance(plan, dict):
+        operator = plan.get('operatorType')
+        arguments = plan.get('args', {})
+        children = plan.get('children', [])
+    else:
+        operator = plan.operator_type
+        arguments = plan.arguments
+        children = plan.children
+    line = '  ' * depth + str(operator)
+    if 'EstimatedRows' in arguments:
+        line += ' (estimated rows: {0:g})'.format(arguments['EstimatedRows'])
+    lines = [line]
+    for child in children:
+        lines.extend(format_plan(child, depth + 1))
+    return lines
+
+
+def _sample(parameters):
+    """Return parameters with their lists cut to their first item.
+
+    The plan of a statement only depends on the types of its parameters, so
+    that explaining it does not need to send the rows of a batch again.
+    """
+    return dict(
+        (name, value[:1] if isinstance(value, (list, tuple)) else value)
+        for name, value in (parameters or {}).items())
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(value))
+                          for name, value in pairs) + '}'
+
+
+class QueryProfiler(object):
+    """Counters and histogram of the durations of the graph queries."""
+
+    NAMESPACE = 'inspire_relations_graph'
+    LABELS = ('operation', 'source')
+
+    def __init__(self, slow_threshold=None, explain=True, buckets=BUCKETS,
+                 timer=time.time):
+        """Initialize the profiler.
+
+        :param slow_threshold: seconds above which queries are logged with
+            their plans, or ``None`` to never log them.
+        :param explain: whether to fetch the plans of the slow queries.
+        :param buckets: the sorted upper bounds of the histogram buckets.
+        """
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.buckets = tuple(buckets)
+        self.timer = timer
+        self._durations = {}
+        self._errors = {}
+        self._slow = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a profiler, if ``INSPIRE_RELATIONS_PROFILING`` is set."""
+        if not config['INSPIRE_RELATIONS_PROFILING']:
+            return None
+        return cls(
+            slow_threshold=config['INSPIRE_RELATIONS_SLOW_QUERY_THRESHOLD'],
+            explain=config['INSPIRE_RELATIONS_SLOW_QUERY_PLANS'],
+            buckets=config['INSPIRE_RELATIONS_PROFILING_BUCKETS'],
+        )
+
+    @contextmanager
+    def profile(self, graph, statements):
+        """Time the queries run in the block.
+
+        :param graph: the :class:`inspire_relations.graph.GraphPool` used
+            to fetch the plans of slow queries.
+        :param statements: the list of ``(statement, parameters)`` pairs run
+            in the block, which may be filled while it runs.
+        """
+        tags = current_tags()
+        start = self.timer()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            seconds = self.timer() - start
+            self.observe(tags, seconds, failed=failed)
+        if self.slow_threshold is not None and \
+                seconds >= self.slow_threshold:
+            self._log_slow(graph, tags, seconds, statements)
+
+    def observe(self, tags, seconds, failed=False):
+        """Record the duration of a query."""
+        position = bisect_left(self.buckets, seconds)
+        slow = self.slow_threshold is not None and \
+            seconds >= self.slow_threshold
+        with self._lock:
+            counts = self._durations.get(tags)
+            if counts is None:
+                counts = self._durations[tags] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            counts[position] += 1
+            counts[-1] += seconds
+            if failed:
+                self._errors[tags] = self._errors.get(tags, 0) + 1
+            if slow:
+                self._slow[tags] = self._slow.get(tags, 0) + 1
+
+    def _log_slow(self, graph, tags, seconds, statements):
+        lines = ['Slow {0} graph query from {1} took {2:.3f}s.'.format(
+            tags[0], tags[1], seconds)]
+        seen = set()
+        for statement, parameters in statements:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            lines.append(statement)
+            if self.explain:
+                try:
+                    plan = graph.explain(statement, _sample(parameters))
+                except Exception:
+                    logger.exception('Can not explain %s.', statement)
+                    plan = None
+                if plan is not None:
+                    lines.extend(format_plan(plan, depth=1))
+        logger.warning('\n'.join(lines))
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            durations = sorted(
+                (tags, list(counts))
+                for tags, counts in self._durations.items())
+            errors = sorted(self._errors.items())
+            slow = sorted(self._slow.items())
+        name = self.NAMESPACE + '_query_duration_seconds'
+        lines = [
+            '# HELP {0} Duration of the graph queries.'.format(name),
+            '# TYPE {0} histogram'.format(name),
+        ]
+        for tags, counts in durations:
+            total = 0
+            bounds = ['{0:g}'.format(bound) for bound in self.buckets]
+            for bound, count in zip(bounds + ['+Inf'], counts):
+                total += count
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, _labels(self.LABELS, tags, [('le', bound)]),
+                    total))
+            lines.append('{0}_sum{1} {2!r}'.format(
+                name, _labels(self.LABELS, tags), counts[-1]))
+            lines.append('{0}_count{1} {2}'.format(
+                name, _labels(self.LABELS, tags), total))
+        for suffix, help_, values in [
+                ('query_errors_total', 'Graph queries which failed.',
+                 errors),
+                ('slow_queries_total',
+                 'Graph queries slower than the threshold.', slow)]:
+            name = '{0}_{1}'.format(self.NAMESPACE, suffix)
+            lines.append('# HELP {0} {1}'.format(name, help_))
+            lines.append('# TYPE {0} counter'.format(name))
+            for tags, count in values:
+                lines.append('{0}{1} {2}'.format(
+                    name, _labels(self.LABELS, tags), count))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cached lookups of the relations of records.
+
+Results are kept in a :class:`inspire_relations.cache.TTLCache`, possibly
+in front of a cache shared by the processes, see
+:mod:`inspire_relations.shared_cache`, and the
+entries affected by a record change are invalidated as soon as the change
+is written to the graph, see :func:`invalidated_keys`. A result read while
+its entry is invalidated is not cached, or dropped again if it was, as it
+may predate the change. Concurrent misses of
+the same lookup share a single backend query, and the lookups requested
+are counted in an :class:`inspire_relations.cache.AccessLog` if any, to
+warm the cache of the next processes, see :meth:`RelationsQuery.warm`.
+"""
+
+from __future__ import absolute_import, print_function
+
+import threading
+from collections import Counter
+
+from .backends import CITATION_FILTERS, LOOKUPS
+from .cache import MISSING, SingleFlight
+from .profiling import iter_operation, operation
+from .records import CITES, LITERATURE, SIMILAR, WRITTEN_BY, get_relations, \
+    normalize_date
+from .snapshot import SNAPSHOT_LOOKUPS
+from .temporal import between, per_year, since_month, to_month
+
+
+def _relation_properties(record):
+    if not record:
+        return {}
+    return dict((r[:3], r.properties) for r in get_relations(record))
+
+
+def invalidated_keys(old, new):
+    """Return the cache keys made stale by a change of a record.
+
+    Relations whose properties changed, such as the ``date`` of a citation,
+    are stale as well as the added and removed ones.
+    """
+    old_relations = _relation_properties(old)
+    new_relations = _relation_properties(new)
+    changed = set(old_relations) ^ set(new_relations)
+    changed.update(id_ for id_, properties in old_relations.items()
+                   if new_relations.get(id_, properties) != properties)
+    keys = set()
+    authors_changed = False
+    for type_, start, end in changed:
+        if type_ == CITES:
+            keys.update([
+                ('citation_count', end[1]),
+                ('citations', end[1]),
+                ('monthly_citations', end[1]),
+                ('references', start[1]),
+            ])
+        elif type_ == WRITTEN_BY:
+            authors_changed = True
+    if authors_changed:
+        for type_, _, end in set(old_relations) | set(new_relations):
+            if type_ == WRITTEN_BY:
+                keys.update([('author_papers', end[1]), ('coauthors', end[1])])
+    return keys
+
+
+class RelationsQuery(object):
+    """Lookups of the relations of records, cached by record id."""
+
+    def __init__(self, backend, cache, snapshot=None, access_log=None):
+        """Initialize the lookups.
+
+        :param backend: the :class:`inspire_relations.backends.GraphBackend`
+            to query.
+        :param cache: the :class:`inspire_relations.cache.TTLCache`, or
+            :class:`inspire_relations.cache.TieredCache`, to use.
+        :param snapshot: a :class:`inspire_relations.snapshot.SnapshotReader`
+            answering the citation lookups instead of the backend, without
+            caching, once a snapshot is published.
+        :param access_log: an :class:`inspire_relations.cache.AccessLog`
+            counting the cached lookups requested.
+        """
+        self.backend = backend
+        self.cache = cache
+        self.snapshot = snapshot
+        self.access_log = access_log
+        self.flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._cleared = 0
+        self._reading = Counter()
+        self._invalidated = {}
+
+    def _snapshot(self, name):
+        if self.snapshot is not None and name in SNAPSHOT_LOOKUPS:
+            return self.snapshot.current()
+
+    def _record(self, keys):
+        if self.access_log is not None:
+            self.access_log.record(keys)
+
+    def _stale(self, keys, generation):
+        """Return the keys invalidated since a generation."""
+        if self._cleared > generation:
+            return set(keys)
+        return set(key for key in keys
+                   if self._invalidated.get(key, generation) > generation)
+
+    def _read(self, keys, read):
+        """Read results from the backend and cache them, unless invalidated.
+
+        The keys are registered as being read, so that their invalidations
+        while the backend is queried are recorded with the generation they
+        happened in. Results invalidated before they are cached are skipped,
+        and those invalidated while being cached are deleted again.
+
+        :param read: a callable returning the ``(key, value)`` items read.
+        :returns: the items.
+        """
+        keys = list(keys)
+        with self._lock:
+            generation = self._generation
+            self._reading.update(keys)
+        try:
+            items = list(read())
+            with self._lock:
+                stale = self._stale(keys, generation)
+            self.cache.set_many(
+                (key, value) for key, value in items if key not in stale)
+            with self._lock:
+                late = self._stale(keys, generation) - stale
+        finally:
+            with self._lock:
+                self._reading.subtract(keys)
+                for key in keys:
+                    if self._reading[key] <= 0:
+                        del self._reading[key]
+                        self._invalidated.pop(key, None)
+        if late:
+            self.cache.delete_many(late)
+        return items
+
+    def _load(self, name, recid):
+        def read():
+            with operation(name):
+                return [((name, recid), self.backend.lookup(name, recid))]
+
+        return self._read([(name, recid)], read)[0][1]
+
+    def _lookup(self, name, recid):
+        snapshot = self._snapshot(name)
+        if snapshot is not None:
+            return snapshot.lookup(name, recid)
+        key = (name, recid)
+        self._record([key])
+        value = self.cache.get(key)
+        if value is MISSING:
+            value = self.flight.do(key, lambda: self._load(name, recid))
+        return value
+
+    def citation_count(self, recid):
+        """Return the number of records citing a literature record."""
+        return self._lookup('citation_count', recid)
+
+    def citations(self, recid):
+        """Return the ids of the records citing a literature record."""
+        return self._lookup('citations', recid)
+
+    def references(self, recid):
+        """Return the ids of the records cited by a literature record."""
+        return self._lookup('references', recid)
+
+    def coauthors(self, recid):
+        """Return the ids of the co-authors of an author."""
+        return self._lookup('coauthors', recid)
+
+    def author_papers(self, recid):
+        """Return the ids of the literature records of an author."""
+        return self._lookup('author_papers', recid)
+
+    def lookup_many(self, names, recids):
+        """Answer several lookups for many records at once.
+
+        Cached results are used, and only the missing ones are asked to the
+        backend, in a single call. Batches are not coalesced with concurrent
+        lookups.
+
+        :param names: the names of the lookups, e.g. ``['citation_count']``.
+        :param recids: the ids of the records.
+        :returns: a dictionary mapping every record id to a dictionary of
+            the results of each lookup.
+        """
+        results = dict((recid, {}) for recid in recids)
+        keys = []
+        for name in names:
+            snapshot = self._snapshot(name)
+            for recid in results:
+                if snapshot is not None:
+                    results[recid][name] = snapshot.lookup(name, recid)
+                else:
+                    keys.append((name, recid))
+        self._record(keys)
+        cached = self.cache.get_many(keys)
+        misses = {}
+        for name, recid in keys:
+            if (name, recid) in cached:
+                results[recid][name] = cached[(name, recid)]
+            else:
+                misses.setdefault(name, []).append(recid)
+        if misses:
+            def read():
+                with operation('batch-lookup'):
+                    answers = self.backend.lookup_many(misses)
+                return [((name, recid), value)
+                        for name, values in answers.items()
+                        for recid, value in values.items()]
+
+            for (name, recid), value in self._read(
+                    ((name, recid) for name, ids in misses.items()
+                     for recid in ids), read):
+                results[recid][name] = value
+        return results
+
+    def warm(self, keys, batch_size=250):
+        """Cache the results of lookups, e.g. the most requested ones.
+
+        Lookups answered by the snapshot or already cached are skipped, the
+        others are asked to the backend in batches of ``batch_size``
+        records.
+
+        :param keys: ``(name, recid)`` tuples, see
+            :meth:`inspire_relations.cache.AccessLog.top`.
+        :returns: the number of results cached.
+        """
+        keys = [(name, recid) for name, recid in keys
+                if name in LOOKUPS and self._snapshot(name) is None]
+        found = self.cache.get_many(keys)
+        recids = {}
+        for name, recid in keys:
+            if (name, recid) not in found:
+                recids.setdefault(name, []).append(recid)
+        cached = 0
+        for name, ids in sorted(recids.items()):
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+
+                def read(name=name, batch=batch):
+                    with operation('warm-cache'):
+                        answers = self.backend.lookup_many({name: batch})
+                    return [((name, recid), value) for recid, value
+                            in answers.get(name, {}).items()]
+
+                cached += len(self._read(
+                    ((name, recid) for recid in batch), read))
+        return cached
+
+    def citation_counts(self, recids):
+        """Return the number of citations of many literature records."""
+        return dict(
+            (recid, result['citation_count']) for recid, result
+            in self.lookup_many(['citation_count'], recids).items())
+
+    def page(self, name, recid, after=None, limit=25):
+        """Lazily yield a page of the ids returned by a lookup.
+
+        Pages are keyset paginated: the ids are sorted and ``after`` is the
+        last id of the previous page, so the backend never skips over the
+        previous pages. Pages are not cached.
+
+        :param name: the name of the lookup, e.g. ``'citations'``.
+        """
+        source = self._snapshot(name) or self.backend
+        return iter_operation(
+            name, source.page(name, recid, after=after, limit=limit))
+
+    def _check_filters(self, filters):
+        unknown = set(filters) - set(CITATION_FILTERS)
+        if unknown:
+            raise ValueError('Unknown citation filters {0}.'.format(
+                ', '.join(sorted(unknown))))
+        return tuple(sorted(filters))
+
+    def filtered_citations(self, recid, label=LITERATURE, filters=(),
+                           after=None, limit=25):
+        """Return a page of the records citing a paper or an author.
+
+        The filtering happens in the backend, see
+        :data:`inspire_relations.backends.CITATION_FILTERS`. Filtered
+        citations are not cached.
+
+        :raises ValueError: if a filter is unknown.
+        """
+        filters = self._check_filters(filters)
+        with operation('filtered-citations'):
+            return self.backend.filtered_citations(
+                label, recid, filters, after=after, limit=limit)
+
+    def filtered_citation_count(self, recid, label=LITERATURE, filters=()):
+        """Return the number of citations of a paper or an author, filtered.
+
+        :raises ValueError: if a filter is unknown.
+        """
+        filters = self._check_filters(filters)
+        with operation('filtered-citation-count'):
+            return self.backend.filtered_citation_count(label, recid, filters)
+
+    def literature_metrics(self, recid):
+        """Return the citation metrics of a literature record.
+
+        The histogram is returned as a ``citations_per_year`` dictionary.
+        Metrics are not cached.
+        """
+        with operation('literature-metrics'):
+            return self.backend.literature_metrics(recid)
+
+    def author_metrics(self, recid):
+        """Return the citation metrics of an author."""
+        with operation('author-metrics'):
+            return self.backend.author_metrics(recid)
+
+    def monthly_citations(self, recid):
+        """Return the number of dated citations of a paper per month.
+
+        :returns: a dictionary of the counts by ``YYYYMM`` month.
+        """
+        key = ('monthly_citations', recid)
+        value = self.cache.get(key)
+        if value is MISSING:
+            value = self.flight.do(
+                key, lambda: self._load_monthly_citations(recid))
+        return value
+
+    def _load_monthly_citations(self, recid):
+        def read():
+            with operation('monthly-citations'):
+                return [(('monthly_citations', recid),
+                         self.backend.monthly_citations_many(
+                             [recid]).get(recid, {}))]
+
+        return self._read([('monthly_citations', recid)], read)[0][1]
+
+    def citations_per_year(self, recid, start=None, end=None):
+        """Return the number of citations of a paper per year.
+
+        :param start: the first year counted, if any.
+        :param end: the last year counted, if any.
+        """
+        return per_year(self.monthly_citations(recid), start, end)
+
+    def citations_between(self, recid, start=None, end=None):
+        """Return the number of citations of a paper between two dates.
+
+        Citations are counted by month, the months of ``start`` and ``end``
+        being included.
+        """
+        return between(self.monthly_citations(recid),
+                       to_month(start), to_month(end))
+
+    def rising_papers(self, months=12, limit=25, today=None):
+        """Return the papers most cited in the last months.
+
+        :param months: the number of months counted, the current included.
+        :returns: a list of ``(recid, citations)`` tuples by decreasing
+            number of citations.
+        """
+        with operation('rising-papers'):
+            return self.backend.rising_papers(
+                since_month(months, today), limit=limit)
+
+    def affiliations_at(self, recid, date):
+        """Return the ids of the institutions of an author at a date.
+
+        :raises ValueError: if the date is invalid.
+        """
+        date = normalize_date(date)
+        if date is None:
+            raise ValueError('Invalid date.')
+        with operation('affiliations-at'):
+            return self.backend.affiliations_at(recid, date)
+
+    def similar(self, recid, limit=10):
+        """Return the papers most similar to a literature record.
+
+        The similar papers are precomputed, see
+        :mod:`inspire_relations.similarity`, and not cached.
+
+        :returns: a list of ``(recid, properties)`` tuples by decreasing
+            ``score``, with the ``score``, ``cocitations`` and ``couplings``
+            of each paper.
+        """
+        with operation('similar'):
+            return self.backend.ranked_neighbours(
+                SIMILAR, LITERATURE, LITERATURE, recid, 'score', limit=limit)
+
+    def invalidate(self, old, new):
+        """Drop the cached results made stale by a change of a record."""
+        self.invalidate_keys(invalidated_keys(old, new))
+
+    def invalidate_keys(self, keys):
+        """Drop cached results, and those being read, by ``(name, recid)``."""
+        keys = list(keys)
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if key in self._reading:
+                    self._invalidated[key] = self._generation
+        self.cache.delete_many(keys)
+
+    def clear(self):
+        """Drop all the cached results, and those being read."""
+        with self._lock:
+            self._generation += 1
+            self._cleared = self._generation
+        self.cache.clear()
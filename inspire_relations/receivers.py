@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Signal receivers keeping the graph in sync with Invenio records."""
+
+from __future__ import absolute_import, print_function
+
+from flask import g
+
+
+def _key(record):
+    return getattr(record, 'id', None) or id(record)
+
+
+def _pending():
+    if not hasattr(g, 'inspire_relations_pending'):
+        g.inspire_relations_pending = {}
+    return g.inspire_relations_pending
+
+
+def _stored_version(record):
+    """Return the version of a record currently stored in the database."""
+    model = getattr(record, 'model', None)
+    if model is None or not model.json:
+        return None
+    return dict(model.json)
+
+
+def stash_stored_version(sender, record=None, **kwargs):
+    """Remember the stored version of a record about to change."""
+    _pending()[_key(record)] = _stored_version(record)
+
+
+def sync_inserted(sender, record=None, **kwargs):
+    """Write the relations of a new record."""
+    sender.extensions['inspire-relations'].sync_record(None, record)
+
+
+def sync_updated(sender, record=None, **kwargs):
+    """Write the changed relations of an updated record."""
+    old = _pending().pop(_key(record), None)
+    sender.extensions['inspire-relations'].sync_record(old, record)
+
+
+def sync_deleted(sender, record=None, **kwargs):
+    """Remove the relations of a deleted record."""
+    old = _pending().pop(_key(record), None)
+    if old is None:
+        old = dict(record)
+    sender.extensions['inspire-relations'].sync_record(old, None)
+
+
+def connect_receivers():
+    """Connect the receivers to the Invenio-Records signals.
+
+    :returns: ``False`` if Invenio-Records is not installed.
+    """
+    try:
+        from invenio_records import signals
+    except ImportError:
+        return False
+    signals.after_record_insert.connect(sync_inserted, weak=False)
+    signals.before_record_update.connect(stash_stored_version, weak=False)
+    signals.after_record_update.connect(sync_updated, weak=False)
+    signals.before_record_delete.connect(stash_stored_version, weak=False)
+    signals.after_record_delete.connect(sync_deleted, weak=False)
+    return True
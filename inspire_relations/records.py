@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Extraction of graph nodes and relations from INSPIRE records."""
+
+from __future__ import absolute_import, print_function
+
+import re
+from collections import namedtuple
+
+LITERATURE = 'Literature'
+AUTHOR = 'Author'
+INSTITUTION = 'Institution'
+CONFERENCE = 'Conference'
+JOURNAL = 'Journal'
+EXPERIMENT = 'Experiment'
+COLLABORATION = 'Collaboration'
+
+CITES = 'CITES'
+WRITTEN_BY = 'WRITTEN_BY'
+AFFILIATED_WITH = 'AFFILIATED_WITH'
+PUBLISHED_IN = 'PUBLISHED_IN'
+PRESENTED_AT = 'PRESENTED_AT'
+BELONGS_TO = 'BELONGS_TO'
+IN_COLLABORATION = 'IN_COLLABORATION'
+SIMILAR = 'SIMILAR'
+
+NODE_KEYS = {
+    LITERATURE: 'recid',
+    AUTHOR: 'recid',
+    INSTITUTION: 'recid',
+    CONFERENCE: 'recid',
+    JOURNAL: 'recid',
+    EXPERIMENT: 'recid',
+    COLLABORATION: 'name',
+}
+"""Property uniquely identifying the nodes of each label."""
+
+SCHEMA_LABELS = {
+    'hep': LITERATURE,
+    'authors': AUTHOR,
+    'institutions': INSTITUTION,
+    'conferences': CONFERENCE,
+    'journals': JOURNAL,
+    'experiments': EXPERIMENT,
+}
+"""Node label of the records validated against each JSON schema."""
+
+Node = namedtuple('Node', ['label', 'key', 'properties'])
+"""A node, identified by its label and the value of its key property."""
+
+Relation = namedtuple('Relation', ['type', 'start', 'end', 'properties'])
+"""A directed relation between two ``(label, key)`` node identifiers."""
+
+
+def get_label(record):
+    """Return the node label of a record, based on its ``$schema``."""
+    schema = record.get('$schema', '')
+    if isinstance(schema, dict):
+        schema = schema.get('$ref', '')
+    name = schema.rsplit('/', 1)[-1]
+    if name.endswith('.json'):
+        name = name[:-len('.json')]
+    return SCHEMA_LABELS.get(name)
+
+
+def get_recid_from_ref(ref):
+    """Return the record id referenced by a ``{"$ref": ...}`` object."""
+    if not isinstance(ref, dict) or '$ref' not in ref:
+        return None
+    try:
+        return int(ref['$ref'].rstrip('/').rsplit('/', 1)[-1])
+    except ValueError:
+        return None
+
+
+def _get_recid(obj, field='record'):
+    """Return the record id an object links to, if any."""
+    recid = get_recid_from_ref(obj.get(field))
+    if recid is None and obj.get('recid') is not None:
+        try:
+            recid = int(obj['recid'])
+        except (TypeError, ValueError):
+            pass
+    return recid
+
+
+def _get_orcid(record):
+    """Return the ORCID of an author record."""
+    for id_ in record.get('ids', []):
+        if id_.get('schema') == 'ORCID':
+            return id_.get('value')
+
+
+def _year(date):
+    try:
+        return int(str(date)[:4])
+    except ValueError:
+        return None
+
+
+_DATE = re.compile(r'^(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?')
+
+
+def normalize_date(date):
+    """Return a ``YYYY-MM-DD`` date, or ``None``.
+
+    Partial dates, such as ``'2016-03'`` or the year ``2016``, are completed
+    with the first month and day.
+    """
+    match = _DATE.match(str(date or ''))
+    if not match:
+        return None
+    year, month, day = match.groups()
+    return '{0}-{1:02d}-{2:02d}'.format(
+        year, int(month or 1), int(day or 1))
+
+
+def get_year(record):
+    """Return the year of the earliest date of a literature record."""
+    dates = [record.get('earliest_date'), record.get('preprint_date')]
+    dates.extend(info.get('year')
+                 for info in record.get('publication_info', []))
+    dates.extend(imprint.get('date') for imprint in record.get('imprints', []))
+    years = [_year(date) for date in dates if date]
+    years = [year for year in years if year]
+    return min(years) if years else None
+
+
+IDENTIFIERS = ('arxiv_eprints', 'dois', 'pubnotes', 'report_numbers')
+"""Node properties listing the normalized identifiers of literature."""
+
+_DOI = re.compile(r'10\.\d{4,9}/\S+')
+_ARXIV = re.compile(
+    r'(?:arxiv:)?(\d{4}\.\d{4,5}|[a-z][a-z\-]+(?:\.[a-z]{2})?/\d{7})'
+    r'(?:v\d+)?', re.IGNORECASE)
+_NOT_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_doi(value):
+    """Return a DOI without resolver prefix and lower cased, or ``None``."""
+    match = _DOI.search(value or '')
+    return match.group(0).rstrip('.,;').lower() if match else None
+
+
+def normalize_arxiv(value):
+    """Return an arXiv eprint without prefix and version, or ``None``."""
+    match = _ARXIV.search(value or '')
+    return match.group(1).lower() if match else None
+
+
+def normalize_report_number(value):
+    """Return a report number in upper case, dash separated, or ``None``."""
+    parts = re.split(r'[\s_\-]+', (value or '').strip().upper())
+    return '-'.join(part for part in parts if part) or None
+
+
+def pubnote(journal, volume, page):
+    """Return the normalized ``journal:volume:page`` key of a pubnote.
+
+    Journals are compared without punctuation nor case, and only the first
+    page of a range is used. Returns ``None`` unless all parts are given.
+    """
+    page = str(page or '').split('-')[0]
+    parts = [_NOT_ALPHANUMERIC.sub('', str(part or '').lower())
+             for part in (journal, volume, page)]
+    return ':'.join(parts) if all(parts) else None
+
+
+def _unique(values):
+    return sorted(set(value for value in values if value))
+
+
+def get_date(record):
+    """Return the earliest date of a literature record, or ``None``."""
+    dates = [record.get('earliest_date'), record.get('preprint_date')]
+    dates.extend(info.get('year')
+                 for info in record.get('publication_info', []))
+    dates.extend(imprint.get('date') for imprint in record.get('imprints', []))
+    dates = [normalize_date(date) for date in dates]
+    dates = [date for date in dates if date]
+    return min(dates) if dates else None
+
+
+def get_identifiers(record):
+    """Return the normalized :data:`IDENTIFIERS` of a literature record.
+
+    :returns: a dictionary of the non empty sorted lists of identifiers.
+    """
+    identifiers = {
+        'dois': _unique(normalize_doi(doi.get('value'))
+                        for doi in record.get('dois', [])),
+        'arxiv_eprints': _unique(
+            normalize_arxiv(eprint.get('value'))
+            for eprint in record.get('arxiv_eprints', [])),
+        'report_numbers': _unique(
+            normalize_report_number(report.get('value'))
+            for report in record.get('report_numbers', [])),
+        'pubnotes': _unique(
+            pubnote(info.get('journal_title'), info.get('journal_volume'),
+                    info.get('page_start') or info.get('artid'))
+            for info in record.get('publication_info', [])),
+    }
+    return dict((name, values) for name, values in identifiers.items()
+                if values)
+
+
+def get_node(record):
+    """Return the node representing a record, or ``None``."""
+    label = get_label(record)
+    recid = record.get('control_number')
+    if label is None or recid is None:
+        return None
+    properties = {'recid': int(recid)}
+    if label == LITERATURE:
+        year = get_year(record)
+        if year:
+            properties['year'] = year
+        if record.get('refereed'):
+            properties['refereed'] = True
+        properties.update(get_identifiers(record))
+    elif label == AUTHOR:
+        orcid = _get_orcid(record)
+        if orcid:
+            properties['orcid'] = orcid
+    return Node(label, int(recid), properties)
+
+
+def _literature_relations(start, record):
+    """Yield the relations of a literature record.
+
+    Citations and affiliations are dated by the date of the record.
+    """
+    date = get_date(record)
+    dated = {'date': date} if date else {}
+    for reference in record.get('references', []):
+        recid = _get_recid(reference)
+        if recid is not None:
+            yield Relation(CITES, start, (LITERATURE, recid), dict(dated))
+
+    for author in record.get('authors', []):
+        recid = _get_recid(author)
+        if recid is not None:
+            yield Relation(WRITTEN_BY, start, (AUTHOR, recid), {})
+        for affiliation in author.get('affiliations', []):
+            recid = _get_recid(affiliation)
+            if recid is not None:
+                yield Relation(
+                    AFFILIATED_WITH, start, (INSTITUTION, recid),
+                    dict(dated))
+
+    for info in record.get('publication_info', []):
+        recid = get_recid_from_ref(info.get('journal_record'))
+        if recid is not None:
+            yield Relation(PUBLISHED_IN, start, (JOURNAL, recid), {})
+        recid = get_recid_from_ref(info.get('conference_record'))
+        if recid is not None:
+            yield Relation(PRESENTED_AT, start, (CONFERENCE, recid), {})
+
+    for experiment in record.get('accelerator_experiments', []):
+        recid = _get_recid(experiment)
+        if recid is not None:
+            yield Relation(BELONGS_TO, start, (EXPERIMENT, recid), {})
+
+    for collaboration in record.get('collaborations', []):
+        name = collaboration.get('value')
+        if name:
+            yield Relation(
+                IN_COLLABORATION, start, (COLLABORATION, name), {})
+
+
+def _author_relations(start, record):
+    """Yield the relations of an author record.
+
+    Affiliations carry the ``start_date`` and ``end_date`` of the position,
+    when known. Several positions at the same institution are covered by a
+    single period; current positions have no end.
+    """
+    periods = {}
+    institutions = []
+    for position in record.get('positions', []):
+        recid = _get_recid(position.get('institution', {}))
+        if recid is None:
+            continue
+        begin = normalize_date(position.get('start_date'))
+        end = None if position.get('current') else \
+            normalize_date(position.get('end_date'))
+        if recid in periods:
+            previous_begin, previous_end = periods[recid]
+            begin = min(begin, previous_begin) \
+                if begin and previous_begin else None
+            end = max(end, previous_end) if end and previous_end else None
+        else:
+            institutions.append(recid)
+        periods[recid] = (begin, end)
+    for recid in institutions:
+        begin, end = periods[recid]
+        properties = {}
+        if begin:
+            properties['start_date'] = begin
+        if end:
+            properties['end_date'] = end
+        yield Relation(
+            AFFILIATED_WITH, start, (INSTITUTION, recid), properties)
+
+
+_RELATION_EXTRACTORS = {
+    LITERATURE: _literature_relations,
+    AUTHOR: _author_relations,
+}
+
+
+def get_relations(record):
+    """Return the outgoing relations of a record, without duplicates."""
+    node = get_node(record)
+    if node is None or node.label not in _RELATION_EXTRACTORS:
+        return []
+    relations = []
+    seen = set()
+    extract = _RELATION_EXTRACTORS[node.label]
+    for relation in extract((node.label, node.key), record):
+        identifier = relation[:3]
+        if identifier not in seen:
+            seen.add(identifier)
+            relations.append(relation)
+    return relations
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Resolution of the references of literature not linked to a record.
+
+References harvested from publishers and arXiv often lack the link to the
+record they cite. They are matched against in-memory hash indexes of the
+normalized identifiers of all the literature in the graph: DOIs, arXiv
+eprints, report numbers and pubnotes, the latter combining the journal,
+volume and first page. Identifiers are read from the structured fields of
+a reference, and DOIs and arXiv eprints also from its raw strings. An
+identifier shared by several records is ambiguous and ignored.
+
+The references are collected while ingesting and resolved once every batch
+is written, so that they can be linked to the records of the same harvest.
+Past a number of collected references, they are spilled to a temporary
+file.
+Chunks of references are matched by a pool of worker processes, each of
+which receives the indexes once when it starts. Every link is written as a
+``CITES`` relation with a ``confidence`` property, see :data:`CONFIDENCE`.
+"""
+
+from __future__ import absolute_import, print_function
+
+import json
+import re
+import tempfile
+from collections import deque
+from multiprocessing import Pool, cpu_count
+
+from .ingest import chunked, group_relations
+from .records import CITES, IDENTIFIERS, LITERATURE, Relation, _get_recid, \
+    get_date, get_node, normalize_arxiv, normalize_doi, \
+    normalize_report_number, pubnote
+
+CONFIDENCE = {
+    'dois': 1.0,
+    'arxiv_eprints': 1.0,
+    'report_numbers': 0.9,
+    'pubnotes': 0.8,
+}
+"""Confidence of a link matched by each kind of identifier.
+
+Matches by several kinds of identifiers combine as independent evidence,
+so that a report number and a pubnote together give ``0.98``.
+"""
+
+_RAW_SEPARATORS = re.compile(r'[\s,;<>()\[\]]+')
+_RAW_ARXIV = re.compile(
+    r'^(?:arxiv:)?(\d\d(?:0[1-9]|1[0-2])\.\d{4,5}'
+    r'|[a-z][a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?$', re.IGNORECASE)
+
+
+def _raw_identifiers(values):
+    """Return the DOIs and arXiv eprints found in raw reference strings.
+
+    Only whole tokens with the month of an arXiv identifier are taken for
+    eprints, so that the paths of URLs or other numbers are not.
+    """
+    dois, eprints = set(), set()
+    for value in values:
+        for token in _RAW_SEPARATORS.split(value or ''):
+            doi = normalize_doi(token)
+            if doi:
+                dois.add(doi)
+                continue
+            match = _RAW_ARXIV.match(token.rstrip('.'))
+            if match:
+                eprints.add(match.group(1).lower())
+    return dois, eprints
+
+
+def get_reference_identifiers(reference):
+    """Return the normalized identifiers of a reference.
+
+    :returns: a dictionary of the non empty sets of identifiers, keyed as
+        :func:`inspire_relations.records.get_identifiers`.
+    """
+    fields = reference.get('reference', {})
+    dois, eprints = _raw_identifiers(
+        raw_ref.get('value') for raw_ref in reference.get('raw_refs', []))
+    dois.update(normalize_doi(doi) for doi in fields.get('dois', []))
+    eprints.add(normalize_arxiv(fields.get('arxiv_eprint')))
+    info = fields.get('publication_info', {})
+    identifiers = {
+        'dois': dois,
+        'arxiv_eprints': eprints,
+        'report_numbers': set(
+            normalize_report_number(report)
+            for report in fields.get('report_numbers', [])),
+        'pubnotes': set([pubnote(
+            info.get('journal_title'), info.get('journal_volume'),
+            info.get('page_start') or info.get('artid'))]),
+    }
+    for values in identifiers.values():
+        values.discard(None)
+    return dict((name, values) for name, values in identifiers.items()
+                if values)
+
+
+class ReferenceIndex(object):
+    """Hash indexes of the identifiers of literature records."""
+
+    def __init__(self):
+        """Initialize empty indexes."""
+        self.identifiers = dict((name, {}) for name in IDENTIFIERS)
+
+    @classmethod
+    def from_backend(cls, backend):
+        """Index the identifiers of all the literature of a backend."""
+        index = cls()
+        for recid, properties in backend.iter_nodes(LITERATURE, IDENTIFIERS):
+            index.add(recid, properties)
+        return index
+
+    def add(self, recid, identifiers):
+        """Index the identifiers of a record.
+
+        Identifiers already indexed for another record become ambiguous.
+        """
+        for name, values in identifiers.items():
+            index = self.identifiers[name]
+            for value in values or ():
+                index[value] = recid if index.get(value, recid) == recid \
+                    else None
+
+    def match(self, identifiers, exclude=None):
+        """Return the record matching identifiers the most confidently.
+
+        :param exclude: a record id never matched, such as the citing
+            record of a reference.
+        :returns: a ``(recid, confidence)`` tuple, or ``None`` when no
+            record or several records match with the same confidence.
+        """
+        doubts = {}
+        for name, values in identifiers.items():
+            for value in values:
+                recid = self.identifiers[name].get(value)
+                if recid is not None and recid != exclude:
+                    doubts.setdefault(recid, {})[name] = 1 - CONFIDENCE[name]
+        candidates = []
+        for recid, doubt in doubts.items():
+            confidence = 1.0
+            for value in doubt.values():
+                confidence *= value
+            candidates.append((round(1 - confidence, 3), recid))
+        candidates.sort(reverse=True)
+        if not candidates or (len(candidates) > 1 and
+                              candidates[0][0] == candidates[1][0]):
+            return None
+        confidence, recid = candidates[0]
+        return recid, confidence
+
+
+def resolve_chunk(index, references):
+    """Return the ``CITES`` relations of the references an index matches.
+
+    :param references: a list of ``(citing recid, identifiers, date)``
+        tuples, ``date`` being the date of the citing record or ``None``.
+    """
+    relations = {}
+    for citing, identifiers, date in references:
+        match = index.match(identifiers, exclude=citing)
+        if match is not None:
+            recid, confidence = match
+            key = (citing, recid)
+            if confidence > relations.get(key, {}).get('confidence', 0):
+                relations[key] = {'confidence': confidence}
+                if date:
+                    relations[key]['date'] = date
+    return [Relation(CITES, (LITERATURE, citing), (LITERATURE, recid),
+                     properties)
+            for (citing, recid), properties in sorted(relations.items())]
+
+
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+
+
+def _resolve_in_worker(references):
+    return resolve_chunk(_worker_index, references)
+
+
+def resolve_references(index, references, processes=None, chunk_size=1000):
+    """Lazily yield the relations of the references an index matches.
+
+    References are handed to the workers in chunks of ``chunk_size``, at
+    most two chunks per worker being pending at a time.
+
+    :param references: an iterable of the tuples of :func:`resolve_chunk`.
+    :param processes: the number of worker processes, defaults to the
+        number of CPUs. With ``1``, references are matched in the current
+        process.
+    """
+    chunks = chunked(references, chunk_size)
+    if processes == 1:
+        for chunk in chunks:
+            for relation in resolve_chunk(index, chunk):
+                yield relation
+        return
+
+    processes = processes or cpu_count()
+    pool = Pool(processes, _init_worker, (index,))
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_resolve_in_worker, (chunk,)))
+            if len(pending) >= 2 * processes:
+                for relation in pending.popleft().get():
+                    yield relation
+        while pending:
+            for relation in pending.popleft().get():
+                yield relation
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class ReferenceResolver(object):
+    """Collect the unresolved references of ingested records and link them.
+
+    Only the identifiers of the references are kept until they are
+    resolved, in memory up to ``max_pending`` of them and then spilled to a
+    temporary file, so that the references of a whole dump fit.
+    """
+
+    def __init__(self, processes=None, chunk_size=1000, max_pending=100000):
+        """Initialize the resolver.
+
+        :param processes: the number of worker processes matching the
+            references, see :func:`resolve_references`.
+        :param chunk_size: the number of references matched together.
+        :param max_pending: the number of references kept in memory.
+        """
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending
+        self.pending = []
+        self.spilled = 0
+        self._spill = None
+
+    def _spill_pending(self):
+        """Append the references held in memory to the temporary file."""
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(mode='w+')
+        for citing, identifiers, date in self.pending:
+            self._spill.write(json.dumps([citing, dict(
+                (name, sorted(values))
+                for name, values in identifiers.items()), date]) + '\n')
+        self.spilled += len(self.pending)
+        self.pending = []
+
+    def _iter_pending(self):
+        """Yield the spilled references, then those held in memory."""
+        if self._spill is not None:
+            self._spill.seek(0)
+            for line in self._spill:
+                yield tuple(json.loads(line))
+        for reference in self.pending:
+            yield reference
+
+    def collect(self, records):
+        """Collect the references of records without a linked record."""
+        for record in records:
+            node = get_node(record)
+            if node is None or node.label != LITERATURE:
+                continue
+            date = get_date(record)
+            for reference in record.get('references', []):
+                if _get_recid(reference) is not None:
+                    continue
+                identifiers = get_reference_identifiers(reference)
+                if identifiers:
+                    self.pending.append((node.key, identifiers, date))
+        if len(self.pending) >= self.max_pending:
+            self._spill_pending()
+
+    def resolve(self, backend, batch_size=1000):
+        """Write the relations of the collected references to a backend.
+
+        :returns: the number of relations written.
+        """
+        if not self.pending and self._spill is None:
+            return 0
+        index = ReferenceIndex.from_backend(backend)
+        resolved = resolve_references(
+            index, self._iter_pending(), processes=self.processes,
+            chunk_size=self.chunk_size)
+        written = 0
+        try:
+            for relations in chunked(resolved, batch_size):
+                backend.write_batch({}, group_relations(relations))
+                written += len(relations)
+        finally:
+            self.pending = []
+            self.spilled = 0
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+        return written
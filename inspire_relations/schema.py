@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Graph schema: constraints, indexes and migrations.
+
+Every node label has a uniqueness constraint on its key property, which also
+indexes it. Without them, every ``MERGE`` of the ingestion and every lookup
+by id scans all the nodes of a label, so ingestion refuses to run when they
+are missing or not online yet.
+
+Changes to the graph are applied by numbered :data:`MIGRATIONS`, the last
+applied one being recorded in a ``SchemaVersion`` node.
+"""
+
+from __future__ import absolute_import, print_function
+
+from collections import namedtuple
+
+from . import cypher
+from .records import AUTHOR, LITERATURE, NODE_KEYS
+
+Constraint = namedtuple('Constraint', ['label', 'property'])
+"""A uniqueness constraint on a property of the nodes of a label."""
+
+Index = namedtuple('Index', ['label', 'property'])
+"""An index on a property of the nodes of a label."""
+
+CONSTRAINTS = [Constraint(label, property_)
+               for label, property_ in sorted(NODE_KEYS.items())]
+"""Uniqueness constraints, required by the ingestion."""
+
+INDEXES = [Index(AUTHOR, 'orcid'), Index(LITERATURE, 'last_citation_month'),
+           Index(AUTHOR, 'relations_updated'),
+           Index(LITERATURE, 'relations_updated')]
+"""Additional indexes for lookups."""
+
+SCHEMA_NAME = 'inspire-relations'
+
+
+class SchemaError(Exception):
+    """Raised when required constraints are missing."""
+
+
+def get_schema_state(graph):
+    """Return the state of the existing indexes.
+
+    :returns: a dictionary mapping ``(label, property)`` to the state of its
+        index, e.g. ``'ONLINE'``. Constraints are reported through the
+        index backing them.
+    """
+    state = {}
+    for row in graph.run(cypher.INDEXES):
+        labels = row.get('labelsOrTypes') or row.get('tokenNames') or []
+        properties = row.get('properties') or []
+        if len(labels) == 1 and len(properties) == 1:
+            state[labels[0], properties[0]] = row.get('state')
+    return state
+
+
+def get_schema_report(graph):
+    """Return the state of every declared constraint and index.
+
+    :returns: a list of ``(definition, state)`` pairs, the state being
+        ``None`` for missing ones.
+    """
+    state = get_schema_state(graph)
+    return [(definition, state.get(tuple(definition)))
+            for definition in CONSTRAINTS + INDEXES]
+
+
+def check_schema(graph):
+    """Raise :class:`SchemaError` if a required constraint is not online."""
+    missing = [
+        '{0}.{1}'.format(*definition)
+        for definition, state in get_schema_report(graph)
+        if isinstance(definition, Constraint) and state != 'ONLINE'
+    ]
+    if missing:
+        raise SchemaError(
+            'Missing graph constraints on {0}, run "relations schema '
+            'migrate" first.'.format(', '.join(missing)))
+
+
+def create_schema(graph):
+    """Create the missing constraints and indexes.
+
+    :returns: the definitions that were created.
+    """
+    created = []
+    for definition, state in get_schema_report(graph):
+        if state is not None:
+            continue
+        if isinstance(definition, Constraint):
+            graph.run(cypher.create_constraint(*definition))
+        else:
+            graph.run(cypher.create_index(*definition))
+        created.append(definition)
+    return created
+
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply'])
+"""A change of the graph, ``apply`` being called with the graph pool."""
+
+MIGRATIONS = [
+    Migration(1, 'Create constraints and indexes', create_schema),
+    Migration(2, 'Index the month of the last citation of literature',
+              create_schema),
+    Migration(3, 'Index the time of the last change of relations',
+              create_schema),
+]
+"""Migrations, in the order they are applied."""
+
+
+def get_schema_version(graph):
+    """Return the version of the last applied migration, or 0."""
+    rows = graph.run(cypher.SCHEMA_VERSION, name=SCHEMA_NAME)
+    return rows[0]['version'] if rows else 0
+
+
+def migrate(graph, migrations=None):
+    """Apply the migrations that were not applied yet, in order.
+
+    The version is recorded after each migration, so that a failed
+    migration is retried on the next run.
+
+    :returns: the applied migrations.
+    """
+    current = get_schema_version(graph)
+    applied = []
+    for migration in sorted(migrations or MIGRATIONS,
+                            key=lambda migration: migration.version):
+        if migration.version <= current:
+            continue
+        migration.apply(graph)
+        graph.run(cypher.SET_SCHEMA_VERSION, name=SCHEMA_NAME,
+                  version=migration.version)
+        applied.append(migration)
+    return applied
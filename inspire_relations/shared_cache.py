@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Relation lookups cached in Redis, shared by all the processes.
+
+Values are serialized with msgpack, and every key carries the version of
+its record: invalidating the lookups of a record only increments its
+version counter, which makes all their entries unreachable at once without
+looking for them. Unreachable entries expire after the TTL. The version
+counters, and a generation counter incremented to clear the whole cache,
+are read along with the values, with one ``MGET`` for any number of keys.
+A value missed by a thread is then written under the versions read with
+the miss, so that a value loaded while its record changed is unreachable
+rather than served until it expires.
+
+Redis errors are logged and answered as misses, so that lookups fall back
+on the graph while Redis is unavailable.
+"""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import threading
+from collections import Counter
+
+import msgpack
+from redis import RedisError, StrictRedis
+from werkzeug.utils import import_string
+
+from .cache import MISSING
+
+logger = logging.getLogger(__name__)
+
+
+def redis_client(url):
+    """Create a Redis client, connecting on first use."""
+    return StrictRedis.from_url(url)
+
+
+def _pack(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _unpack(data):
+    return msgpack.unpackb(data, raw=False, use_list=False,
+                           strict_map_key=False)
+
+
+class RedisCache(object):
+    """Cache of ``(name, recid)`` lookup keys in Redis, see the module."""
+
+    def __init__(self, client, ttl=3600, prefix='inspire-relations'):
+        """Initialize the cache.
+
+        :param client: a :class:`redis.StrictRedis` client.
+        :param ttl: seconds after which the entries expire.
+        :param prefix: prefix of the Redis keys.
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._misses = threading.local()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a cache from the ``INSPIRE_RELATIONS_REDIS_*`` settings."""
+        factory = config['INSPIRE_RELATIONS_REDIS_CACHE_CLIENT_FACTORY']
+        if isinstance(factory, str):
+            factory = import_string(factory)
+        factory = factory or redis_client
+        return cls(
+            factory(config['INSPIRE_RELATIONS_REDIS_CACHE_URL']),
+            ttl=config['INSPIRE_RELATIONS_REDIS_CACHE_TTL'],
+            prefix=config['INSPIRE_RELATIONS_REDIS_CACHE_PREFIX'],
+        )
+
+    def _count(self, name, count=1):
+        with self._lock:
+            self.stats[name] += count
+
+    def _error(self, action):
+        self._count('errors')
+        logger.warning('Can not %s the relations cache in Redis.', action,
+                       exc_info=True)
+
+    def _generation_key(self):
+        return '{0}:generation'.format(self.prefix)
+
+    def _version_key(self, recid):
+        return '{0}:version:{1}'.format(self.prefix, recid)
+
+    def _keys(self, keys):
+        """Return the Redis keys of lookup keys at their current versions."""
+        recids = sorted(set(recid for _, recid in keys))
+        counters = self.client.mget(
+            [self._generation_key()] +
+            [self._version_key(recid) for recid in recids])
+        generation = int(counters[0] or 0)
+        versions = dict(zip(recids, (int(version or 0)
+                                     for version in counters[1:])))
+        return ['{0}:{1}:{2}:{3}:{4}'.format(
+            self.prefix, generation, name, recid, versions[recid])
+            for name, recid in keys]
+
+    def get(self, key):
+        """Return the value of a key, or :data:`MISSING`."""
+        return self.get_many([key]).get(key, MISSING)
+
+    def get_many(self, keys):
+        """Return a dictionary of the values of the cached keys."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        self._misses.keys = {}
+        try:
+            redis_keys = self._keys(keys)
+            data = self.client.mget(redis_keys)
+        except RedisError:
+            self._error('read')
+            return {}
+        values = {}
+        for key, redis_key, item in zip(keys, redis_keys, data):
+            if item is None:
+                self._misses.keys[key] = redis_key
+            else:
+                values[key] = _unpack(item)
+        self._count('hits', len(values))
+        self._count('misses', len(keys) - len(values))
+        return values
+
+    def set(self, key, value):
+        """Cache a value."""
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Cache the values of ``(key, value)`` items, in one pipeline.
+
+        The keys last missed by the thread are written under the versions
+        read then, the others under the current versions.
+        """
+        items = list(items)
+        if not items:
+            return
+        missed = getattr(self._misses, 'keys', {})
+        try:
+            unknown = [key for key, _ in items if key not in missed]
+            redis_keys = dict(zip(unknown, self._keys(unknown))) \
+                if unknown else {}
+            pipeline = self.client.pipeline(transaction=False)
+            for key, value in items:
+                redis_key = missed.pop(key, None) or redis_keys[key]
+                pipeline.set(redis_key, _pack(value), ex=self.ttl)
+            pipeline.execute()
+        except RedisError:
+            self._error('write')
+
+    def delete_many(self, keys):
+        """Make the entries of the records of keys unreachable.
+
+        All the lookups of these records are invalidated, whatever their
+        name.
+        """
+        recids = set(recid for _, recid in keys)
+        if not recids:
+            return
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for recid in recids:
+                pipeline.incr(self._version_key(recid))
+            pipeline.execute()
+        except RedisError:
+            self._error('invalidate')
+            return
+        self._count('invalidations', len(recids))
+
+    def clear(self):
+        """Make all the entries unreachable."""
+        try:
+            self.client.incr(self._generation_key())
+        except RedisError:
+            self._error('clear')
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Similar papers, by co-citation and bibliographic coupling.
+
+Two papers are co-cited when a third paper cites both, and coupled when
+they cite a common paper. With the citation matrix ``A`` of a
+:class:`inspire_relations.analytics.CitationGraph`, the co-citation counts
+of all pairs are the sparse product ``Aᵀ·A`` and the coupling counts
+``A·Aᵀ``. Both counts are normalized by the cosine of the two papers, so
+that papers with thousands of citations or references do not dominate, and
+summed into the ``score`` of the pair.
+
+The products are computed a block of rows at a time and only the ``limit``
+best scores of each row are kept, as weighted ``SIMILAR`` relations, so
+that the similar papers of a record are read with a single indexed query
+instead of two-hop fan-outs over hub papers.
+
+A digest of the references and citations of every paper is stored on its
+node. A refresh only recomputes the rows of the papers whose digest
+changed and of the papers within two hops of them: their direct
+neighbours, whose counts can change, and the papers co-cited with or
+coupled to them, whose scores change with the cosine norms of the changed
+papers. The rows of hub papers reach most of the graph in two hops, so a
+refresh after many changes can cost as much as a full computation.
+
+Requires NumPy and SciPy, installed with the ``analytics`` extra.
+"""
+
+from __future__ import absolute_import, print_function
+
+import zlib
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from .analytics import load_citation_graph
+from .ingest import chunked, group_relations
+from .records import LITERATURE, SIMILAR, Relation
+
+DIGEST = 'similarity_digest'
+"""Property of the literature nodes with the digest of their relations."""
+
+
+def _cosine(counts):
+    """Return the inverse square roots of counts, zero for empty rows."""
+    counts = np.asarray(counts, dtype=np.float64).ravel()
+    norms = np.zeros(len(counts))
+    norms[counts > 0] = 1 / np.sqrt(counts[counts > 0])
+    return norms
+
+
+def _scaled(matrix, rows, columns):
+    """Return ``diag(rows)·matrix·diag(columns)`` as a CSR matrix."""
+    return sparse.diags(rows).dot(matrix).dot(sparse.diags(columns)).tocsr()
+
+
+def _row_values(matrix, row, columns):
+    """Return the values of sorted CSR matrix row at columns, or zero."""
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    indices = matrix.indices[start:end]
+    positions = np.searchsorted(indices, columns)
+    found = positions < len(indices)
+    found[found] = indices[positions[found]] == columns[found]
+    values = np.zeros(len(columns))
+    values[found] = matrix.data[start:end][positions[found]]
+    return values
+
+
+def top_similar(graph, positions=None, limit=10, block_size=1000):
+    """Yield the papers most similar to papers of a citation graph.
+
+    :param graph: a :class:`inspire_relations.analytics.CitationGraph`.
+    :param positions: the positions in ``graph.recids`` of the papers,
+        defaults to all.
+    :param limit: the number of similar papers kept per paper.
+    :param block_size: the number of rows of the matrix products computed
+        at once, bounding memory use.
+    :returns: an iterator of ``(recid, similar)`` tuples, ``similar`` being
+        a list of ``(recid, score, cocitations, couplings)`` tuples by
+        decreasing score.
+    """
+    matrix = graph.matrix.tocsr()
+    transposed = matrix.T.tocsr()
+    citations = _cosine(transposed.sum(axis=1))
+    references = _cosine(matrix.sum(axis=1))
+    if positions is None:
+        positions = np.arange(len(graph.recids))
+    positions = np.asarray(positions, dtype=np.int64)
+
+    for start in range(0, len(positions), block_size):
+        block = positions[start:start + block_size]
+        cocitations = transposed[block].dot(matrix).tocsr()
+        couplings = matrix[block].dot(transposed).tocsr()
+        for counts in (cocitations, couplings):
+            counts.sum_duplicates()
+            counts.sort_indices()
+        scores = _scaled(cocitations, citations[block], citations) + \
+            _scaled(couplings, references[block], references)
+        scores = scores.tocsr()
+        for row, position in enumerate(block):
+            begin, end = scores.indptr[row], scores.indptr[row + 1]
+            columns = scores.indices[begin:end]
+            values = scores.data[begin:end]
+            keep = (columns != position) & (values > 0)
+            columns, values = columns[keep], values[keep]
+            if len(values) > limit:
+                best = np.argpartition(-values, limit - 1)[:limit]
+                columns, values = columns[best], values[best]
+            order = np.lexsort((graph.recids[columns], -values))
+            columns, values = columns[order], values[order]
+            similar = zip(
+                graph.recids[columns].tolist(), values.tolist(),
+                _row_values(cocitations, row, columns).tolist(),
+                _row_values(couplings, row, columns).tolist())
+            yield int(graph.recids[position]), [
+                (recid, round(score, 6), int(cocited), int(coupled))
+                for recid, score, cocited, coupled in similar]
+
+
+def digests(graph):
+    """Return the digest of the references and citations of every paper."""
+    matrix = graph.matrix.tocsr()
+    transposed = matrix.T.tocsr()
+    matrix.sort_indices()
+    transposed.sort_indices()
+    cited = graph.recids[matrix.indices]
+    citing = graph.recids[transposed.indices]
+    result = np.zeros(len(graph.recids), dtype=np.int64)
+    for position in range(len(graph.recids)):
+        digest = zlib.crc32(cited[
+            matrix.indptr[position]:matrix.indptr[position + 1]].tobytes())
+        digest = zlib.crc32(citing[
+            transposed.indptr[position]:transposed.indptr[position + 1]
+        ].tobytes(), digest)
+        result[position] = digest & 0xffffffff
+    return result
+
+
+def changed_positions(backend, graph, current):
+    """Return the positions of the papers whose similarities may change.
+
+    These are the papers whose digest changed, their references and
+    citations, and the papers sharing a citing or a cited paper with them.
+
+    :param current: the :func:`digests` of the papers of ``graph``.
+    """
+    stored = dict(backend.iter_nodes(LITERATURE, [DIGEST]))
+    changed = np.array([
+        stored.get(int(recid), {}).get(DIGEST) != digest
+        for recid, digest in zip(graph.recids, current)], dtype=bool)
+    changed = np.flatnonzero(changed)
+    matrix = graph.matrix.tocsr()
+    transposed = matrix.T.tocsr()
+    references = np.unique(matrix[changed].indices)
+    citations = np.unique(transposed[changed].indices)
+    neighbours = [changed, references, citations,
+                  matrix[citations].indices, transposed[references].indices]
+    return np.unique(np.concatenate(neighbours))
+
+
+def _groups(relations):
+    """Return relations as the ``[type, start, end, rows]`` of changes."""
+    return [list(group) + [rows]
+            for group, rows in sorted(group_relations(relations).items())]
+
+
+def write_similar(backend, graph, similar, current, batch_size=1000):
+    """Replace the ``SIMILAR`` relations of papers, in batches.
+
+    :param similar: an iterable of the tuples of :func:`top_similar`.
+    :param current: the :func:`digests` of the papers of ``graph``, stored
+        on the nodes of the papers written.
+    :returns: a :class:`collections.Counter` with the number of
+        ``literature`` nodes and ``similar`` relations written.
+    """
+    stats = Counter(literature=0, similar=0)
+    for batch in chunked(similar, batch_size):
+        recids = [recid for recid, _ in batch]
+        previous = backend.neighbours_many(
+            SIMILAR, LITERATURE, LITERATURE, recids)
+        removed = [
+            Relation(SIMILAR, (LITERATURE, recid), (LITERATURE, other), {})
+            for recid in recids for other in previous.get(recid, ())]
+        added = [
+            Relation(SIMILAR, (LITERATURE, recid), (LITERATURE, other), {
+                'score': score,
+                'cocitations': cocitations,
+                'couplings': couplings,
+            })
+            for recid, rows in batch
+            for other, score, cocitations, couplings in rows]
+        positions = np.searchsorted(graph.recids, recids)
+        backend.write_changes({
+            'nodes': {LITERATURE: [
+                {'key': recid, 'properties': {DIGEST: int(digest)}}
+                for recid, digest in zip(recids, current[positions])]},
+            'removed': _groups(removed),
+            'added': _groups(added),
+        })
+        stats['literature'] += len(batch)
+        stats['similar'] += len(added)
+    return stats
+
+
+def compute_similar(backend, full=False, limit=10, batch_size=1000,
+                    block_size=1000):
+    """Compute and store the papers most similar to every paper.
+
+    :param full: recompute the similar papers of all papers, rather than
+        of those whose references or citations changed since the last run.
+    :returns: the :class:`collections.Counter` of :func:`write_similar`.
+    """
+    graph = load_citation_graph(backend)
+    current = digests(graph)
+    positions = None if full else changed_positions(backend, graph, current)
+    similar = top_similar(graph, positions=positions, limit=limit,
+                          block_size=block_size)
+    return write_similar(backend, graph, similar, current,
+                         batch_size=batch_size)
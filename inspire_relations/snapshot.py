@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Read-only binary snapshots of the citation graph.
+
+The hottest lookups, the citations and references of a record, can be
+answered from a snapshot file instead of the backend. The file is opened
+with :mod:`mmap`, so every process of a host shares one copy of it in the
+page cache and opening it costs nothing.
+
+A snapshot is a little-endian file made of a header followed by arrays:
+
+* the header: the ``IRCS`` magic, the format, the version stamp, and the
+  number of records and of citations;
+* the sorted ids of the records, as 64-bit integers;
+* the offsets of the references of every record in the next array, as
+  64-bit integers, and the positions of the cited records in the sorted
+  ids, as 32-bit integers;
+* the same offsets and positions for the citations of every record.
+
+Snapshots are exported periodically by :func:`export_snapshot`, which
+publishes a new file by renaming it over the previous one. A
+:class:`SnapshotReader` notices the new file and switches to it
+atomically, while lookups in flight finish on the previous one.
+"""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+
+from .records import CITES, LITERATURE
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'IRCS'
+FORMAT = 1
+HEADER = struct.Struct('<4sIQQQ')
+"""Magic, format, version stamp, number of records, number of citations."""
+
+SNAPSHOT_LOOKUPS = ('citation_count', 'citations', 'references')
+"""Names of the lookups answered by a snapshot."""
+
+_CHUNK_SIZE = 65536
+
+
+def _write_array(fileobj, code, values):
+    """Write values as little-endian integers of a struct format code."""
+    for start in range(0, len(values), _CHUNK_SIZE):
+        chunk = values[start:start + _CHUNK_SIZE]
+        fileobj.write(struct.pack('<{0}{1}'.format(len(chunk), code), *chunk))
+
+
+def _rows(size, sources, targets, index):
+    """Return the offsets and positions of the neighbours of every record."""
+    order = sorted(range(len(sources)),
+                   key=lambda i: (sources[i], targets[i]))
+    offsets = array('l', [0]) * (size + 1)
+    for source in sources:
+        offsets[index[source] + 1] += 1
+    for position in range(size):
+        offsets[position + 1] += offsets[position]
+    return offsets, array('L', (index[targets[i]] for i in order))
+
+
+def write_snapshot(path, citations, version=None):
+    """Write and publish a snapshot of citations.
+
+    The snapshot is written next to ``path`` and renamed over it once
+    complete, so that readers never see a partial file.
+
+    :param citations: an iterable of distinct ``(citing, cited)`` record id
+        pairs.
+    :param version: the version stamp, defaults to the current time in
+        milliseconds.
+    :returns: the version stamp.
+    """
+    if version is None:
+        version = int(time.time() * 1000)
+    citing = array('l')
+    cited = array('l')
+    for start, end in citations:
+        citing.append(start)
+        cited.append(end)
+    recids = sorted(set(citing) | set(cited))
+    index = dict((recid, position) for position, recid in enumerate(recids))
+    out_offsets, out_targets = _rows(len(recids), citing, cited, index)
+    in_offsets, in_targets = _rows(len(recids), cited, citing, index)
+
+    temporary = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary, 'wb') as fileobj:
+            fileobj.write(HEADER.pack(
+                MAGIC, FORMAT, version, len(recids), len(citing)))
+            _write_array(fileobj, 'q', recids)
+            _write_array(fileobj, 'q', out_offsets)
+            _write_array(fileobj, 'I', out_targets)
+            _write_array(fileobj, 'q', in_offsets)
+            _write_array(fileobj, 'I', in_targets)
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        os.rename(temporary, path)
+    except Exception:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return version
+
+
+def export_snapshot(backend, path, version=None):
+    """Write and publish a snapshot of the citations held by a backend.
+
+    :returns: the version stamp.
+    """
+    return write_snapshot(
+        path, backend.iter_relations(CITES, LITERATURE, LITERATURE),
+        version=version)
+
+
+class Snapshot(object):
+    """A snapshot file mapped in memory."""
+
+    def __init__(self, path):
+        """Map a snapshot file.
+
+        :raises ValueError: if the file is not a snapshot.
+        """
+        with open(path, 'rb') as fileobj:
+            stat = os.fstat(fileobj.fileno())
+            self.identity = (stat.st_dev, stat.st_ino, stat.st_mtime)
+            self._buffer = mmap.mmap(
+                fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buffer) < HEADER.size:
+            raise ValueError('{0} is not a snapshot.'.format(path))
+        magic, format_, self.version, self.size, self.citations = \
+            HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or format_ != FORMAT:
+            raise ValueError('{0} is not a snapshot.'.format(path))
+        self._recids = HEADER.size
+        self._out_offsets = self._recids + 8 * self.size
+        self._out_targets = self._out_offsets + 8 * (self.size + 1)
+        self._in_offsets = self._out_targets + 4 * self.citations
+        self._in_targets = self._in_offsets + 8 * (self.size + 1)
+
+    def _recid(self, position):
+        return struct.unpack_from(
+            '<q', self._buffer, self._recids + 8 * position)[0]
+
+    def _position(self, recid):
+        """Return the position of a record id, or ``None``."""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self._recid(middle) < recid:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.size and self._recid(low) == recid:
+            return low
+        return None
+
+    def _row(self, name, recid):
+        """Return the positions of the records cited by or citing a record."""
+        position = self._position(recid)
+        if position is None:
+            return ()
+        if name == 'references':
+            offsets, targets = self._out_offsets, self._out_targets
+        else:
+            offsets, targets = self._in_offsets, self._in_targets
+        start, end = struct.unpack_from(
+            '<2q', self._buffer, offsets + 8 * position)
+        return struct.unpack_from(
+            '<{0}I'.format(end - start), self._buffer, targets + 4 * start)
+
+    def lookup(self, name, recid):
+        """Answer one of the :data:`SNAPSHOT_LOOKUPS` for a record."""
+        row = self._row(name, recid)
+        if name == 'citation_count':
+            return len(row)
+        return tuple(self._recid(position) for position in row)
+
+    def page(self, name, recid, after=None, limit=25):
+        """Yield the ids of a lookup following ``after``, in order."""
+        recids = self.lookup(name, recid)
+        start = 0 if after is None else bisect_right(recids, after)
+        for recid in recids[start:start + limit]:
+            yield recid
+
+    def close(self):
+        """Unmap the file."""
+        self._buffer.close()
+
+
+class SnapshotReader(object):
+    """The latest snapshot published at a path.
+
+    The path is checked for a new snapshot at most every ``check_interval``
+    seconds. Switching to it only replaces a reference, so lookups never
+    see a mix of two snapshots; the previous mapping is released once no
+    lookup uses it anymore.
+    """
+
+    def __init__(self, path, check_interval=10.0, timer=time.time):
+        """Initialize the reader, the snapshot is mapped on first use."""
+        self.path = path
+        self.check_interval = check_interval
+        self.timer = timer
+        self._snapshot = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Create a reader of ``INSPIRE_RELATIONS_SNAPSHOT``, if set."""
+        path = config['INSPIRE_RELATIONS_SNAPSHOT']
+        if not path:
+            return None
+        return cls(path, check_interval=config[
+            'INSPIRE_RELATIONS_SNAPSHOT_CHECK_INTERVAL'])
+
+    @property
+    def version(self):
+        """Return the version stamp of the current snapshot, or ``None``."""
+        snapshot = self.current()
+        return snapshot.version if snapshot is not None else None
+
+    def current(self):
+        """Return the current :class:`Snapshot`, or ``None``."""
+        now = self.timer()
+        if self._checked is None or now - self._checked >= \
+                self.check_interval:
+            with self._lock:
+                if self._checked is None or now - self._checked >= \
+                        self.check_interval:
+                    self._checked = now
+                    self._switch()
+        return self._snapshot
+
+    def _switch(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        identity = (stat.st_dev, stat.st_ino, stat.st_mtime)
+        if self._snapshot is not None and \
+                self._snapshot.identity == identity:
+            return
+        try:
+            self._snapshot = Snapshot(self.path)
+        except (IOError, OSError, ValueError):
+            logger.exception('Can not map the snapshot %s.', self.path)
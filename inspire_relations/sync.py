@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Incremental synchronization of the relations of a changed record.
+
+Instead of rewriting all the relations of a record whenever it changes, the
+relations of its previous and new versions are compared and only the
+difference is written. Unchanged relations, and the nodes at their other
+end, are not touched and therefore not locked.
+"""
+
+from __future__ import absolute_import, print_function
+
+import time
+from collections import defaultdict, namedtuple
+
+from . import cypher
+from .ingest import group_relations
+from .profiling import operation
+from .records import AUTHOR, CITES, LITERATURE, WRITTEN_BY, get_node, \
+    get_relations
+
+RelationsDiff = namedtuple('RelationsDiff', ['node', 'added', 'removed'])
+"""Changes between two versions of a record.
+
+``node`` is the node of the new version if its properties changed, ``added``
+the relations to create or update and ``removed`` the relations to delete.
+"""
+
+
+def _relations_by_id(record):
+    if not record:
+        return {}
+    return dict((relation[:3], relation) for relation in get_relations(record))
+
+
+def diff_relations(old, new):
+    """Compute the changes between two versions of a record.
+
+    :param old: the previous version, or ``None`` for a new record.
+    :param new: the new version, or ``None`` for a deleted record.
+    :returns: a :class:`RelationsDiff`.
+    """
+    old_relations = _relations_by_id(old)
+    new_relations = _relations_by_id(new)
+    added = [
+        relation for id_, relation in sorted(new_relations.items())
+        if id_ not in old_relations or
+        old_relations[id_].properties != relation.properties
+    ]
+    removed = [
+        relation for id_, relation in sorted(old_relations.items())
+        if id_ not in new_relations
+    ]
+    node = get_node(new) if new else None
+    if node is not None and old and get_node(old) == node:
+        node = None
+    return RelationsDiff(node, added, removed)
+
+
+def merge_diffs(diffs):
+    """Merge the diffs of distinct records into a set of changes.
+
+    :returns: a JSON serializable mapping with the ``nodes`` to merge by
+        label, and the ``removed`` and ``added`` relations as lists of
+        ``[type, start label, end label, rows]``.
+    """
+    nodes = {}
+    added = []
+    removed = []
+    for diff in diffs:
+        if diff.node is not None:
+            nodes.setdefault(diff.node.label, []).append({
+                'key': diff.node.key,
+                'properties': diff.node.properties,
+            })
+        added.extend(diff.added)
+        removed.extend(diff.removed)
+    return {
+        'nodes': nodes,
+        'removed': _sorted_groups(removed),
+        'added': _sorted_groups(added),
+    }
+
+
+def _sorted_groups(relations):
+    """Group relations, citations last so that authors are written first."""
+    groups = sorted(group_relations(relations).items(),
+                    key=lambda item: (item[0][0] == CITES, item[0]))
+    return [list(group) + [rows] for group, rows in groups]
+
+
+def counted_nodes(changes):
+    """Return the nodes whose relation counts the changes may change.
+
+    See :data:`inspire_relations.backends.RELATION_COUNTS`.
+
+    :returns: a ``(nodes, papers)`` tuple, ``nodes`` mapping labels to sets
+        of node keys, and ``papers`` the set of the keys of the papers whose
+        authors changed, the coauthors of all their authors changing too.
+    """
+    nodes = defaultdict(set)
+    papers = set()
+    for type_, start, end, rows in \
+            list(changes['removed']) + list(changes['added']):
+        if (type_, start, end) == (CITES, LITERATURE, LITERATURE):
+            for row in rows:
+                nodes[LITERATURE].update((row['start'], row['end']))
+        elif (type_, start, end) == (WRITTEN_BY, LITERATURE, AUTHOR):
+            for row in rows:
+                nodes[AUTHOR].add(row['end'])
+                papers.add(row['start'])
+    return nodes, papers
+
+
+def write_changes(graph, changes):
+    """Write a set of changes built by :func:`merge_diffs` in a transaction.
+
+    All statements merge or delete by key, so writing the same changes again
+    is harmless and failed writes can be retried. The citation metrics of
+    the affected nodes are maintained, see
+    :func:`inspire_relations.cypher.add_relations`, and the nodes whose
+    relation counts may have changed are stamped, see
+    :func:`counted_nodes`.
+
+    :returns: whether anything was written.
+    """
+    if not changes['nodes'] and not changes['added'] and \
+            not changes['removed']:
+        return False
+    stamp = int(time.time() * 1000)
+    nodes, papers = counted_nodes(changes)
+    with operation('write-changes'), graph.transaction() as tx:
+        for label, rows in sorted(changes['nodes'].items()):
+            tx.run(cypher.merge_nodes(label), {'rows': rows})
+        for type_, start, end, rows in changes['removed']:
+            tx.run(cypher.remove_relations(type_, start, end), {'rows': rows})
+        for type_, start, end, rows in changes['added']:
+            tx.run(cypher.add_relations(type_, start, end), {'rows': rows})
+        for label, keys in sorted(nodes.items()):
+            tx.run(cypher.stamp_nodes(label),
+                   {'keys': sorted(keys), 'stamp': stamp})
+        if papers:
+            tx.run(cypher.STAMP_PAPER_AUTHORS,
+                   {'keys': sorted(papers), 'stamp': stamp})
+    return True
+
+
+def apply_diff(backend, diff):
+    """Write the changes of a record to a backend at once.
+
+    :returns: whether anything was written.
+    """
+    return backend.write_changes(merge_diffs([diff]))
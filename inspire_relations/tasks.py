@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Celery tasks for Inspire-Relations."""
+
+from __future__ import absolute_import, print_function
+
+from celery import shared_task
+from flask import current_app
+
+from .write_behind import write_with_retry
+
+
+@shared_task(ignore_result=True)
+def write_relation_changes(changes, invalidated=()):
+    """Write a batch of relation changes, retrying on failure.
+
+    The changes only merge and delete by key, so a retried batch can not
+    duplicate relations. Failed writes are retried in the task rather than
+    sent back to the queue, so that the next batches of the queue are not
+    written before this one.
+
+    The ``(name, recid)`` cache keys ``invalidated`` are dropped once the
+    changes are written, from the cache shared by all the processes if one
+    is configured, see :mod:`inspire_relations.shared_cache`.
+    """
+    ext = current_app.extensions['inspire-relations']
+    write_with_retry(ext.backend, changes, max_retries=current_app.config[
+        'INSPIRE_RELATIONS_WRITE_BEHIND_MAX_RETRIES'])
+    ext.query.invalidate_keys(tuple(key) for key in invalidated)
+
+
+@shared_task(ignore_result=True)
+def recompute_metrics():
+    """Recompute the citation metrics, meant to be scheduled periodically."""
+    current_app.extensions['inspire-relations'].recompute_metrics()
+
+
+@shared_task(ignore_result=True)
+def export_snapshot():
+    """Publish a citation snapshot, meant to be scheduled periodically."""
+    current_app.extensions['inspire-relations'].export_snapshot()
+
+
+@shared_task(ignore_result=True)
+def compute_rankings():
+    """Recompute the rankings, meant to be scheduled periodically."""
+    current_app.extensions['inspire-relations'].compute_rankings()
+
+
+@shared_task(ignore_result=True)
+def compute_similar(full=False):
+    """Refresh the similar papers, meant to be scheduled periodically."""
+    current_app.extensions['inspire-relations'].compute_similar(full=full)
+
+
+@shared_task(ignore_result=True)
+def export_enrichment():
+    """Send the changed relation counts to the search index, periodically."""
+    current_app.extensions['inspire-relations'].export_enrichment()
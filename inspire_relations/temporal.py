@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Time ranges over the dated relations of the graph.
+
+Citations are dated by the date of the citing paper, and the affiliations
+of authors by the start and end dates of their positions, see
+:mod:`inspire_relations.records`. Rather than scanning every citation of a
+paper, time range questions are answered from its citation counts per
+month, materialized on the literature nodes as ``YYYYMM`` integers, see
+:mod:`inspire_relations.metrics`. A range sum then reads one count per month
+of citations, however many citations the paper has.
+"""
+
+from __future__ import absolute_import, print_function
+
+import datetime
+
+from .records import normalize_date
+
+
+def to_month(date):
+    """Return the ``YYYYMM`` month of a date, or ``None``.
+
+    :param date: a :class:`datetime.date`, or a possibly partial
+        ``YYYY-MM-DD`` string.
+    """
+    if isinstance(date, datetime.date):
+        return date.year * 100 + date.month
+    date = normalize_date(date)
+    return int(date[:4]) * 100 + int(date[5:7]) if date else None
+
+
+def shift_month(month, months):
+    """Return the ``YYYYMM`` month ``months`` after another one."""
+    index = (month // 100) * 12 + month % 100 - 1 + months
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def since_month(months, today=None):
+    """Return the first of the last ``months``, the current included."""
+    return shift_month(to_month(today or datetime.date.today()), 1 - months)
+
+
+def per_year(monthly, start=None, end=None):
+    """Sum citation counts per month into counts per year.
+
+    :param monthly: a dictionary of counts by ``YYYYMM`` month.
+    :param start: the first year counted, if any.
+    :param end: the last year counted, if any.
+    :returns: a dictionary of the non zero counts by year.
+    """
+    years = {}
+    for month, count in monthly.items():
+        year = month // 100
+        if (start is None or year >= start) and \
+                (end is None or year <= end) and count:
+            years[year] = years.get(year, 0) + count
+    return years
+
+
+def between(monthly, start=None, end=None):
+    """Return the sum of the counts per month from ``start`` to ``end``.
+
+    :param start: the first ``YYYYMM`` month counted, if any.
+    :param end: the last ``YYYYMM`` month counted, if any.
+    """
+    return sum(count for month, count in monthly.items()
+               if (start is None or month >= start) and
+               (end is None or month <= end))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Bounded multi-hop traversals of the relations graph.
+
+A traversal follows a path of hops from a start node, for instance the
+papers cited by the papers citing a record, or the institutions of the
+papers of an author. Around hub nodes, such as large collaborations or
+review articles, the number of reached nodes grows exponentially with the
+depth, so every traversal is bounded:
+
+* its depth by ``max_depth``,
+* the neighbours followed from each node at each hop by ``fan_out``,
+* the nodes expanded at each depth by ``max_nodes``,
+* the nodes returned by ``limit``,
+* its duration by ``timeout``, checked before each call to the backend
+  and passed to the database server as the timeout of the call.
+
+Each hop is a single backend call for the whole frontier, capped at
+``fan_out`` neighbours per node, so no call costs more than ``max_nodes *
+fan_out`` relations. When a bound is hit, the traversal stops expanding
+there and returns what it found, with the reasons in ``truncated``.
+"""
+
+from __future__ import absolute_import, print_function
+
+import time
+from collections import OrderedDict, namedtuple
+
+from .graph import QueryTimeout
+
+Hop = namedtuple('Hop', ['type', 'label', 'reverse'])
+"""A step through relations of a ``type`` to nodes of a ``label``.
+
+The relations are followed from their start to their end, or backwards if
+``reverse``.
+"""
+Hop.__new__.__defaults__ = (False,)
+
+BOUNDS = ('max_depth', 'fan_out', 'max_nodes', 'limit', 'timeout')
+"""Names of the bounds of a traversal."""
+
+Traversal = namedtuple('Traversal', ['nodes', 'truncated'])
+"""Nodes reached by a traversal, as ``(label, key)`` tuples in the order
+they were reached, and the sorted names of the bounds that truncated it,
+empty if it completed."""
+
+
+class _Stop(Exception):
+    """Raised to end a traversal early."""
+
+
+def _levels(path):
+    return [(hops,) if isinstance(hops, Hop) else tuple(hops)
+            for hops in path]
+
+
+def _group_by_label(nodes):
+    groups = OrderedDict()
+    for label, key in nodes:
+        groups.setdefault(label, []).append(key)
+    return groups
+
+
+def traverse(backend, start, path, within=False, labels=None, max_depth=3,
+             fan_out=100, max_nodes=10000, limit=1000, timeout=5.0,
+             timer=time.time):
+    """Traverse the graph from a start node along a path of hops.
+
+    :param start: the ``(label, key)`` of the start node.
+    :param path: the hops followed at each depth; each item is a
+        :class:`Hop` or a sequence of alternative hops.
+    :param within: return the nodes reached at any depth, rather than only
+        those reached at the end of the path. Nodes are then only visited
+        once.
+    :param labels: only return the nodes of these labels.
+    :returns: a :class:`Traversal`.
+    """
+    deadline = timer() + timeout
+    levels = _levels(path)
+    truncated = set()
+    if len(levels) > max_depth:
+        levels = levels[:max_depth]
+        truncated.add('depth')
+    visited = set([start])
+    frontier = [start]
+    nodes = []
+    try:
+        for depth, hops in enumerate(levels, 1):
+            seen = visited if within else set([start])
+            reached = []
+            for hop in hops:
+                for label, keys in _group_by_label(frontier).items():
+                    remaining = deadline - timer()
+                    if remaining < 0:
+                        truncated.add('timeout')
+                        raise _Stop()
+                    try:
+                        if hop.reverse:
+                            neighbours = backend.neighbours_many(
+                                hop.type, hop.label, label, keys,
+                                reverse=True, limit=fan_out + 1,
+                                timeout=remaining)
+                        else:
+                            neighbours = backend.neighbours_many(
+                                hop.type, label, hop.label, keys,
+                                limit=fan_out + 1, timeout=remaining)
+                    except QueryTimeout:
+                        truncated.add('timeout')
+                        raise _Stop()
+                    for key in keys:
+                        row = neighbours.get(key, ())
+                        if len(row) > fan_out:
+                            truncated.add('fan_out')
+                            row = row[:fan_out]
+                        for neighbour in row:
+                            node = (hop.label, neighbour)
+                            if node not in seen:
+                                seen.add(node)
+                                reached.append(node)
+            if within or depth == len(levels):
+                for node in reached:
+                    if labels is None or node[0] in labels:
+                        if len(nodes) == limit:
+                            truncated.add('limit')
+                            raise _Stop()
+                        nodes.append(node)
+            if len(reached) > max_nodes:
+                truncated.add('max_nodes')
+                reached = reached[:max_nodes]
+            frontier = reached
+    except _Stop:
+        pass
+    return Traversal(nodes, tuple(sorted(truncated)))
@@ -24,14 +24,21 @@
 
 """Invenio module to integrate Neo4J graph database and handle relations across records."""
 
-# TODO: This is an example file. Remove it if you do not need it, including
-# the templates and static folders as well as the test case.
-
 from __future__ import absolute_import, print_function
 
-from flask import Blueprint, render_template
+import base64
+import binascii
+import datetime
+import json
+
+from flask import Blueprint, Response, abort, current_app, jsonify, \
+    render_template, request, stream_with_context, url_for
 from flask_babelex import gettext as _
 
+from .backends import CITATION_FILTERS
+from .proxies import current_inspire_relations
+from .records import AUTHOR, LITERATURE
+
 blueprint = Blueprint(
     'inspire_relations',
     __name__,
@@ -46,3 +53,231 @@ def index():
     return render_template(
         "inspire_relations/index.html",
         module_name=_('Inspire-Relations'))
+
+
+RELATIONS = {
+    ('lit', 'citations'): 'citations',
+    ('lit', 'references'): 'references',
+    ('aut', 'coauthors'): 'coauthors',
+    ('aut', 'papers'): 'author_papers',
+}
+"""Lookup answering each relation endpoint of a PID type."""
+
+CITED_LABELS = {
+    'lit': LITERATURE,
+    'aut': AUTHOR,
+}
+"""Node label whose citations are answered for each PID type.
+
+The ``citations`` of an author are those of its papers. They can be
+filtered, see :data:`inspire_relations.backends.CITATION_FILTERS`.
+"""
+
+
+def encode_cursor(recid):
+    """Return the opaque cursor of the page following a record id."""
+    return base64.urlsafe_b64encode(
+        str(recid).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Return the record id encoded in a cursor, or ``None``."""
+    if not cursor:
+        return None
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (binascii.Error, TypeError, ValueError, UnicodeError):
+        abort(400)
+
+
+def _page_size():
+    try:
+        size = int(request.args.get(
+            'size', current_app.config['INSPIRE_RELATIONS_PAGE_SIZE']))
+    except ValueError:
+        abort(400)
+    if size < 1:
+        abort(400)
+    return min(size, current_app.config['INSPIRE_RELATIONS_MAX_PAGE_SIZE'])
+
+
+def _stream_page(recids, size, next_url):
+    """Serialize a page as JSON, one hit at a time.
+
+    One more id than the page size is read, to know if there is a next page.
+    """
+    yield '{"hits": ['
+    last = None
+    for count, recid in enumerate(recids):
+        if count == size:
+            yield '], "links": {0}}}'.format(json.dumps({
+                'next': next_url(encode_cursor(last)),
+            }))
+            return
+        yield (',' if count else '') + json.dumps({'recid': recid})
+        last = recid
+    yield '], "links": {}}'
+
+
+BATCH_RELATIONS = {
+    ('lit', 'citation_count'): 'citation_count',
+    ('lit', 'citations'): 'citations',
+    ('lit', 'references'): 'references',
+    ('aut', 'coauthors'): 'coauthors',
+    ('aut', 'papers'): 'author_papers',
+}
+"""Lookup answering each relation of a PID type in batch requests."""
+
+
+def _split(name):
+    return [value for value in request.args.get(name, '').split(',') if value]
+
+
+@blueprint.route('/relations/metrics')
+def metrics():
+    """Return the metrics of the graph queries and writes of this process.
+
+    They are rendered in the Prometheus text format, see
+    :mod:`inspire_relations.profiling` and
+    :meth:`inspire_relations.write_behind.WriteBehindQueue.render`.
+    """
+    sources = [current_inspire_relations.graph.profiler,
+               current_inspire_relations.write_behind]
+    sources = [source for source in sources if source is not None]
+    if not sources:
+        abort(404)
+    return Response(''.join(source.render() for source in sources),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@blueprint.route('/relations/<pid_type>')
+def batch_relations(pid_type):
+    """Return relations of many records, e.g. for a search results page.
+
+    The records are given as comma separated ``ids`` and the relations as
+    comma separated ``include`` names. All records are answered with a
+    single request to the graph, minus those already cached.
+    """
+    try:
+        recids = [int(value) for value in _split('ids')]
+    except ValueError:
+        abort(400)
+    if len(recids) > current_app.config['INSPIRE_RELATIONS_MAX_BATCH_SIZE']:
+        abort(400)
+    include = _split('include')
+    if not include:
+        abort(400)
+    names = [BATCH_RELATIONS.get((pid_type, relation)) for relation in include]
+    if None in names:
+        abort(404)
+
+    results = current_inspire_relations.query.lookup_many(names, recids)
+    hits = []
+    for recid in recids:
+        hit = {'recid': recid}
+        for relation, name in zip(include, names):
+            value = results[recid][name]
+            hit[relation] = list(value) if isinstance(value, tuple) else value
+        hits.append(hit)
+    return jsonify({'hits': hits})
+
+
+@blueprint.route('/relations/lit/<int:pid_value>/similar')
+def similar(pid_value):
+    """Return the papers most similar to a literature record.
+
+    They are ranked by their co-citation and bibliographic coupling
+    ``score``, at most ``size`` of them.
+    """
+    size = min(_page_size(),
+               current_app.config['INSPIRE_RELATIONS_SIMILAR_LIMIT'])
+    hits = []
+    for recid, properties in current_inspire_relations.query.similar(
+            pid_value, limit=size):
+        hit = {'recid': recid}
+        for name in ('score', 'cocitations', 'couplings'):
+            hit[name] = properties.get(name)
+        hits.append(hit)
+    return jsonify({'hits': hits})
+
+
+def _int_arg(name, default=None):
+    try:
+        return int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        abort(400)
+
+
+@blueprint.route('/relations/lit/<int:pid_value>/citations-per-year')
+def citations_per_year(pid_value):
+    """Return the number of citations of a literature record per year.
+
+    The years counted can be limited to the ``from`` and ``to`` years.
+    """
+    start = _int_arg('from') if 'from' in request.args else None
+    end = _int_arg('to') if 'to' in request.args else None
+    counts = current_inspire_relations.query.citations_per_year(
+        pid_value, start=start, end=end)
+    return jsonify({'citations_per_year': dict(
+        (str(year), count) for year, count in counts.items())})
+
+
+@blueprint.route('/relations/lit/rising')
+def rising_papers():
+    """Return the papers most cited in the last ``months``."""
+    months = _int_arg('months', 12)
+    if months < 1:
+        abort(400)
+    hits = [{'recid': recid, 'citations': citations}
+            for recid, citations in current_inspire_relations.query
+            .rising_papers(months=months, limit=_page_size())]
+    return jsonify({'hits': hits})
+
+
+@blueprint.route('/relations/aut/<int:pid_value>/affiliations')
+def affiliations(pid_value):
+    """Return the institutions an author was affiliated with at a date.
+
+    The ``date`` defaults to today.
+    """
+    date = request.args.get('date') or datetime.date.today().isoformat()
+    try:
+        recids = current_inspire_relations.query.affiliations_at(
+            pid_value, date)
+    except ValueError:
+        abort(400)
+    return jsonify({'hits': [{'recid': recid} for recid in recids]})
+
+
+@blueprint.route('/relations/<pid_type>/<int:pid_value>/<relation>')
+def relations(pid_type, pid_value, relation):
+    """Return a page of the records related to a record.
+
+    Pages are selected by the opaque ``cursor`` of the ``next`` link of the
+    previous page rather than by an offset. Citations can be filtered by
+    comma separated ``filter`` names.
+    """
+    name = RELATIONS.get((pid_type, relation))
+    filters = _split('filter')
+    if filters or name is None:
+        if relation != 'citations' or pid_type not in CITED_LABELS:
+            abort(404 if name is None else 400)
+        if not set(filters) <= set(CITATION_FILTERS):
+            abort(400)
+    size = _page_size()
+    after = decode_cursor(request.args.get('cursor'))
+    query = current_inspire_relations.query
+    if name is None or filters:
+        recids = query.filtered_citations(
+            pid_value, label=CITED_LABELS[pid_type], filters=filters,
+            after=after, limit=size + 1)
+    else:
+        recids = query.page(name, pid_value, after=after, limit=size + 1)
+
+    def next_url(cursor):
+        return url_for('.relations', pid_type=pid_type, pid_value=pid_value,
+                       relation=relation, cursor=cursor, size=size,
+                       filter=','.join(filters) or None)
+
+    return Response(stream_with_context(_stream_page(recids, size, next_url)),
+                    mimetype='application/json')
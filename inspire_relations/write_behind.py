@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Write-behind queue decoupling record changes from graph writes.
+
+Record changes are buffered in the process that made them. Repeated changes
+to the same record are coalesced, keeping its first previous version and
+its latest version, so that only their difference is written. Every
+``window`` seconds, or as soon as a full batch is pending, a background
+thread merges the pending changes into batches handed to an executor, which
+writes each batch in one transaction.
+
+The queue is bounded: once ``max_depth`` records are pending or being
+written, producers wait for the flusher for up to ``put_timeout`` seconds
+and :class:`QueueFull` is raised if there is still no room.
+
+Records are partitioned by a hash of their key, every batch holds records
+of a single partition and the batches of a partition are written in order
+by a single worker, so that a later change of a record is never written
+before an earlier one.
+"""
+
+from __future__ import absolute_import, print_function
+
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from itertools import islice
+from multiprocessing import Pool
+
+from .query import invalidated_keys
+from .sync import diff_relations, merge_diffs
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when no room frees up in the write-behind queue in time."""
+
+
+class QueueClosed(QueueFull):
+    """Raised when a change is put in a closed write-behind queue."""
+
+
+def partition(key, partitions):
+    """Return the partition of a record key, stable across processes."""
+    return zlib.crc32(repr(key).encode('utf-8')) % partitions
+
+
+def _retry(call, action, max_retries=5, backoff=0.5):
+    """Call a function, retrying failed attempts with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except Exception:
+            if attempt == max_retries:
+                raise
+            logger.warning('%s relation changes failed, retrying.', action,
+                           exc_info=True)
+            time.sleep(backoff * 2 ** attempt)
+
+
+def write_with_retry(backend, changes, max_retries=5, backoff=0.5):
+    """Write changes, retrying failed attempts with exponential backoff."""
+    return _retry(lambda: backend.write_changes(changes), 'Writing',
+                  max_retries=max_retries, backoff=backoff)
+
+
+class CeleryExecutor(object):
+    """Write batches in Celery workers.
+
+    The batches of each partition are sent to their own queue,
+    ``'<queue>-<partition>'``, which must be consumed by a single worker
+    process for them to be written in order. The workers invalidate the
+    cached lookups of a batch once written, see
+    :func:`inspire_relations.tasks.write_relation_changes`.
+    """
+
+    invalidates = True
+
+    def __init__(self, queue='inspire-relations-writes', max_retries=5,
+                 backoff=0.5):
+        """Initialize the executor.
+
+        :param max_retries: number of times sending a batch is retried,
+            e.g. while the broker is unavailable.
+        """
+        self.queue = queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def submit(self, changes, done, partition=0, invalidated=()):
+        """Send a batch to the queue of its partition.
+
+        :param invalidated: the cache keys to invalidate once written.
+        """
+        from .tasks import write_relation_changes
+        try:
+            _retry(lambda: write_relation_changes.apply_async(
+                (changes, list(invalidated)),
+                queue='{0}-{1}'.format(self.queue, partition)),
+                'Sending', max_retries=self.max_retries,
+                backoff=self.backoff)
+        except Exception:
+            logger.exception('Sending relation changes to Celery failed.')
+            done(False)
+            return
+        done(True)
+
+    def close(self):
+        """Nothing to release, batches are owned by the broker."""
+
+
+_worker_backend = None
+
+
+def _init_worker(backend):
+    global _worker_backend
+    _worker_backend = backend
+
+
+def _write_in_worker(changes, max_retries):
+    return write_with_retry(_worker_backend, changes, max_retries=max_retries)
+
+
+class PoolExecutor(object):
+    """Write batches in local worker processes, one per partition."""
+
+    invalidates = False
+
+    def __init__(self, backend, processes=1, max_retries=5):
+        """Initialize the executor, the workers are started on first use.
+
+        :raises ValueError: if the backend lives in the memory of the
+            process, as the workers would only write to their copy.
+        """
+        if backend.process_local:
+            raise ValueError('Local write-behind workers can not write to '
+                             'a graph in the memory of the process.')
+        self.backend = backend
+        self.processes = processes
+        self.max_retries = max_retries
+        self._pools = None
+
+    def submit(self, changes, done, partition=0):
+        """Write a batch in the worker process of its partition."""
+        if self._pools is None:
+            self._pools = [Pool(1, _init_worker, (self.backend,))
+                           for _ in range(self.processes)]
+
+        def failed(error):
+            logger.error('Writing relation changes in a worker failed.',
+                         exc_info=error)
+            done(False)
+
+        self._pools[partition % self.processes].apply_async(
+            _write_in_worker, (changes, self.max_retries),
+            callback=lambda result: done(True), error_callback=failed)
+
+    def close(self):
+        """Wait for the pending batches and stop the workers."""
+        if self._pools is not None:
+            for pool in self._pools:
+                pool.close()
+            for pool in self._pools:
+                pool.join()
+            self._pools = None
+
+
+class WriteBehindQueue(object):
+    """Coalescing, bounded buffer of record changes."""
+
+    NAMESPACE = 'inspire_relations_write_behind'
+    METRICS = (
+        ('depth', 'Records pending or being written.', 'gauge'),
+        ('pending', 'Records waiting for the flusher.', 'gauge'),
+        ('in_flight', 'Records handed to the executor.', 'gauge'),
+        ('enqueued', 'Records put in the queue.', 'counter'),
+        ('coalesced', 'Changes merged with a pending change.', 'counter'),
+        ('rejected', 'Changes refused by a full or closed queue.',
+         'counter'),
+        ('batches', 'Batches handed to the executor.', 'counter'),
+        ('flushed', 'Records written.', 'counter'),
+        ('failed', 'Records whose batch failed.', 'counter'),
+    )
+    """Key, help and type of the metrics rendered for Prometheus."""
+
+    def __init__(self, executor, window=2.0, batch_size=500,
+                 max_depth=10000, put_timeout=5.0, on_written=None,
+                 partitions=1):
+        """Initialize the queue, its flusher is started on first use.
+
+        :param on_written: callable receiving the ``(old, new)`` changes of
+            every batch once it has been written, unless the executor
+            invalidates the cached lookups itself.
+        :param partitions: number of partitions of the records, each
+            written in order by the executor.
+        """
+        self.executor = executor
+        self.partitions = partitions
+        self.on_written = on_written
+        self.window = window
+        self.batch_size = batch_size
+        self.max_depth = max_depth
+        self.put_timeout = put_timeout
+        self.stats = Counter()
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._pid = None
+        self._flusher = None
+
+    @classmethod
+    def from_config(cls, config, backend, on_written=None):
+        """Create a queue from the write-behind settings.
+
+        :param backend: the :class:`inspire_relations.backends.GraphBackend`
+            written to by local worker processes.
+        """
+        name = config['INSPIRE_RELATIONS_WRITE_BEHIND']
+        max_retries = config['INSPIRE_RELATIONS_WRITE_BEHIND_MAX_RETRIES']
+        if name == 'celery':
+            executor = CeleryExecutor(
+                queue=config['INSPIRE_RELATIONS_WRITE_BEHIND_QUEUE'],
+                max_retries=max_retries,
+            )
+            partitions = config['INSPIRE_RELATIONS_WRITE_BEHIND_PARTITIONS']
+        elif name == 'local':
+            partitions = config['INSPIRE_RELATIONS_WRITE_BEHIND_PROCESSES']
+            executor = PoolExecutor(
+                backend, processes=partitions, max_retries=max_retries)
+        else:
+            raise ValueError(
+                'Unknown write-behind executor {0!r}.'.format(name))
+        return cls(
+            executor,
+            window=config['INSPIRE_RELATIONS_WRITE_BEHIND_WINDOW'],
+            batch_size=config['INSPIRE_RELATIONS_WRITE_BEHIND_BATCH_SIZE'],
+            max_depth=config['INSPIRE_RELATIONS_WRITE_BEHIND_MAX_DEPTH'],
+            put_timeout=config['INSPIRE_RELATIONS_WRITE_BEHIND_PUT_TIMEOUT'],
+            on_written=on_written,
+            partitions=partitions,
+        )
+
+    @property
+    def depth(self):
+        """Number of records pending or being written."""
+        return len(self._pending) + self._in_flight
+
+    def metrics(self):
+        """Return the current depth and the counters of the queue."""
+        metrics = dict(self.stats)
+        metrics.update(
+            depth=self.depth,
+            pending=len(self._pending),
+            in_flight=self._in_flight,
+        )
+        return metrics
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        metrics = self.metrics()
+        lines = []
+        for key, help_, type_ in self.METRICS:
+            name = '{0}_{1}{2}'.format(
+                self.NAMESPACE, key, '_total' if type_ == 'counter' else '')
+            lines.append('# HELP {0} {1}'.format(name, help_))
+            lines.append('# TYPE {0} {1}'.format(name, type_))
+            lines.append('{0} {1}'.format(name, metrics.get(key, 0)))
+        return '\n'.join(lines) + '\n'
+
+    def put(self, key, old, new):
+        """Buffer the change of a record.
+
+        :param key: identifier of the record, changes with the same key are
+            coalesced.
+        :param old: the previous version, or ``None`` for a new record.
+        :param new: the new version, or ``None`` for a deleted record.
+        :raises QueueFull: if the queue stays full for ``put_timeout``.
+        :raises QueueClosed: if the queue was closed, as its changes would
+            never be flushed.
+        """
+        with self._condition:
+            self._check_open()
+            self._start_flusher()
+            if key in self._pending:
+                self._pending[key] = (self._pending[key][0], new)
+                self.stats['coalesced'] += 1
+                return
+            deadline = time.time() + self.put_timeout
+            while self.depth >= self.max_depth:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.stats['rejected'] += 1
+                    raise QueueFull(
+                        'Write-behind queue is full ({0} records).'.format(
+                            self.depth))
+                self._condition.notify_all()
+                self._condition.wait(remaining)
+                self._check_open()
+            self._pending[key] = (old, new)
+            self.stats['enqueued'] += 1
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+
+    def _check_open(self):
+        if self._closed:
+            self.stats['rejected'] += 1
+            raise QueueClosed('Write-behind queue is closed.')
+
+    def _take_batch(self):
+        """Take the oldest pending changes of the partition of the oldest.
+
+        :returns: the partition and the ``(old, new)`` changes.
+        """
+        with self._condition:
+            if not self._pending:
+                return None, []
+            first = partition(next(iter(self._pending)), self.partitions)
+            keys = list(islice(
+                (key for key in self._pending
+                 if partition(key, self.partitions) == first),
+                self.batch_size))
+            batch = [self._pending.pop(key) for key in keys]
+            self._in_flight += len(batch)
+            return first, batch
+
+    def _done(self, batch, success):
+        with self._condition:
+            self._in_flight -= len(batch)
+            self.stats['flushed' if success else 'failed'] += len(batch)
+            self._condition.notify_all()
+        if success and self.on_written is not None and \
+                not self.executor.invalidates:
+            self.on_written(batch)
+
+    def flush(self):
+        """Hand all the pending changes to the executor, in batches."""
+        while True:
+            partition_, batch = self._take_batch()
+            if not batch:
+                return
+            changes = merge_diffs(
+                diff_relations(old, new) for old, new in batch)
+            self.stats['batches'] += 1
+            options = {'partition': partition_}
+            if self.executor.invalidates:
+                options['invalidated'] = sorted(set(
+                    key for old, new in batch
+                    for key in invalidated_keys(old, new)))
+            self.executor.submit(
+                changes,
+                lambda success, batch=batch: self._done(batch, success),
+                **options)
+
+    def _start_flusher(self):
+        if self._pid == os.getpid():
+            return
+        # Changes pending in the parent are flushed by the parent.
+        self._pending.clear()
+        self._in_flight = 0
+        self._pid = os.getpid()
+        self._flusher = threading.Thread(target=self._run,
+                                         name='relations-flusher')
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._closed and self._pid == pid:
+            with self._condition:
+                if not self._closed and \
+                        len(self._pending) < self.batch_size:
+                    self._condition.wait(self.window)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing relation changes failed.')
+
+    def close(self):
+        """Flush the pending changes and wait until they are written.
+
+        The flusher is stopped first, so that the last changes are flushed
+        by this thread alone.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        flusher = self._flusher
+        if flusher is not None and self._pid == os.getpid() and \
+                flusher is not threading.current_thread():
+            flusher.join()
+        self.flush()
+        self.executor.close()
@@ -32,20 +32,40 @@ readme = open('README.rst').read()
 history = open('CHANGES.rst').read()
 
 tests_require = [
+    'celery>=3.1',
     'check-manifest>=0.25',
     'coverage>=4.0',
+    'fakeredis>=1.0',
     'isort>=4.2.2',
+    'msgpack>=1.0',
+    'numpy>=1.10',
     'pydocstyle>=1.0.0',
     'pytest-cache>=1.0',
     'pytest-cov>=1.8.0',
     'pytest-pep8>=1.0.6',
     'pytest>=2.8.0',
+    'redis>=3.0',
+    'scipy>=0.17',
 ]
 
 extras_require = {
+    'analytics': [
+        'numpy>=1.10',
+        'scipy>=0.17',
+    ],
+    'celery': [
+        'celery>=3.1',
+    ],
     'docs': [
         'Sphinx>=1.4.2',
     ],
+    'records': [
+        'invenio-records>=1.0.0a16',
+    ],
+    'redis': [
+        'msgpack>=1.0',
+        'redis>=3.0',
+    ],
     'tests': tests_require,
 }
 
@@ -60,6 +80,7 @@ setup_requires = [
 
 install_requires = [
     'Flask-BabelEx>=0.9.2',
+    'neo4j-driver>=1.7.0',
 ]
 
 packages = find_packages()
@@ -89,6 +110,16 @@ setup(
         'invenio_base.apps': [
             'inspire_relations = inspire_relations:InspireRelations',
         ],
+        'invenio_celery.tasks': [
+            'inspire_relations = inspire_relations.tasks',
+        ],
+        'console_scripts': [
+            'inspire-relations-import-files = '
+            'inspire_relations.cli:import_files',
+        ],
+        'flask.commands': [
+            'relations = inspire_relations.cli:relations',
+        ],
         'invenio_i18n.translations': [
             'messages = inspire_relations',
         ],
@@ -99,7 +130,6 @@ setup(
         # 'invenio_base.api_apps': [],
         # 'invenio_base.api_blueprints': [],
         # 'invenio_base.blueprints': [],
-        # 'invenio_celery.tasks': [],
         # 'invenio_db.models': [],
         # 'invenio_pidstore.minters': [],
         # 'invenio_records.jsonresolver': [],
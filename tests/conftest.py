@@ -31,11 +31,154 @@ import pytest
 from flask import Flask
 
 
+def online_schema(statement, parameters):
+    """Answer index listings with all constraints online."""
+    from inspire_relations.schema import CONSTRAINTS
+    if statement == 'CALL db.indexes()':
+        return [{'labelsOrTypes': [label], 'properties': [property_],
+                 'state': 'ONLINE'} for label, property_ in CONSTRAINTS]
+    return []
+
+
+class StandInTransaction(object):
+    """In-process stand-in for a Neo4j transaction."""
+
+    def __init__(self, session, **options):
+        """Initialize the transaction, recording its options."""
+        self.session = session
+        self.options = options
+        self.statements = []
+        self.committed = False
+        self.rolled_back = False
+
+    def run(self, statement, parameters=None, **kwparameters):
+        """Record the statement, it is applied on commit."""
+        self.statements.append(
+            (statement, dict(parameters or {}, **kwparameters)))
+        return self.session.driver.respond(statement, self.statements[-1][1])
+
+    def commit(self):
+        """Make the statements of the transaction visible."""
+        self.committed = True
+        self.session.driver.statements.extend(self.statements)
+
+    def rollback(self):
+        """Discard the statements of the transaction."""
+        self.rolled_back = True
+
+
+class StandInSession(object):
+    """In-process stand-in for a Neo4j session."""
+
+    def __init__(self, driver):
+        """Initialize the session."""
+        self.driver = driver
+        self.closed = False
+        driver.sessions.append(self)
+
+    def run(self, statement, parameters=None, **kwparameters):
+        """Record the statement and return the canned response."""
+        parameters = dict(parameters or {}, **kwparameters)
+        self.driver.statements.append((statement, parameters))
+        return self.driver.respond(statement, parameters)
+
+    def begin_transaction(self, **options):
+        """Start a transaction."""
+        transaction = StandInTransaction(self, **options)
+        self.driver.transactions.append(transaction)
+        return transaction
+
+    def close(self):
+        """Return the session to the pool."""
+        self.closed = True
+
+
+class StandInDriver(object):
+    """In-process stand-in for a Neo4j driver.
+
+    Every statement run against it is recorded in :attr:`statements`, and
+    answered by :attr:`responder`, a callable taking the statement and its
+    parameters and returning a list of records. By default, it answers as a
+    graph with its schema created and no data.
+    """
+
+    instances = []
+
+    def __init__(self, uri, **options):
+        """Initialize the driver, recording its options."""
+        self.uri = uri
+        self.options = options
+        self.statements = []
+        self.sessions = []
+        self.transactions = []
+        self.closed = False
+        self.responder = online_schema
+        StandInDriver.instances.append(self)
+
+    def respond(self, statement, parameters):
+        """Answer a statement through the responder."""
+        return self.responder(statement, parameters)
+
+    def session(self, **kwargs):
+        """Open a session."""
+        return StandInSession(self)
+
+    def close(self):
+        """Close all connections."""
+        self.closed = True
+
+
+def ref(endpoint, recid):
+    """Return a JSON reference to a record."""
+    return {'$ref': 'http://localhost:5000/api/{0}/{1}'.format(
+        endpoint, recid)}
+
+
+def literature(recid, references=(), authors=(), **kwargs):
+    """Return a minimal literature record."""
+    record = {
+        '$schema': 'http://localhost:5000/schemas/records/hep.json',
+        'control_number': recid,
+        'references': [{'record': ref('literature', ref_recid)}
+                       for ref_recid in references],
+        'authors': [{'full_name': 'Author {0}'.format(author_recid),
+                     'record': ref('authors', author_recid)}
+                    for author_recid in authors],
+    }
+    record.update(kwargs)
+    return record
+
+
+def author(recid, **kwargs):
+    """Return a minimal author record."""
+    record = {
+        '$schema': 'http://localhost:5000/schemas/records/authors.json',
+        'control_number': recid,
+    }
+    record.update(kwargs)
+    return record
+
+
+@pytest.fixture()
+def records():
+    """A small citation graph of four papers by three authors."""
+    return [
+        literature(1, authors=[10, 11]),
+        literature(2, references=[1], authors=[11]),
+        literature(3, references=[1, 2], authors=[12]),
+        literature(4, references=[1, 2, 3], authors=[10, 12]),
+        author(10),
+        author(11),
+        author(12),
+    ]
+
+
 @pytest.fixture()
 def app():
     """Flask application fixture."""
     app = Flask('testapp')
     app.config.update(
-        TESTING=True
+        TESTING=True,
+        INSPIRE_RELATIONS_GRAPH_DRIVER_FACTORY=StandInDriver,
     )
     return app
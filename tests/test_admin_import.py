@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Bulk importer file generation tests."""
+
+from __future__ import absolute_import, print_function
+
+import io
+import os
+
+from click.testing import CliRunner
+from conftest import author, literature
+
+from inspire_relations.admin_import import generate_import_files, \
+    node_header, relation_header, write_shard
+from inspire_relations.cli import import_files
+
+
+def read_csv(directory, pattern):
+    """Return the sorted lines of all data files of a group."""
+    lines = []
+    for name in os.listdir(directory):
+        if name.startswith(pattern + '-') and not name.endswith('header.csv'):
+            with io.open(os.path.join(directory, name)) as fp:
+                lines.extend(fp.read().splitlines())
+    return sorted(lines)
+
+
+def test_headers():
+    """Test headers follow the bulk importer format."""
+    assert node_header('Literature') == [
+        ':ID(Literature)', 'recid:long', 'year:int', 'refereed:boolean',
+        'arxiv_eprints:string[]', 'dois:string[]', 'pubnotes:string[]',
+        'report_numbers:string[]']
+    assert node_header('Author') == [':ID(Author)', 'recid:long', 'orcid']
+    assert relation_header(('CITES', 'Literature', 'Literature')) == [
+        ':START_ID(Literature)', ':END_ID(Literature)', 'date']
+
+
+def test_generate_import_files(records, tmpdir):
+    """Test nodes are deduplicated and relations sharded."""
+    orcid = {'schema': 'ORCID', 'value': '0000-0002-1825-0097'}
+    records = records + [
+        literature(4, references=[1, 2, 3, 99], authors=[10, 12],
+                   refereed=True, earliest_date='2016-03',
+                   dois=[{'value': '10.1103/B'}, {'value': '10.1103/A'}]),
+        author(10, ids=[orcid]),
+    ]
+    output = str(tmpdir.join('import'))
+    arguments = generate_import_files(
+        iter(records), output, shards=3, processes=2)
+
+    assert read_csv(output, 'Literature') == [
+        '1,1,,,,,,', '2,2,,,,,,', '3,3,,,,,,',
+        '4,4,2016,True,,10.1103/a;10.1103/b,,', '99,99,,,,,,']
+    assert read_csv(output, 'Author') == [
+        '10,10,0000-0002-1825-0097', '11,11,', '12,12,']
+    assert read_csv(output, 'CITES-Literature-Literature') == [
+        '2,1,', '3,1,', '3,2,', '4,1,2016-03-01', '4,2,2016-03-01',
+        '4,3,2016-03-01', '4,99,2016-03-01']
+    assert not [name for name in os.listdir(output)
+                if name.startswith('inspire-relations-')]
+
+    options = [argument.split('=')[:2] for argument in arguments]
+    assert options == [
+        ['--nodes', 'Author'],
+        ['--relationships', 'CITES'],
+        ['--nodes', 'Literature'],
+        ['--relationships', 'WRITTEN_BY'],
+    ]
+    files = arguments[2].split('=')[2].split(',')
+    assert files[0] == os.path.join(output, 'Literature-header.csv')
+    assert 1 < len(files) <= 4
+    with io.open(files[0]) as fp:
+        assert fp.read().strip() == \
+            ':ID(Literature),recid:long,year:int,refereed:boolean,' \
+            'arxiv_eprints:string[],dois:string[],pubnotes:string[],' \
+            'report_numbers:string[]'
+
+
+def test_import_files_command(records, tmpdir):
+    """Test the import files command."""
+    dump = tmpdir.join('records.jsonl')
+    dump.write('\n'.join('{{"$schema": "hep.json", "control_number": {0}}}'
+                         .format(recid) for recid in range(5)))
+    output = tmpdir.join('out')
+
+    result = CliRunner().invoke(
+        import_files, [str(dump), str(output), '--shards', '2'])
+    assert result.exit_code == 0
+    assert result.output.startswith('neo4j-admin import --nodes=Literature=')
+    assert read_csv(str(output), 'Literature') == [
+        '0,0,,,,,,', '1,1,,,,,,', '2,2,,,,,,', '3,3,,,,,,', '4,4,,,,,,']
+
+
+def test_write_shard_deduplicates(tmpdir):
+    """Test shards keep the last rows with properties of every node."""
+    shard = tmpdir.join('nodes.Author.0000')
+    shard.write('\n'.join([
+        '[10, null]', '[11, null]', '[10, {"recid": 10, "orcid": "A"}]',
+        '[10, null]', '[10, {"recid": 10, "orcid": "B"}]', '[11, null]']))
+    target = write_shard((str(shard), str(tmpdir)))
+    with io.open(target) as fp:
+        assert fp.read().splitlines() == ['11,11,', '10,10,B']
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Citation graph analytics tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import pytest
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.cli import relations
+
+np = pytest.importorskip('numpy')
+analytics = pytest.importorskip('inspire_relations.analytics')
+
+
+@pytest.fixture()
+def graph():
+    """Citations of four papers, published from 2010 to 2013."""
+    return analytics.citation_graph(
+        [1, 2, 3, 4],
+        [(2, 1), (3, 1), (3, 2), (4, 1), (4, 2), (4, 3), (4, 3)],
+        [2010, 2011, None, 2013],
+    )
+
+
+def test_citation_graph(graph):
+    """Test citations are held in a sparse matrix."""
+    assert list(graph.recids) == [1, 2, 3, 4]
+    assert graph.matrix.toarray().tolist() == [
+        [0, 0, 0, 0],
+        [1, 0, 0, 0],
+        [1, 1, 0, 0],
+        [1, 1, 1, 0],
+    ]
+    assert np.isnan(graph.years[2])
+
+
+def test_pagerank(graph):
+    """Test PageRank matches the solution of its linear system."""
+    ranking = analytics.pagerank(graph, tol=1e-12, max_iter=200)
+    assert ranking.converged
+    matrix = graph.matrix.toarray()
+    transition = matrix / np.maximum(matrix.sum(axis=1), 1)[:, None]
+    transition[matrix.sum(axis=1) == 0] = 0.25
+    expected = np.linalg.solve(
+        np.eye(4) - 0.85 * transition.T, np.full(4, 0.15 / 4))
+    assert np.allclose(ranking.scores, expected / expected.sum())
+    assert np.argsort(ranking.scores).tolist() == [3, 2, 1, 0]
+
+
+def test_ranking_convergence_controls(graph):
+    """Test the iterations are bounded."""
+    ranking = analytics.pagerank(graph, tol=0, max_iter=3)
+    assert (ranking.iterations, ranking.converged) == (3, False)
+    assert analytics.pagerank(graph, tol=1e-3).iterations < 10
+
+
+def test_personalized_and_decayed_ranks(graph):
+    """Test rankings favour their seeds and recent papers."""
+    personalized = analytics.personalized_pagerank(graph, [3]).scores
+    assert personalized[3] == 0
+    assert personalized[2] > analytics.pagerank(graph).scores[2]
+    with pytest.raises(ValueError):
+        analytics.personalized_pagerank(graph, [404])
+
+    decayed = analytics.time_decayed_rank(graph, decay=1.0).scores
+    assert np.isclose(decayed.sum(), 1)
+    assert decayed[3] > analytics.pagerank(graph).scores[3]
+
+
+def test_rankings_are_written_back(app, records):
+    """Test rankings are stored on the literature nodes."""
+    app.config['INSPIRE_RELATIONS_BACKEND'] = 'memory'
+    ext = InspireRelations(app)
+    ext.backend.load(json.dumps(record) for record in records)
+
+    result = CliRunner().invoke(
+        relations, ['rank', '--batch-size', '3'],
+        obj=ScriptInfo(create_app=lambda *args: app))
+    assert result.exit_code == 0
+    assert 'Ranked 4 literature records' in result.output
+
+    ranks = dict(ext.backend.iter_nodes('Literature',
+                                        ['pagerank', 'citerank']))
+    assert sorted(ranks) == [1, 2, 3, 4]
+    assert ranks[1]['pagerank'] == max(r['pagerank'] for r in ranks.values())
+    assert np.isclose(sum(r['citerank'] for r in ranks.values()), 1)
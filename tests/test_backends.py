@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Graph backend tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import threading
+
+from conftest import literature
+
+from inspire_relations import InspireRelations
+from inspire_relations.backends import load_backend, memory
+from inspire_relations.backends.memory import IN, Adjacency, MemoryBackend, \
+    Relations
+from inspire_relations.backends.neo4j import Neo4jBackend
+from inspire_relations.sync import diff_relations, merge_diffs
+
+
+def test_backend_is_configurable(app):
+    """Test the backend is chosen by configuration."""
+    ext = InspireRelations(app)
+    assert isinstance(ext.backend, Neo4jBackend)
+    assert ext.backend.graph is ext.graph
+
+    app.config['INSPIRE_RELATIONS_BACKEND'] = 'memory'
+    assert isinstance(load_backend(app.config, ext.graph), MemoryBackend)
+    app.config['INSPIRE_RELATIONS_BACKEND'] = \
+        'inspire_relations.backends.memory:MemoryBackend'
+    assert isinstance(load_backend(app.config, ext.graph), MemoryBackend)
+
+
+def test_adjacency():
+    """Test neighbours are stored in rows sorted by key."""
+    keys = [30, 10, 20]
+    pairs = [(0, 0), (2, 1), (0, 2), (0, 1)]
+    adjacency = Adjacency(4, pairs, keys.__getitem__)
+    assert list(adjacency.offsets) == [0, 3, 3, 4, 4]
+    assert list(adjacency.neighbours(0)) == [1, 2, 0]
+    assert list(adjacency.neighbours(1)) == []
+    assert list(adjacency.neighbours(2)) == [1]
+    assert list(adjacency.neighbours(7)) == []
+    assert adjacency.position(0, 2) == 1
+    assert adjacency.position(1, 2) is None
+
+
+def test_relations_buffer(monkeypatch):
+    """Test relation changes are buffered until merged into the arrays."""
+    keys = [30, 10, 20, 40]
+    relations = Relations(keys.__getitem__, threading.RLock())
+    relations.add(0, 1, {'date': '2015'})
+    relations.add(0, 2, {})
+    relations.merge(4, force=True)
+    rows = relations.rows
+
+    relations.add(0, 3, {})
+    relations.remove(0, 1)
+    relations.add(2, 1, {'date': '2016'})
+    relations.add(0, 2, {'date': '2017'})
+    relations.merge(4)
+    assert relations.rows is rows
+    assert list(relations.neighbours(0)) == [2, 3]
+    assert list(relations.neighbours(1, IN)) == [2]
+    assert relations.properties(0, 2) == {'date': '2017'}
+    relations.add(0, 1, {})
+    assert relations.properties(0, 1) == {}
+
+    monkeypatch.setattr(memory, 'MERGE_SIZE', 4)
+    relations.merge(4)
+    assert relations.rows is not rows
+    assert not relations.touched[IN]
+    assert list(relations.neighbours(0)) == [1, 2, 3]
+    assert relations.properties(0, 2) == {'date': '2017'}
+    assert relations.properties(2, 1) == {'date': '2016'}
+    assert sorted(relations.pairs()) == [(0, 1), (0, 2), (0, 3), (2, 1)]
+
+
+def test_memory_lookups(records):
+    """Test the memory backend answers lookups from its indexes."""
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    assert len(backend) == 7
+    assert backend.lookup('citation_count', 1) == 3
+    assert backend.lookup('citations', 1) == (2, 3, 4)
+    assert backend.lookup('references', 4) == (1, 2, 3)
+    assert backend.lookup('author_papers', 12) == (3, 4)
+    assert backend.lookup('coauthors', 10) == (11, 12)
+    assert backend.lookup('citations', 404) == ()
+    assert backend.lookup_many({'citation_count': [2, 3]}) == {
+        'citation_count': {2: 2, 3: 1}}
+    assert list(backend.page('citations', 1, limit=2)) == [2, 3]
+    assert list(backend.page('citations', 1, after=3, limit=2)) == [4]
+    assert list(backend.page('coauthors', 10, after=11)) == [12]
+
+
+def test_memory_metrics(records):
+    """Test the memory backend computes the citation metrics."""
+    records[1]['earliest_date'] = '2015-02-01'
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    assert backend.literature_metrics(1) == {
+        'citation_count': 3,
+        'citation_count_without_self_citations': 1,
+        'citations_per_year': {2015: 1},
+    }
+    assert backend.author_metrics(10) == {
+        'citation_count': 3,
+        'citation_count_without_self_citations': 1,
+        'h_index': 1,
+    }
+    assert backend.literature_metrics(404) is None
+    assert backend.author_metrics(404) is None
+
+
+def test_memory_changes(records):
+    """Test record changes update the indexes."""
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    assert backend.lookup('citations', 2) == (3, 4)
+
+    old, new = records[3], literature(4, references=[1, 5], authors=[10])
+    changes = merge_diffs([diff_relations(old, new)])
+    assert backend.write_changes(changes)
+    assert backend.write_changes(changes)
+    assert backend.lookup('citations', 2) == (3,)
+    assert backend.lookup('citations', 5) == (4,)
+    assert backend.lookup('author_papers', 12) == (3,)
+    assert not backend.write_changes(merge_diffs([]))
+
+
+def test_memory_dump(app, records, tmpdir):
+    """Test the memory backend is loaded from a dump on first use."""
+    dump = tmpdir.join('records.jsonl')
+    dump.write('\n'.join(json.dumps(record) for record in records))
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='memory',
+        INSPIRE_RELATIONS_MEMORY_DUMP=str(dump),
+    )
+    ext = InspireRelations(app)
+    assert ext.query.citations(2) == (3, 4)
+    with app.test_client() as client:
+        response = client.get('/relations/lit/1/citations?size=2')
+        assert json.loads(response.get_data(as_text=True))['hits'] == [
+            {'recid': 2}, {'recid': 3}]
+
+
+def test_memory_filtered_citations(records):
+    """Test citations are filtered from the indexes."""
+    records[0]['collaborations'] = [{'value': 'ATLAS'}]
+    records[2]['refereed'] = True
+    records[3]['collaborations'] = [{'value': 'ATLAS'}]
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+
+    def citations(label, recid, *filters, **kwargs):
+        return backend.filtered_citations(label, recid, filters, **kwargs)
+
+    assert citations('Literature', 1) == (2, 3, 4)
+    assert citations('Literature', 1, 'exclude_self') == (3,)
+    assert citations('Literature', 1, 'exclude_collaboration') == (2, 3)
+    assert citations('Literature', 1, 'refereed_only') == (3,)
+    assert citations('Literature', 1, after=2, limit=1) == (3,)
+    assert citations('Author', 12) == (4,)
+    assert citations('Author', 404) == ()
+    assert backend.filtered_citation_count('Author', 10) == 3
+    assert backend.filtered_citation_count(
+        'Author', 10, ['exclude_self']) == 1
+
+
+def test_neo4j_properties_many(app):
+    """Test node properties are read with a single statement."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = lambda statement, params: [
+        {'key': key, 'properties': {'recid': key, 'year': 2016}}
+        for key in params['keys'] if key < 3]
+    assert ext.backend.properties_many('Literature', [1, 2, 3]) == {
+        1: {'recid': 1, 'year': 2016}, 2: {'recid': 2, 'year': 2016}}
+    statement, params = ext.graph.driver.statements[-1]
+    assert 'MATCH (n:Literature {recid: key})' in statement
+    assert params == {'keys': [1, 2, 3]}
+
+
+def test_neo4j_ranked_neighbours(app):
+    """Test the top neighbours of a node are read with a single statement."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = lambda statement, params: [
+        {'key': 3, 'properties': {'score': 0.5}}]
+    assert ext.backend.ranked_neighbours(
+        'SIMILAR', 'Literature', 'Literature', 1, 'score', limit=2) == [
+        (3, {'score': 0.5})]
+    statement, params = ext.graph.driver.statements[-1]
+    assert statement == (
+        'MATCH (n:Literature {recid: $key})-[r:SIMILAR]->(m:Literature) '
+        'RETURN m.recid AS key, properties(r) AS properties '
+        'ORDER BY r[$weight] DESC, key LIMIT $limit')
+    assert params == {'key': 1, 'weight': 'score', 'limit': 2}
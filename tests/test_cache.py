@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Relation lookup cache tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import threading
+
+import pytest
+
+from inspire_relations.cache import MISSING, AccessLog, SingleFlight, TTLCache
+
+
+class Clock(object):
+    """Manually advanced timer."""
+
+    def __init__(self):
+        """Start at zero."""
+        self.now = 0
+
+    def __call__(self):
+        """Return the current time."""
+        return self.now
+
+
+def test_lru_eviction():
+    """Test the least recently used entries are evicted."""
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats['evictions'] == 1
+    assert cache.hit_rate() == 0.75
+
+
+def test_ttl_expiry():
+    """Test entries expire after their TTL."""
+    clock = Clock()
+    cache = TTLCache(ttl=10, timer=clock)
+    cache.set('a', None)
+    clock.now = 9
+    assert cache.get('a') is None
+    clock.now = 10
+    assert cache.get('a') is MISSING
+    assert len(cache) == 0
+
+
+def test_delete_many_and_clear():
+    """Test entries are invalidated."""
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.delete_many(['a', 'c'])
+    assert cache.get('a') is MISSING
+    assert cache.stats['invalidations'] == 1
+    cache.clear()
+    assert cache.get('b') is MISSING
+    assert TTLCache(maxsize=0).set('a', 1) is None
+
+
+def test_single_flight():
+    """Test concurrent calls of a key share the call of the first one."""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait()
+        return len(calls)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        flight.do('a', load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while flight.stats['coalesced'] < 4:
+        threading.Event().wait(0.001)
+    assert flight.do('b', lambda: 'b') == 'b'
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [1] * 5
+    assert flight.do('a', load) == 2
+
+    def fail():
+        raise ValueError('Failed.')
+
+    with pytest.raises(ValueError):
+        flight.do('a', fail)
+    assert not flight._calls
+
+
+def test_access_log(tmpdir):
+    """Test counts are merged in the file by every process."""
+    clock = Clock()
+    path = str(tmpdir.join('access.json'))
+    first = AccessLog(path, size=2, flush_interval=10, timer=clock)
+    second = AccessLog(path, size=2, flush_interval=10, timer=clock)
+    first.record([('citations', 1), ('citations', 1), ('references', 2)])
+    assert first.top(10) == []
+
+    clock.now = 10
+    second.record([('citations', 3), ('references', 2), ('references', 2)])
+    assert second.top(10) == [('references', 2), ('citations', 3)]
+    first.flush()
+    first.flush()
+    assert first.top(10) == [('references', 2), ('citations', 1)]
+    second.record([('coauthors', 4)])
+    second.flush()
+    with open(path) as fileobj:
+        assert json.load(fileobj) == [
+            ['references', 2, 3], ['citations', 1, 2]]
+    assert AccessLog(str(tmpdir.join('missing.json'))).top(10) == []
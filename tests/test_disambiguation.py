@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Author disambiguation feature tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import pytest
+from click.testing import CliRunner
+from conftest import author, literature, ref
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.cli import relations
+from inspire_relations.disambiguation import Features, extract_features, \
+    stream_features
+
+
+@pytest.fixture()
+def network():
+    """Papers linked by co-authors, an institution and a collaboration."""
+    atlas = [{'value': 'ATLAS'}]
+    records = [
+        literature(1, authors=[10, 11], collaborations=atlas),
+        literature(2, authors=[11, 12]),
+        literature(3, authors=[13], collaborations=atlas),
+        author(14, positions=[{'institution': {
+            'record': ref('institutions', 100)}}]),
+        literature(5, authors=[11], collaborations=atlas),
+    ]
+    records[-1]['authors'].append({
+        'full_name': 'Smith, J.',
+        'affiliations': [{'record': ref('institutions', 100)}],
+    })
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    return backend
+
+
+def test_extract_features(network):
+    """Test candidates are found through the relations of the paper."""
+    assert extract_features(network, [('SMITHj', [('a', 5)])]) == [
+        ('SMITHj', 'a', {
+            10: Features(1, 0, 1),
+            12: Features(1, 0, 0),
+            13: Features(0, 0, 1),
+            14: Features(0, 1, 0),
+        }),
+    ]
+    assert extract_features(
+        network, [('SMITHj', [('a', 5)]), ('DOEj', [('b', 404)])],
+        max_neighbours=2) == [
+        ('SMITHj', 'a', {14: Features(0, 1, 0)}),
+        ('DOEj', 'b', {}),
+    ]
+
+
+def test_stream_features_in_processes(network):
+    """Test workers yield the features in the order of the blocks."""
+    blocks = [('block{0}'.format(i), [(i, 5), (i + 100, 2)])
+              for i in range(7)]
+    results = list(stream_features(network, iter(blocks), processes=2,
+                                   chunk_size=2))
+    assert [(block, signature) for block, signature, _ in results] == [
+        (block, signature) for block, signatures in blocks
+        for signature, _ in signatures]
+    assert results == extract_features(network, blocks)
+
+
+def test_candidate_features_command(app, network, tmpdir):
+    """Test features are computed for a file of signature blocks."""
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='memory',
+        INSPIRE_RELATIONS_DISAMBIGUATION_PROCESSES=1,
+    )
+    ext = InspireRelations(app)
+    ext.backend = network
+    blocks = tmpdir.join('blocks.jsonl')
+    blocks.write(json.dumps({'block': 'DOEj', 'signatures': [['b', 2]]}))
+
+    result = CliRunner().invoke(
+        relations, ['candidate-features', str(blocks), '-'],
+        obj=ScriptInfo(create_app=lambda *args: app))
+    assert result.exit_code == 0
+    assert json.loads(result.output) == {
+        'block': 'DOEj',
+        'signature': 'b',
+        'candidates': {'10': {'coauthors': 1, 'affiliations': 0,
+                              'collaborations': 0}},
+    }
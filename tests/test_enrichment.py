@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Search index enrichment tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import pytest
+from click.testing import CliRunner
+from conftest import StandInDriver, literature
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.backends.neo4j import Neo4jBackend
+from inspire_relations.cli import relations
+from inspire_relations.enrichment import bulk_actions, bulk_body, \
+    export_enrichment, load_state
+from inspire_relations.graph import GraphPool
+from inspire_relations.sync import apply_diff, diff_relations
+
+INDEXES = {'Literature': 'records-hep', 'Author': 'records-authors'}
+
+
+@pytest.fixture()
+def backend(records):
+    """A memory backend holding the records."""
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    return backend
+
+
+def test_relation_counts(backend):
+    """Test the relation counts are read in batches."""
+    assert list(backend.iter_relation_counts('Literature', batch_size=3)) == [
+        (1, {'citation_count': 3, 'reference_count': 0}),
+        (2, {'citation_count': 2, 'reference_count': 1}),
+        (3, {'citation_count': 1, 'reference_count': 2}),
+        (4, {'citation_count': 0, 'reference_count': 3}),
+    ]
+    assert dict(backend.iter_relation_counts('Author')) == {
+        10: {'coauthor_count': 2, 'paper_count': 2},
+        11: {'coauthor_count': 1, 'paper_count': 2},
+        12: {'coauthor_count': 1, 'paper_count': 2},
+    }
+
+
+def test_neo4j_relation_counts():
+    """Test Neo4j relation counts are read by keyset pages."""
+    backend = Neo4jBackend(GraphPool('bolt://test',
+                                     driver_factory=StandInDriver))
+    pages = {-1: [1, 2], 2: [5]}
+    backend.graph.driver.responder = lambda statement, params: [
+        {'recid': recid, 'citation_count': recid, 'reference_count': 0}
+        for recid in pages[params['after']]]
+    counts = list(backend.iter_relation_counts('Literature', batch_size=2))
+    assert [key for key, _ in counts] == [1, 2, 5]
+    assert counts[2][1] == {'citation_count': 5, 'reference_count': 0}
+    assert [params for _, params in backend.graph.driver.statements] == [
+        {'after': -1, 'limit': 2, 'since': None},
+        {'after': 2, 'limit': 2, 'since': None}]
+
+
+def test_neo4j_changed_counts():
+    """Test Neo4j reads the counts of the nodes stamped since a time."""
+    backend = Neo4jBackend(GraphPool('bolt://test',
+                                     driver_factory=StandInDriver))
+    backend.graph.driver.responder = lambda statement, params: [
+        {'recid': 7, 'citation_count': 1, 'reference_count': 0}]
+    assert list(backend.iter_relation_counts('Literature', since=5)) == [
+        (7, {'citation_count': 1, 'reference_count': 0})]
+    statement, params = backend.graph.driver.statements[0]
+    assert 'n.relations_updated >= $since' in statement
+    assert params == {'after': -1, 'limit': 1000, 'since': 5}
+
+
+def test_changes_are_stamped(backend):
+    """Test synchronized changes stamp the nodes whose counts change."""
+    assert backend.changed_keys('Literature', 0) == []
+    apply_diff(backend, diff_relations(
+        literature(4, references=[1, 2, 3], authors=[10, 12]),
+        literature(4, references=[1, 2, 3], authors=[10, 11])))
+    assert backend.changed_keys('Literature', 0) == []
+    assert backend.changed_keys('Author', 0) == [10, 11, 12]
+    assert backend.changed_keys('Author', 2 ** 62) == []
+
+
+def test_export_sends_changes_only(backend, tmpdir):
+    """Test only the records whose counts changed are updated."""
+    path = str(tmpdir.join('enrichment.json'))
+    sent = []
+    stats = export_enrichment(backend, path, sent.extend, INDEXES,
+                              chunk_size=2, timer=lambda: 1)
+    assert stats == {'literature': 4, 'authors': 3, 'unresolved': 0}
+    assert len(sent) == 7
+    assert load_state(path) == 1000
+
+    del sent[:]
+    stats = export_enrichment(backend, path, sent.extend, INDEXES,
+                              overlap=0)
+    assert stats == {'literature': 0, 'authors': 0, 'unresolved': 0}
+    assert sent == []
+
+    apply_diff(backend, diff_relations(
+        literature(4, references=[1, 2, 3], authors=[10, 12]),
+        literature(4, references=[1, 2], authors=[10, 12])))
+    stats = export_enrichment(backend, path, sent.extend, INDEXES,
+                              overlap=0)
+    assert (stats['literature'], stats['authors']) == (2, 0)
+    assert sorted((action['_id'], action['doc']) for action in sent) == [
+        (3, {'citation_count': 0, 'reference_count': 2}),
+        (4, {'citation_count': 0, 'reference_count': 2}),
+    ]
+
+
+def test_failed_export_is_retried(backend, tmpdir):
+    """Test the state is only replaced once all updates were sent."""
+    path = str(tmpdir.join('enrichment.json'))
+
+    def fail(actions):
+        raise IOError('Search cluster unavailable.')
+
+    with pytest.raises(IOError):
+        export_enrichment(backend, path, fail, INDEXES)
+    assert tmpdir.listdir() == []
+
+    sent = []
+    export_enrichment(backend, path, sent.extend, INDEXES)
+    assert len(sent) == 7
+
+
+def test_bulk_actions():
+    """Test bulk actions are partial updates of the resolved documents."""
+    changes = [('Literature', 1, {'citation_count': 3}),
+               ('Literature', 2, {'citation_count': 1})]
+    actions = bulk_actions(
+        changes, INDEXES, doc_types={'Literature': 'hep'},
+        resolve_ids=lambda label, keys: {1: 'uuid-1'})
+    assert actions == [{'_op_type': 'update', '_index': 'records-hep',
+                        '_type': 'hep', '_id': 'uuid-1',
+                        'doc': {'citation_count': 3}}]
+    assert bulk_body(actions).splitlines() == [
+        '{"update": {"_id": "uuid-1", "_index": "records-hep", '
+        '"_type": "hep"}}',
+        '{"doc": {"citation_count": 3}}',
+    ]
+
+
+def test_enrich_command(app, records, tmpdir):
+    """Test the command writes the bulk requests of the changed counts."""
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='memory',
+        INSPIRE_RELATIONS_ENRICHMENT_STATE=str(tmpdir.join('state.json')),
+    )
+    ext = InspireRelations(app)
+    ext.backend.load(json.dumps(record) for record in records)
+    output = tmpdir.join('bulk.ndjson')
+    obj = ScriptInfo(create_app=lambda *args: app)
+
+    result = CliRunner().invoke(relations, ['enrich'], obj=obj)
+    assert result.exit_code == 2
+    assert 'No enrichment sender configured.' in result.output
+
+    result = CliRunner().invoke(
+        relations, ['enrich', '--output', str(output)], obj=obj)
+    assert result.exit_code == 0
+    assert 'Updated 4 literature records and 3 authors' in result.output
+    assert len(output.readlines()) == 14
+
+    result = CliRunner().invoke(
+        relations, ['enrich', '--output', str(output), '--full'], obj=obj)
+    assert 'Updated 4 literature records and 3 authors' in result.output
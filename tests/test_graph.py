@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Graph connection pool tests."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from conftest import StandInDriver
+
+from inspire_relations import InspireRelations
+from inspire_relations.graph import GraphPool
+
+
+def test_pool_configuration(app):
+    """Test the pool is configured from the application."""
+    app.config.update(
+        INSPIRE_RELATIONS_GRAPH_URI='bolt://graph:7687',
+        INSPIRE_RELATIONS_GRAPH_POOL_SIZE=7,
+    )
+    ext = InspireRelations(app)
+    graph = app.extensions['inspire-relations'].graph
+    assert graph is ext.graph
+    assert not graph.connected
+
+    driver = graph.driver
+    assert graph.connected
+    assert driver.uri == 'bolt://graph:7687'
+    assert driver.options['max_connection_pool_size'] == 7
+    assert driver.options['connection_acquisition_timeout'] == 10
+    assert driver.options['max_connection_lifetime'] == 3600
+    assert graph.driver is driver
+
+
+def test_pool_is_recreated_after_fork(monkeypatch):
+    """Test a forked process does not reuse the parent's driver."""
+    graph = GraphPool('bolt://graph', driver_factory=StandInDriver)
+    parent = graph.driver
+
+    monkeypatch.setattr('os.getpid', lambda: -1)
+    child = graph.driver
+    assert child is not parent
+    assert not parent.closed
+
+    graph.close()
+    assert child.closed
+    assert not graph.connected
+
+
+def test_driver_factory_import_path():
+    """Test the driver factory can be given as an import path."""
+    graph = GraphPool('bolt://graph', driver_factory='conftest:StandInDriver')
+    assert isinstance(graph.driver, StandInDriver)
+
+
+def test_run_and_transaction():
+    """Test statements borrow a session and give it back."""
+    graph = GraphPool('bolt://graph', driver_factory=StandInDriver)
+    graph.driver.responder = lambda statement, params: [{'n': params.get('n')}]
+    assert graph.run('RETURN $n AS n', n=1) == [{'n': 1}]
+    assert all(session.closed for session in graph.driver.sessions)
+
+    with graph.transaction() as tx:
+        tx.run('CREATE (n)')
+    assert tx.committed
+
+    with pytest.raises(ValueError):
+        with graph.transaction() as tx:
+            tx.run('CREATE (m)')
+            raise ValueError()
+    assert tx.rolled_back
+    assert [s for s, _ in graph.driver.statements] == [
+        'RETURN $n AS n', 'CREATE (n)']
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Bulk ingestion tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.cli import relations
+from inspire_relations.ingest import chunked, iter_dump, prepare_batch
+
+
+def test_chunked():
+    """Test iterables are split lazily in chunks."""
+    assert list(chunked(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], 2)) == []
+
+
+def test_iter_dump():
+    """Test JSON lines dumps are parsed lazily."""
+    assert list(iter_dump(['{"a": 1}\n', '\n', '{"b": 2}'])) == [
+        {'a': 1}, {'b': 2}]
+
+
+def test_prepare_batch(records):
+    """Test batches are grouped by label and relation type."""
+    nodes, relations = prepare_batch(records + [{'foo': 'bar'}])
+    assert sorted(nodes) == ['Author', 'Literature']
+    assert sorted(row['key'] for row in nodes['Literature']) == [1, 2, 3, 4]
+    assert len(relations['CITES', 'Literature', 'Literature']) == 6
+    assert len(relations['WRITTEN_BY', 'Literature', 'Author']) == 6
+
+
+def test_ingest_writes_batches(app, records):
+    """Test every batch is written in one transaction by UNWIND statements."""
+    ext = InspireRelations(app)
+    with app.app_context():
+        stats = ext.ingest(iter(records), batch_size=4)
+    assert stats == {
+        'records': 7, 'nodes': 7, 'relations': 12, 'batches': 2}
+
+    check, statements = ext.graph.driver.statements[0], \
+        ext.graph.driver.statements[1:]
+    assert check[0] == 'CALL db.indexes()'
+    assert all(s.startswith('UNWIND $rows AS row') for s, _ in statements)
+    assert len(statements) == 3 + 1
+    first = dict(statements[:3])
+    assert len(first[
+        'UNWIND $rows AS row '
+        'MERGE (a:Literature {recid: row.start}) '
+        'MERGE (b:Literature {recid: row.end}) '
+        'MERGE (a)-[r:CITES]->(b) '
+        'SET r = row.properties'
+    ]['rows']) == 6
+
+
+def test_reload_command(app, records, tmpdir):
+    """Test the reload command."""
+    InspireRelations(app)
+    dump = tmpdir.join('records.jsonl')
+    dump.write('\n'.join(json.dumps(record) for record in records))
+
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda *args: app)
+    result = runner.invoke(
+        relations, ['reload', str(dump), '--batch-size', '2'],
+        obj=script_info)
+    assert result.exit_code == 0
+    assert 'Loaded 7 records: 7 nodes and 12 relations in 4 batches.' in \
+        result.output
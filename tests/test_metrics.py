@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Citation metrics tests."""
+
+from __future__ import absolute_import, print_function
+
+from click.testing import CliRunner
+from conftest import literature
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations, cypher
+from inspire_relations.cli import relations
+
+
+def test_citations_maintain_metrics(app):
+    """Test incremental citation changes maintain the metrics."""
+    ext = InspireRelations(app)
+    ext.sync_record(None, literature(1, references=[2], authors=[10]))
+
+    statements = [s for s, _ in ext.graph.driver.statements]
+    assert statements[-3:] == [
+        cypher.stamp_nodes('Author'), cypher.stamp_nodes('Literature'),
+        cypher.STAMP_PAPER_AUTHORS]
+    assert statements[-4] == cypher.ADD_CITATIONS
+    assert 'WRITTEN_BY' in statements[-5]
+    assert cypher.add_relations('WRITTEN_BY', 'Literature', 'Author') == \
+        cypher.merge_relations('WRITTEN_BY', 'Literature', 'Author')
+    assert cypher.remove_relations('CITES', 'Literature', 'Literature') == \
+        cypher.REMOVE_CITATIONS
+
+
+def test_recompute_metrics(app):
+    """Test metrics are recomputed in batches of nodes."""
+    ext = InspireRelations(app)
+    nodes = {'Literature': [1, 2, 3], 'Author': [10]}
+
+    def respond(statement, parameters):
+        if statement.startswith('MATCH (n:'):
+            label = statement[len('MATCH (n:'):].split(')')[0]
+            return [{'recid': recid} for recid in nodes[label]
+                    if recid > parameters['after']][:parameters['limit']]
+        return []
+
+    ext.graph.driver.responder = respond
+    with app.app_context():
+        app.config['INSPIRE_RELATIONS_METRICS_BATCH_SIZE'] = 2
+        assert ext.recompute_metrics() == {'literature': 3, 'authors': 1}
+
+    writes = [(statement, parameters['recids']) for statement, parameters
+              in ext.graph.driver.statements if 'recids' in parameters]
+    assert writes == [
+        (cypher.RECOMPUTE_CITATION_FLAGS, [1, 2]),
+        (cypher.RECOMPUTE_CITATION_FLAGS, [3]),
+        (cypher.RECOMPUTE_LITERATURE_METRICS, [1, 2]),
+        (cypher.RECOMPUTE_LITERATURE_METRICS, [3]),
+        (cypher.RECOMPUTE_CITATION_MONTHS, [1, 2]),
+        (cypher.RECOMPUTE_CITATION_MONTHS, [3]),
+        (cypher.RECOMPUTE_AUTHOR_METRICS, [10]),
+    ]
+
+    result = CliRunner().invoke(
+        relations, ['recompute-metrics'],
+        obj=ScriptInfo(create_app=lambda *args: app))
+    assert result.exit_code == 0
+    assert 'Recomputed the metrics of 3 literature records and 1 authors.' \
+        in result.output
+
+
+def test_read_metrics(app):
+    """Test materialized metrics are read from the nodes."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = lambda statement, parameters: [{
+        'citation_count': 3,
+        'citation_count_without_self_citations': 2,
+        'citation_years': [2015, 2016, 2017],
+        'citations_per_year': [1, 0, 2],
+    }]
+    assert ext.query.literature_metrics(1) == {
+        'citation_count': 3,
+        'citation_count_without_self_citations': 2,
+        'citations_per_year': {2015: 1, 2017: 2},
+    }
+
+    ext.graph.driver.responder = lambda statement, parameters: [{
+        'citation_count': None,
+        'citation_count_without_self_citations': None,
+        'h_index': None,
+    }]
+    assert ext.query.author_metrics(10) == {
+        'citation_count': 0,
+        'citation_count_without_self_citations': 0,
+        'h_index': 0,
+    }
+
+    ext.graph.driver.responder = lambda statement, parameters: []
+    assert ext.query.literature_metrics(1) is None
+    assert ext.query.author_metrics(1) is None
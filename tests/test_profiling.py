@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Query profiling tests."""
+
+from __future__ import absolute_import, print_function
+
+import logging
+
+from conftest import StandInDriver
+
+from inspire_relations import InspireRelations
+from inspire_relations.graph import GraphPool
+from inspire_relations.profiling import QueryProfiler, current_tags, \
+    format_plan, iter_operation, operation
+
+
+class Explained(list):
+    """Records of a statement, with the summary of an ``EXPLAIN``."""
+
+    def consume(self):
+        """Return the summary, holding the plan."""
+        return self
+
+    @property
+    def plan(self):
+        """Return a plan as given by recent drivers."""
+        return {'operatorType': 'ProduceResults', 'args': {},
+                'children': [{'operatorType': 'NodeIndexSeek',
+                              'args': {'EstimatedRows': 1.0},
+                              'children': []}]}
+
+
+def test_operation_tags():
+    """Test queries are tagged with their innermost and outermost tags."""
+    assert current_tags() == ('other', 'other')
+    with operation('ingest'):
+        with operation('ingest-batch'):
+            assert current_tags() == ('ingest-batch', 'ingest')
+        assert current_tags() == ('ingest', 'ingest')
+
+    def produce():
+        yield current_tags()
+        yield current_tags()
+
+    pages = iter_operation('citations', produce())
+    assert next(pages) == ('citations', 'citations')
+    assert current_tags() == ('other', 'other')
+    assert list(pages) == [('citations', 'citations')]
+
+
+def test_profiled_queries(caplog):
+    """Test queries are timed and the slow ones logged with their plans."""
+    times = [0.0, 0.5, 1.0, 2.75]
+    profiler = QueryProfiler(slow_threshold=1.0,
+                             timer=lambda: times.pop(0))
+    graph = GraphPool('bolt://graph', driver_factory=StandInDriver,
+                      profiler=profiler)
+    graph.driver.responder = lambda statement, parameters: Explained()
+
+    with caplog.at_level(logging.WARNING, logger='inspire_relations'):
+        with operation('citations'):
+            graph.run('MATCH (n) RETURN n')
+        with operation('ingest-batch'):
+            with graph.transaction() as tx:
+                tx.run('MERGE (n:Literature)', rows=[{'key': 1}, {'key': 2}],
+                       stamp=5)
+    assert [statement for statement, _ in graph.driver.statements] == [
+        'MATCH (n) RETURN n', 'MERGE (n:Literature)',
+        'EXPLAIN MERGE (n:Literature)']
+    assert graph.driver.statements[-1][1] == {'rows': [{'key': 1}],
+                                              'stamp': 5}
+    assert caplog.records[-1].getMessage().splitlines() == [
+        'Slow ingest-batch graph query from ingest-batch took 1.750s.',
+        'MERGE (n:Literature)',
+        '  ProduceResults',
+        '    NodeIndexSeek (estimated rows: 1)',
+    ]
+
+    metrics = profiler.render()
+    assert 'inspire_relations_graph_query_duration_seconds_bucket' \
+        '{operation="citations",source="citations",le="1"} 1' in metrics
+    assert 'inspire_relations_graph_query_duration_seconds_bucket' \
+        '{operation="ingest-batch",source="ingest-batch",le="1"} 0' \
+        in metrics
+    assert 'inspire_relations_graph_query_duration_seconds_count' \
+        '{operation="ingest-batch",source="ingest-batch"} 1' in metrics
+    assert 'inspire_relations_graph_slow_queries_total' \
+        '{operation="ingest-batch",source="ingest-batch"} 1' in metrics
+
+
+def test_failed_queries_are_counted():
+    """Test failed queries are counted as errors."""
+    profiler = QueryProfiler()
+    graph = GraphPool('bolt://graph', driver_factory=StandInDriver,
+                      profiler=profiler)
+
+    def fail(statement, parameters):
+        raise IOError('Connection lost.')
+
+    graph.driver.responder = fail
+    try:
+        graph.run('MATCH (n) RETURN n')
+    except IOError:
+        pass
+    assert 'inspire_relations_graph_query_errors_total' \
+        '{operation="other",source="other"} 1' in profiler.render()
+
+
+def test_format_plan():
+    """Test plans of older drivers are formatted too."""
+    class Plan(object):
+        operator_type = 'AllNodesScan'
+        arguments = {'EstimatedRows': 12.0}
+        children = []
+
+    assert format_plan(Plan()) == ['AllNodesScan (estimated rows: 12)']
+
+
+def test_metrics_endpoint(app):
+    """Test the queries of requests are attributed to their endpoint."""
+    ext = InspireRelations(app)
+    with app.test_client() as client:
+        client.get('/relations/lit/1/citations').get_data()
+        res = client.get('/relations/metrics')
+    assert res.status_code == 200
+    assert res.mimetype == 'text/plain'
+    assert 'inspire_relations_graph_query_duration_seconds_count' \
+        '{operation="citations",source="inspire_relations.relations"} 1' \
+        in res.get_data(as_text=True)
+
+    ext.graph.profiler = None
+    with app.test_client() as client:
+        assert client.get('/relations/metrics').status_code == 404
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Relation lookup tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import threading
+
+from conftest import literature
+
+from inspire_relations import InspireRelations
+from inspire_relations.query import invalidated_keys
+
+
+def respond(statement, parameters):
+    """Answer lookups with fixed relations."""
+    if 'count(c)' in statement:
+        return [{'count': 2}]
+    return [{'recid': 3}, {'recid': 4}]
+
+
+def test_lookups_are_cached(app):
+    """Test repeated lookups hit the cache."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = respond
+    query = ext.query
+
+    for _ in range(3):
+        assert query.citation_count(1) == 2
+        assert query.citations(1) == (3, 4)
+        assert query.references(1) == (3, 4)
+        assert query.coauthors(10) == (3, 4)
+        assert query.author_papers(10) == (3, 4)
+    assert len(ext.graph.driver.statements) == 5
+    assert query.cache.hit_rate() == 10.0 / 15
+
+
+def test_invalidated_keys():
+    """Test only the lookups affected by a change are invalidated."""
+    old = literature(1, references=[2, 3], authors=[10, 11])
+    new = literature(1, references=[3, 4], authors=[10, 11])
+    assert invalidated_keys(old, new) == set([
+        ('citation_count', 2), ('citations', 2), ('monthly_citations', 2),
+        ('citation_count', 4), ('citations', 4), ('monthly_citations', 4),
+        ('references', 1),
+    ])
+
+    new = literature(1, references=[2, 3], authors=[10])
+    assert invalidated_keys(old, new) == set([
+        ('author_papers', 10), ('coauthors', 10),
+        ('author_papers', 11), ('coauthors', 11),
+    ])
+    assert invalidated_keys(old, old) == set()
+
+
+def test_sync_invalidates_lookups(app):
+    """Test written changes invalidate the cached lookups."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = respond
+    ext.query.citations(2)
+    ext.query.citations(5)
+
+    ext.sync_record(literature(1, references=[2]), literature(1))
+    ext.query.citations(2)
+    ext.query.citations(5)
+    assert ext.query.cache.stats == {
+        'hits': 1, 'misses': 3, 'invalidations': 1}
+
+    ext._written([(literature(1), literature(1, references=[5]))])
+    ext.query.citations(5)
+    assert ext.query.cache.stats['misses'] == 4
+
+
+def test_invalidation_during_read(app):
+    """Test results invalidated while being read are not cached."""
+    ext = InspireRelations(app)
+    reads = []
+
+    def respond(statement, parameters):
+        if 'recids' in parameters:
+            return [{'recid': recid, 'value': [3, 4]}
+                    for recid in parameters['recids']]
+        if 'recid' in parameters:
+            reads.append(parameters)
+            if len(reads) == 1:
+                ext.sync_record(literature(1, references=[2]),
+                                literature(1))
+            return [{'recid': 3}, {'recid': 4}]
+        return []
+
+    ext.graph.driver.responder = respond
+    assert ext.query.citations(2) == (3, 4)
+    assert ext.query.cache.get_many([('citations', 2)]) == {}
+    assert ext.query.lookup_many(['citations'], [2]) == {
+        2: {'citations': (3, 4)}}
+    assert ext.query.citations(2) == (3, 4)
+    assert len(reads) == 1
+    assert not ext.query._reading and not ext.query._invalidated
+
+
+def test_lookup_many(app):
+    """Test many records are answered at once, minus the cached ones."""
+    ext = InspireRelations(app)
+
+    def respond(statement, parameters):
+        if 'count(x)' in statement:
+            return [{'recid': recid, 'value': recid * 10}
+                    for recid in parameters['recids']]
+        return [{'recid': recid, 'value': [recid + 1]}
+                for recid in parameters['recids']]
+
+    ext.graph.driver.responder = respond
+    query = ext.query
+    query.cache.set(('citation_count', 2), 7)
+
+    assert query.lookup_many(['citation_count', 'references'], [1, 2]) == {
+        1: {'citation_count': 10, 'references': (2,)},
+        2: {'citation_count': 7, 'references': (3,)},
+    }
+    statements = ext.graph.driver.statements
+    assert len(ext.graph.driver.sessions) == 1
+    assert ext.graph.driver.transactions[-1].statements == statements
+    assert [parameters for _, parameters in statements] == [
+        {'recids': [1]}, {'recids': [1, 2]}]
+
+    assert query.citation_counts([1, 2]) == {1: 10, 2: 7}
+    assert len(statements) == 2
+
+
+def test_concurrent_misses_are_coalesced(app):
+    """Test concurrent misses of a lookup share one backend query."""
+    ext = InspireRelations(app)
+    release = threading.Event()
+
+    def respond(statement, parameters):
+        release.wait()
+        return [{'recid': 3}]
+
+    ext.graph.driver.responder = respond
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        ext.query.citations(1))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while ext.query.flight.stats['coalesced'] < 3:
+        threading.Event().wait(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == [(3,)] * 4
+    assert len(ext.graph.driver.statements) == 1
+
+
+def test_warm_start(app, records, tmpdir):
+    """Test the most requested lookups are cached on start."""
+    path = str(tmpdir.join('access.json'))
+    with open(path, 'w') as fileobj:
+        json.dump([['citations', 1, 5], ['citation_count', 1, 4],
+                   ['citations', 2, 3], ['unknown', 1, 2]], fileobj)
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='memory',
+        INSPIRE_RELATIONS_MEMORY_DUMP=str(tmpdir.join('dump.jsonl')),
+        INSPIRE_RELATIONS_ACCESS_LOG=path,
+        INSPIRE_RELATIONS_WARM_START=2,
+    )
+    with open(app.config['INSPIRE_RELATIONS_MEMORY_DUMP'], 'w') as dump:
+        dump.writelines(json.dumps(record) + '\n' for record in records)
+    ext = InspireRelations(app)
+    assert len(ext.query.cache) == 2
+    assert ext.query.citations(1) == (2, 3, 4)
+    assert ext.query.citation_count(1) == 3
+    assert ext.query.cache.stats['hits'] == 2
+
+    ext.query.citations(2)
+    ext.access_log.flush()
+    with app.app_context():
+        assert ext.warm_cache(limit=10) == 0
+        ext.query.cache.clear()
+        assert ext.warm_cache(limit=10) == 3
+    assert ext.access_log.top(1) == [('citations', 1)]
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Record relation extraction tests."""
+
+from __future__ import absolute_import, print_function
+
+from conftest import author, literature, ref
+
+from inspire_relations.records import AUTHOR, INSTITUTION, LITERATURE, Node, \
+    Relation, get_label, get_node, get_recid_from_ref, get_relations
+
+
+def test_get_label():
+    """Test records are labelled after their schema."""
+    assert get_label(literature(1)) == LITERATURE
+    assert get_label(author(1)) == AUTHOR
+    assert get_label({'$schema': {'$ref': 'institutions.json'}}) == \
+        INSTITUTION
+    assert get_label({'$schema': 'data.json'}) is None
+    assert get_label({}) is None
+
+
+def test_get_recid_from_ref():
+    """Test record ids are read from JSON references."""
+    assert get_recid_from_ref(ref('literature', 12)) == 12
+    assert get_recid_from_ref({'$ref': 'http://x/api/literature/'}) is None
+    assert get_recid_from_ref(None) is None
+
+
+def test_get_node():
+    """Test the node of a record."""
+    orcid = {'schema': 'ORCID', 'value': '0000-0002-1825-0097'}
+    assert get_node(author(5, ids=[orcid])) == Node(
+        AUTHOR, 5, {'recid': 5, 'orcid': '0000-0002-1825-0097'})
+    assert get_node({'$schema': 'hep.json'}) is None
+    assert get_node(literature(
+        1, preprint_date='2015-03', publication_info=[{'year': 2016}],
+    )) == Node(LITERATURE, 1, {'recid': 1, 'year': 2015})
+    assert get_node(literature(1, refereed=True)) == Node(
+        LITERATURE, 1, {'recid': 1, 'refereed': True})
+
+
+def test_get_relations_of_literature():
+    """Test the relations of a literature record."""
+    record = literature(
+        1, references=[2, 2, 3], authors=[10],
+        publication_info=[{
+            'journal_record': ref('journals', 20),
+            'conference_record': ref('conferences', 30),
+        }],
+        accelerator_experiments=[{'recid': 40}],
+        collaborations=[{'value': 'ATLAS'}],
+    )
+    record['authors'][0]['affiliations'] = [
+        {'value': 'CERN', 'record': ref('institutions', 50)}]
+    record['references'].append({'reference': {'title': 'Unlinked'}})
+
+    assert get_relations(record) == [
+        Relation('CITES', (LITERATURE, 1), (LITERATURE, 2), {}),
+        Relation('CITES', (LITERATURE, 1), (LITERATURE, 3), {}),
+        Relation('WRITTEN_BY', (LITERATURE, 1), (AUTHOR, 10), {}),
+        Relation('AFFILIATED_WITH', (LITERATURE, 1), (INSTITUTION, 50), {}),
+        Relation('PUBLISHED_IN', (LITERATURE, 1), ('Journal', 20), {}),
+        Relation('PRESENTED_AT', (LITERATURE, 1), ('Conference', 30), {}),
+        Relation('BELONGS_TO', (LITERATURE, 1), ('Experiment', 40), {}),
+        Relation('IN_COLLABORATION', (LITERATURE, 1),
+                 ('Collaboration', 'ATLAS'), {}),
+    ]
+
+
+def test_get_relations_of_author():
+    """Test the relations of an author record."""
+    record = author(10, positions=[
+        {'institution': {'name': 'CERN', 'record': ref('institutions', 50)}},
+        {'institution': {'name': 'Nowhere'}},
+    ])
+    assert get_relations(record) == [
+        Relation('AFFILIATED_WITH', (AUTHOR, 10), (INSTITUTION, 50), {})]
+    assert get_relations({'$schema': 'journals.json',
+                          'control_number': 1}) == []
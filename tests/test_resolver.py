@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Reference resolution tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+from click.testing import CliRunner
+from conftest import literature
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.cli import relations
+from inspire_relations.ingest import ingest
+from inspire_relations.records import CITES, LITERATURE, get_identifiers, \
+    get_node
+from inspire_relations.resolver import ReferenceIndex, ReferenceResolver, \
+    get_reference_identifiers, resolve_chunk, resolve_references
+
+
+def paper(recid, references=(), **identifiers):
+    """Return a literature record with identifiers."""
+    record = literature(recid, references=references)
+    record.update(identifiers)
+    return record
+
+
+def cited(recid):
+    """Return literature identified by a DOI, an eprint and a pubnote."""
+    return paper(
+        recid,
+        dois=[{'value': '10.1103/PhysRevD.{0}'.format(recid)}],
+        arxiv_eprints=[{'value': '1403.{0:04d}'.format(recid)}],
+        report_numbers=[{'value': 'CERN-TH-{0}'.format(recid)}],
+        publication_info=[{'journal_title': 'Phys. Rev. D',
+                           'journal_volume': '90',
+                           'page_start': str(recid)}],
+    )
+
+
+def test_get_identifiers():
+    """Test the identifiers of literature are normalized on its node."""
+    record = paper(
+        1,
+        dois=[{'value': 'https://doi.org/10.1103/PhysRevD.90.012001'},
+              {'value': 'doi:10.1103/physrevd.90.012001'}],
+        arxiv_eprints=[{'value': 'arXiv:hep-th/9901001v2'}],
+        report_numbers=[{'value': 'cern th 2016_123'}],
+        publication_info=[{'journal_title': 'Phys. Rev. D',
+                           'journal_volume': '90', 'artid': '012001'},
+                          {'journal_title': 'Phys. Rev. D'}],
+    )
+    assert get_identifiers(record) == {
+        'dois': ['10.1103/physrevd.90.012001'],
+        'arxiv_eprints': ['hep-th/9901001'],
+        'report_numbers': ['CERN-TH-2016-123'],
+        'pubnotes': ['physrevd:90:012001'],
+    }
+    assert get_node(record).properties['dois'] == [
+        '10.1103/physrevd.90.012001']
+    assert 'dois' not in get_node(literature(2)).properties
+
+
+def test_get_reference_identifiers():
+    """Test identifiers are read from structured fields and raw strings."""
+    reference = {
+        'reference': {
+            'arxiv_eprint': '1403.1234v2',
+            'report_numbers': ['CERN-TH-2016-123'],
+            'publication_info': {'journal_title': 'Phys.Rev.D',
+                                 'journal_volume': '90',
+                                 'page_start': '012001-012010'},
+        },
+        'raw_refs': [{
+            'schema': 'text',
+            'value': 'J. Smith, Phys. Rev. D 90 (2014) 012001, '
+                     'doi:10.1103/PhysRevD.90.012001; hep-th/9901001',
+        }],
+    }
+    assert get_reference_identifiers(reference) == {
+        'dois': set(['10.1103/physrevd.90.012001']),
+        'arxiv_eprints': set(['1403.1234', 'hep-th/9901001']),
+        'report_numbers': set(['CERN-TH-2016-123']),
+        'pubnotes': set(['physrevd:90:012001']),
+    }
+    assert get_reference_identifiers({'raw_refs': [
+        {'schema': 'text', 'value': 'Smith 2014.12345'}]}) == {}
+
+
+def test_raw_eprints():
+    """Test only whole tokens of raw strings are taken for eprints."""
+    raw = ('ATLAS, Phys. Lett. B 716 (2012) 1, 1207.7214. '
+           'arXiv:1207.7235v2 and hep-ph/0409146v1, '
+           'see https://cds.cern.ch/record/1207.7214/files/hep-ph/0409146 '
+           'or http://example.org/data/1403.0001x.pdf')
+    assert get_reference_identifiers({'raw_refs': [
+        {'schema': 'text', 'value': raw}]}) == {
+        'arxiv_eprints': set(['1207.7214', '1207.7235', 'hep-ph/0409146'])}
+    assert get_reference_identifiers({'raw_refs': [
+        {'schema': 'text', 'value': 'www.example.org/12345.67890'}]}) == {}
+
+
+def test_index_match():
+    """Test matches combine identifiers and skip ambiguous ones."""
+    index = ReferenceIndex()
+    index.add(1, {'dois': ['10.1/a'], 'report_numbers': ['R-1'],
+                  'pubnotes': ['j:1:1']})
+    index.add(2, {'report_numbers': ['R-2'], 'pubnotes': ['j:1:2']})
+    index.add(3, {'pubnotes': ['j:1:2'], 'arxiv_eprints': ['1403.0003']})
+    index.add(3, {'arxiv_eprints': ['1403.0003']})
+
+    assert index.match({'dois': ['10.1/a']}) == (1, 1.0)
+    assert index.match({'report_numbers': ['R-1'],
+                        'pubnotes': ['j:1:1']}) == (1, 0.98)
+    assert index.match({'pubnotes': ['j:1:2']}) is None
+    assert index.match({'arxiv_eprints': ['1403.0003']}) == (3, 1.0)
+    assert index.match({'arxiv_eprints': ['1403.0003']}, exclude=3) is None
+    assert index.match({'report_numbers': ['R-2'],
+                        'pubnotes': ['j:1:1']}) == (2, 0.9)
+    assert index.match({'report_numbers': ['R-1'],
+                        'arxiv_eprints': ['1403.0003']}) == (3, 1.0)
+    assert index.match({'report_numbers': ['R-2', 'R-1']}) is None
+
+
+def test_resolve_references_in_processes():
+    """Test workers find the same relations as the current process."""
+    index = ReferenceIndex()
+    for recid in range(1, 20):
+        index.add(recid, {'dois': ['10.1/{0}'.format(recid)]})
+    references = [(citing, {'dois': ['10.1/{0}'.format(recid)]}, None)
+                  for citing in range(1, 8) for recid in range(1, 20, 3)]
+    relations = list(resolve_references(
+        index, iter(references), processes=2, chunk_size=4))
+    assert sorted(relations) == sorted(resolve_chunk(index, references))
+    assert len(relations) == 7 * 7 - 3
+    assert relations[0] == (CITES, (LITERATURE, 1), (LITERATURE, 4),
+                            {'confidence': 1.0})
+
+
+def test_ingest_resolves_references():
+    """Test references are linked to records of the same ingestion."""
+    citing = paper(5, references=[1])
+    citing['references'] += [
+        {'reference': {'dois': ['10.1103/PhysRevD.2']}},
+        {'raw_refs': [{'schema': 'text', 'value': 'arXiv:1403.0003v1'}]},
+        {'reference': {'report_numbers': ['CERN TH 4'],
+                       'publication_info': {'journal_title': 'Phys.Rev.D',
+                                            'journal_volume': '90',
+                                            'page_start': '4'}}},
+        {'reference': {'dois': ['10.1103/PhysRevD.5']}},
+        {'reference': {'dois': ['10.1103/unknown']}},
+    ]
+    records = [citing, cited(1), cited(2), cited(3), cited(4)]
+    records[4]['dois'] = [{'value': '10.1103/PhysRevD.5'}]
+    backend = MemoryBackend()
+    resolver = ReferenceResolver(processes=1, max_pending=2)
+
+    resolver.collect(records[:1])
+    assert (len(resolver.pending), resolver.spilled) == (0, 5)
+    resolver.resolve(MemoryBackend())
+    assert resolver.spilled == 0
+
+    stats = ingest(backend, iter(records), batch_size=2, resolver=resolver)
+    assert stats['resolved'] == 3
+    assert resolver.pending == []
+    assert backend.neighbours_many(
+        CITES, LITERATURE, LITERATURE, [5])[5] == (1, 2, 3, 4)
+    assert backend.properties_many(LITERATURE, [4])[4]['dois'] == [
+        '10.1103/physrevd.5']
+
+
+def test_reload_command_resolves(app, tmpdir):
+    """Test the reload command resolves references when configured."""
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='memory',
+        INSPIRE_RELATIONS_RESOLVE_REFERENCES=True,
+        INSPIRE_RELATIONS_RESOLVER_PROCESSES=1,
+    )
+    InspireRelations(app)
+    citing = paper(5)
+    citing['references'] = [{'reference': {'arxiv_eprint': '1403.0001'}}]
+    dump = tmpdir.join('records.jsonl')
+    dump.write('\n'.join(json.dumps(record)
+                         for record in [citing, cited(1)]))
+
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda *args: app)
+    result = runner.invoke(relations, ['reload', str(dump)], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Resolved 1 references.' in result.output
+
+    result = runner.invoke(relations, ['reload', str(dump), '--no-resolve'],
+                           obj=script_info)
+    assert result.exit_code == 0
+    assert 'Resolved' not in result.output
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Graph schema tests."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from click.testing import CliRunner
+from conftest import literature
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.cli import relations
+from inspire_relations.schema import CONSTRAINTS, Constraint, Index, \
+    Migration, SchemaError, check_schema, create_schema, get_schema_report, \
+    migrate
+
+
+def indexes(*states):
+    """Return a responder listing indexes in the format of Neo4j 3.x."""
+    def respond(statement, parameters):
+        if statement == 'CALL db.indexes()':
+            return [{'tokenNames': [label], 'properties': [property_],
+                     'state': state} for (label, property_), state in states]
+        return []
+    return respond
+
+
+def test_schema_report(app):
+    """Test the state of the declared schema is reported."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = indexes(
+        (('Literature', 'recid'), 'ONLINE'),
+        (('Author', 'orcid'), 'POPULATING'),
+        (('Literature', 'title'), 'ONLINE'),
+    )
+    report = dict(get_schema_report(ext.graph))
+    assert report[Constraint('Literature', 'recid')] == 'ONLINE'
+    assert report[Constraint('Author', 'recid')] is None
+    assert report[Index('Author', 'orcid')] == 'POPULATING'
+    assert report[Index('Literature', 'last_citation_month')] is None
+    assert len(report) == len(CONSTRAINTS) + 4
+
+    with pytest.raises(SchemaError) as excinfo:
+        check_schema(ext.graph)
+    assert 'Author.recid' in str(excinfo.value)
+    assert 'Literature.recid' not in str(excinfo.value)
+
+
+def test_create_schema(app):
+    """Test only missing constraints and indexes are created."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = indexes(
+        *[(tuple(constraint), 'ONLINE') for constraint in CONSTRAINTS[1:]])
+    assert create_schema(ext.graph) == [
+        CONSTRAINTS[0], Index('Author', 'orcid'),
+        Index('Literature', 'last_citation_month'),
+        Index('Author', 'relations_updated'),
+        Index('Literature', 'relations_updated')]
+    assert [s for s, _ in ext.graph.driver.statements[1:]] == [
+        'CREATE CONSTRAINT ON (n:Author) ASSERT n.recid IS UNIQUE',
+        'CREATE INDEX ON :Author(orcid)',
+        'CREATE INDEX ON :Literature(last_citation_month)',
+        'CREATE INDEX ON :Author(relations_updated)',
+        'CREATE INDEX ON :Literature(relations_updated)',
+    ]
+
+
+def test_migrate(app):
+    """Test only pending migrations are applied, in order."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = lambda statement, parameters: (
+        [{'version': 1}] if statement.startswith('MATCH (v:') else [])
+    applied = []
+    migrations = [
+        Migration(3, 'Third', lambda graph: applied.append(3)),
+        Migration(1, 'First', lambda graph: applied.append(1)),
+        Migration(2, 'Second', lambda graph: applied.append(2)),
+    ]
+    assert [m.version for m in migrate(ext.graph, migrations)] == [2, 3]
+    assert applied == [2, 3]
+    versions = [parameters['version'] for _, parameters
+                in ext.graph.driver.statements if 'version' in parameters]
+    assert versions == [2, 3]
+
+
+def test_ingestion_requires_schema(app):
+    """Test ingestion refuses to run without the constraints."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = indexes()
+    with app.app_context():
+        with pytest.raises(SchemaError):
+            ext.ingest([literature(1)])
+        app.config['INSPIRE_RELATIONS_SCHEMA_CHECK'] = False
+        assert ext.ingest([literature(1)])['records'] == 1
+
+
+def test_schema_commands(app):
+    """Test the schema commands."""
+    ext = InspireRelations(app)
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda *args: app)
+
+    result = runner.invoke(relations, ['schema', 'status'], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Schema version: 0' in result.output
+    assert 'Constraint Literature.recid: ONLINE' in result.output
+    assert 'Index Author.orcid: MISSING' in result.output
+
+    result = runner.invoke(relations, ['schema', 'migrate'], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Applied migration 1: Create constraints and indexes' in \
+        result.output
+    assert 'CREATE INDEX ON :Author(orcid)' in [
+        s for s, _ in ext.graph.driver.statements]
+
+    result = runner.invoke(relations, ['schema', 'create'], obj=script_info)
+    assert 'Created Index Author.orcid' in result.output
+
+    ext.graph.driver.responder = indexes()
+    result = runner.invoke(relations, ['reload', '-'], obj=script_info,
+                           input='{}')
+    assert result.exit_code == 1
+    assert 'Missing graph constraints' in result.output
+
+
+def test_sharded_schema_commands(app):
+    """Test the schema commands run on every shard."""
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='sharded',
+        INSPIRE_RELATIONS_SHARDS=[{}, {}],
+    )
+    ext = InspireRelations(app)
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda *args: app)
+
+    result = runner.invoke(relations, ['schema', 'status'], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Shard 0: Index Author.orcid: MISSING' in result.output
+    assert 'Shard 1: Index Author.orcid: MISSING' in result.output
+
+    result = runner.invoke(relations, ['schema', 'migrate'], obj=script_info)
+    assert result.exit_code == 0
+    for shard in ext.backend.shards:
+        assert 'CREATE INDEX ON :Author(orcid)' in [
+            s for s, _ in shard.graph.driver.statements]
+    assert 'Shard 1: Schema version: ' in result.output
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Sharded backend tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import multiprocessing
+import random
+from itertools import combinations
+
+import pytest
+from conftest import author, literature
+
+from inspire_relations import InspireRelations, cypher
+from inspire_relations.backends import CITATION_FILTERS, LOOKUPS
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.backends.sharded import HashRing, ShardedBackend
+from inspire_relations.ingest import ingest
+from inspire_relations.records import AUTHOR, CITES, LITERATURE, SIMILAR, \
+    WRITTEN_BY
+from inspire_relations.sync import apply_diff, diff_relations
+
+
+def collection(papers=40, authors=12, seed=0):
+    """Return records with random citations, authors and collaborations."""
+    random_ = random.Random(seed)
+    records = []
+    for recid in range(1, papers + 1):
+        record = literature(
+            recid,
+            references=random_.sample(range(1, recid), min(recid - 1, 5)),
+            authors=random_.sample(range(100, 100 + authors), 3),
+            earliest_date=str(2000 + recid % 5),
+            refereed=recid % 2 == 0,
+        )
+        if recid % 3 == 0:
+            record['collaborations'] = [{'value': 'CMS'}]
+        records.append(record)
+    records.extend(author(recid) for recid in range(100, 100 + authors))
+    return records
+
+
+@pytest.fixture()
+def backends():
+    """A memory backend and three sharded memory backends, same records."""
+    records = collection()
+    single = MemoryBackend()
+    sharded = ShardedBackend([MemoryBackend() for _ in range(3)])
+    ingest(single, records)
+    ingest(sharded, records)
+    yield single, sharded
+    sharded.close()
+
+
+def test_hash_ring():
+    """Test keys are spread evenly and few move when a shard is added."""
+    three, four = HashRing(3), HashRing(4)
+    owners = [three.shard(key) for key in range(3000)]
+    assert owners == [HashRing(3).shard(key) for key in range(3000)]
+    assert min(owners.count(shard) for shard in range(3)) > 700
+    moved = sum(1 for key, owner in enumerate(owners)
+                if four.shard(key) != owner)
+    assert moved < 1000
+    assert all(four.shard(key) == 3 for key, owner in enumerate(owners)
+               if four.shard(key) != owner)
+
+
+def test_ghost_edges(backends):
+    """Test relations are on the shards of both ends, nodes on their own."""
+    single, sharded = backends
+    counts = [sum(1 for _ in shard.iter_relations(
+        CITES, LITERATURE, LITERATURE)) for shard in sharded.shards]
+    total = sum(1 for _ in single.iter_relations(
+        CITES, LITERATURE, LITERATURE))
+    assert total < sum(counts) < 2 * total
+    assert sorted(sharded.iter_relations(CITES, LITERATURE, LITERATURE)) == \
+        sorted(single.iter_relations(CITES, LITERATURE, LITERATURE))
+    assert sorted(sharded.iter_nodes(LITERATURE, ['year'])) == \
+        sorted(single.iter_nodes(LITERATURE, ['year']))
+    for index, shard in enumerate(sharded.shards):
+        for key, _ in shard.iter_nodes(LITERATURE):
+            assert sharded.owner(key) == index or \
+                not shard.properties_many(LITERATURE, [key])[key]
+
+
+def test_scatter_gather_reads(backends):
+    """Test the sharded backend answers as a single one."""
+    single, sharded = backends
+    papers, authors = list(range(1, 42)), list(range(100, 113))
+    for name in LOOKUPS:
+        keys = authors if name in ('coauthors', 'author_papers') else papers
+        for key in keys:
+            assert sharded.lookup(name, key) == single.lookup(name, key)
+            if name != 'citation_count':
+                assert list(sharded.page(
+                    name, key, after=key // 2, limit=3)) == \
+                    list(single.page(name, key, after=key // 2, limit=3))
+        assert sharded.lookup_many({name: keys}) == \
+            single.lookup_many({name: keys})
+    assert sharded.neighbours_many(WRITTEN_BY, LITERATURE, AUTHOR, authors,
+                                   reverse=True, limit=2) == \
+        single.neighbours_many(WRITTEN_BY, LITERATURE, AUTHOR, authors,
+                               reverse=True, limit=2)
+    assert sharded.properties_many(LITERATURE, papers) == \
+        single.properties_many(LITERATURE, papers)
+
+
+def _read_all(sharded, papers):
+    assert len(sharded.properties_many(LITERATURE, papers)) == len(papers)
+
+
+@pytest.mark.skipif(not hasattr(multiprocessing, 'get_context'),
+                    reason='Needs multiprocessing contexts.')
+def test_scatter_pool_after_fork(backends):
+    """Test forked processes do not use the threads of their parent."""
+    _, sharded = backends
+    papers = list(range(1, 41))
+    _read_all(sharded, papers)
+    process = multiprocessing.get_context('fork').Process(
+        target=_read_all, args=(sharded, papers))
+    process.start()
+    process.join(10)
+    if process.is_alive():
+        process.terminate()
+    assert process.exitcode == 0
+    _read_all(sharded, papers)
+
+
+def test_scatter_gather_citations(backends):
+    """Test filtered citations and metrics are gathered across shards."""
+    single, sharded = backends
+    filter_sets = [filters for size in range(len(CITATION_FILTERS) + 1)
+                   for filters in combinations(CITATION_FILTERS, size)]
+    for label, keys in [(LITERATURE, [1, 2, 7, 30]), (AUTHOR, [100, 105])]:
+        for key in keys:
+            for filters in filter_sets:
+                assert sharded.filtered_citations(
+                    label, key, filters, after=3, limit=10) == \
+                    single.filtered_citations(
+                        label, key, filters, after=3, limit=10)
+                assert sharded.filtered_citation_count(
+                    label, key, filters) == \
+                    single.filtered_citation_count(label, key, filters)
+    for recid in [1, 2, 7, 30, 404]:
+        assert sharded.literature_metrics(recid) == \
+            single.literature_metrics(recid)
+    for recid in [100, 105, 404]:
+        assert sharded.author_metrics(recid) == single.author_metrics(recid)
+
+
+def test_sharded_changes(backends):
+    """Test record changes are written to the shards of both ends."""
+    single, sharded = backends
+    old = collection()[9]
+    new = literature(10, references=[1, 2], authors=[100])
+    for backend in backends:
+        apply_diff(backend, diff_relations(old, new))
+    for recid in [1, 2, 3, 10]:
+        assert sharded.lookup('citations', recid) == \
+            single.lookup('citations', recid)
+    assert sharded.lookup('references', 10) == (1, 2)
+    assert sharded.lookup('coauthors', 100) == single.lookup('coauthors', 100)
+    for label in (LITERATURE, AUTHOR):
+        assert sharded.changed_keys(label, 0) == single.changed_keys(label, 0)
+        assert dict(sharded.iter_relation_counts(label, since=0)) == \
+            dict(single.iter_relation_counts(label, since=0))
+
+
+def test_sharded_similar_papers(backends):
+    """Test similar papers are written and read on the shards."""
+    similarity = pytest.importorskip('inspire_relations.similarity')
+    single, sharded = backends
+    assert similarity.compute_similar(sharded, limit=3) == \
+        similarity.compute_similar(single, limit=3)
+    for recid in range(1, 41):
+        assert sharded.ranked_neighbours(
+            SIMILAR, LITERATURE, LITERATURE, recid, 'score') == \
+            single.ranked_neighbours(
+                SIMILAR, LITERATURE, LITERATURE, recid, 'score')
+
+
+def test_sharded_temporal_queries(backends):
+    """Test citations per month are gathered from the owner shards."""
+    single, sharded = backends
+    recids = list(range(1, 41))
+    assert sharded.monthly_citations_many(recids) == \
+        single.monthly_citations_many(recids)
+    assert sharded.rising_papers(200301, limit=5, batch_size=7) == \
+        single.rising_papers(200301, limit=5)
+
+
+def test_sharded_months_are_counted_from_relations(app):
+    """Test Neo4j shards count the dates of the citations when read."""
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='sharded',
+        INSPIRE_RELATIONS_SHARDS=[{}, {}],
+    )
+    ext = InspireRelations(app)
+    for shard in ext.backend.shards:
+        shard.graph.driver.responder = lambda statement, params: [
+            {'recid': recid, 'months': [201603], 'counts': [2]}
+            for recid in params['recids']]
+    recids = list(range(1, 11))
+    assert ext.backend.monthly_citations_many(recids) == dict(
+        (recid, {201603: 2}) for recid in recids)
+    for shard in ext.backend.shards:
+        assert [statement for statement, params
+                in shard.graph.driver.statements
+                if 'recids' in params] == [cypher.COUNT_MONTHLY_CITATIONS]
+
+
+def test_sharded_extension(app):
+    """Test the extension routes through the configured shards."""
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='sharded',
+        INSPIRE_RELATIONS_SHARDS=[{'INSPIRE_RELATIONS_BACKEND': 'memory'},
+                                  {'INSPIRE_RELATIONS_BACKEND': 'memory'}],
+    )
+    ext = InspireRelations(app)
+    assert isinstance(ext.backend, ShardedBackend)
+    assert len(ext.backend.shards) == 2
+    single = MemoryBackend()
+    ingest(single, collection())
+    with app.app_context():
+        ext.ingest(collection())
+    assert ext.query.coauthors(100) == single.lookup('coauthors', 100)
+    with app.test_client() as client:
+        response = client.get('/relations/lit/1/citations?size=2')
+        assert json.loads(response.get_data(as_text=True))['hits'] == [
+            {'recid': recid} for recid in single.lookup('citations', 1)[:2]]
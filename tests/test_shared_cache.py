@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Shared relation cache tests."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from conftest import StandInDriver, literature
+from flask import Flask
+
+from inspire_relations import InspireRelations
+from inspire_relations.cache import MISSING
+
+fakeredis = pytest.importorskip('fakeredis')
+shared_cache = pytest.importorskip('inspire_relations.shared_cache')
+
+
+def test_versioned_keys():
+    """Test invalidating a record makes all its entries unreachable."""
+    client = fakeredis.FakeStrictRedis()
+    cache = shared_cache.RedisCache(client, ttl=60, prefix='test')
+    cache.set_many([
+        (('citations', 1), (2, 3)),
+        (('citation_count', 1), 2),
+        (('citations', 2), ()),
+        (('monthly_citations', 2), {201603: 1}),
+    ])
+    assert cache.get_many([('citations', 1), ('monthly_citations', 2),
+                           ('references', 1)]) == {
+        ('citations', 1): (2, 3),
+        ('monthly_citations', 2): {201603: 1},
+    }
+    assert cache.stats == {'hits': 2, 'misses': 1}
+    assert 0 < client.ttl('test:0:citations:1:0') <= 60
+
+    cache.delete_many([('citations', 1)])
+    assert cache.get(('citation_count', 1)) is MISSING
+    assert cache.get(('citations', 2)) == ()
+    cache.set(('citation_count', 1), 3)
+    assert cache.get(('citation_count', 1)) == 3
+
+    cache.clear()
+    assert cache.get_many([('citation_count', 1), ('citations', 2)]) == {}
+
+
+def test_values_loaded_during_a_change_are_unreachable():
+    """Test values missed before an invalidation stay unreachable."""
+    server = fakeredis.FakeServer()
+    reader = shared_cache.RedisCache(fakeredis.FakeStrictRedis(server=server))
+    writer = shared_cache.RedisCache(fakeredis.FakeStrictRedis(server=server))
+    assert reader.get_many([('citations', 1), ('citations', 2)]) == {}
+    writer.delete_many([('citations', 1)])
+    reader.set_many([(('citations', 1), (2,)), (('citations', 2), (3,))])
+    assert writer.get_many([('citations', 1), ('citations', 2)]) == {
+        ('citations', 2): (3,)}
+
+    reader.set(('citations', 1), (2, 4))
+    assert writer.get(('citations', 1)) == (2, 4)
+
+
+def test_redis_errors_are_misses():
+    """Test lookups fall back on the graph while Redis is unavailable."""
+    server = fakeredis.FakeServer()
+    server.connected = False
+    cache = shared_cache.RedisCache(fakeredis.FakeStrictRedis(server=server))
+    cache.set(('citations', 1), (2,))
+    assert cache.get(('citations', 1)) is MISSING
+    cache.delete_many([('citations', 1)])
+    cache.clear()
+    assert cache.stats == {'errors': 4}
+
+
+def worker(server):
+    """Return the extension of a process sharing the Redis server."""
+    app = Flask('worker')
+    app.config.update(
+        TESTING=True,
+        INSPIRE_RELATIONS_GRAPH_DRIVER_FACTORY=StandInDriver,
+        INSPIRE_RELATIONS_REDIS_CACHE_URL='redis://localhost:6379/0',
+        INSPIRE_RELATIONS_REDIS_CACHE_CLIENT_FACTORY=lambda url:
+            fakeredis.FakeStrictRedis(server=server),
+    )
+    ext = InspireRelations(app)
+
+    def respond(statement, parameters):
+        if 'recids' in parameters:
+            return [{'recid': recid, 'value': [5]}
+                    for recid in parameters['recids']]
+        return [{'recid': 5}]
+
+    ext.graph.driver.responder = respond
+    return ext
+
+
+def test_lookups_are_shared_by_processes():
+    """Test a lookup cached by a process is used by the others."""
+    server = fakeredis.FakeServer()
+    first, second = worker(server), worker(server)
+    assert first.query.citations(1) == (5,)
+    assert second.query.citations(1) == (5,)
+    assert second.query.lookup_many(['citations', 'references'], [1, 2]) == {
+        1: {'citations': (5,), 'references': (5,)},
+        2: {'citations': (5,), 'references': (5,)},
+    }
+    assert len(first.graph.driver.statements) == 1
+    assert [params for _, params in second.graph.driver.statements] == [
+        {'recids': [2]}, {'recids': [1, 2]}]
+    assert second.query.cache.stats['shared_hits'] == 1
+
+    first.sync_record(literature(3, references=[1]), literature(3))
+    second.query.cache.local.clear()
+    second.query.citations(1)
+    second.query.citations(2)
+    assert len(second.graph.driver.statements) == 3
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Similar papers tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import pytest
+from click.testing import CliRunner
+from conftest import literature
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.cli import relations
+from inspire_relations.records import LITERATURE, SIMILAR
+
+analytics = pytest.importorskip('inspire_relations.analytics')
+similarity = pytest.importorskip('inspire_relations.similarity')
+
+
+def test_top_similar():
+    """Test co-citations and couplings are normalized and truncated."""
+    graph = analytics.citation_graph(
+        [1, 2, 3, 4, 5],
+        [(3, 1), (3, 2), (4, 1), (4, 2), (4, 3), (5, 1), (5, 3)])
+    similar = dict(similarity.top_similar(graph, limit=2, block_size=2))
+    assert similar[1] == [(2, 0.816497, 2, 0), (3, 0.816497, 2, 0)]
+    assert similar[2] == [(1, 0.816497, 2, 0), (3, 0.5, 1, 0)]
+    assert similar[3] == [(1, 0.816497, 2, 0), (4, 0.816497, 0, 2)]
+    assert similar[5] == [(4, 0.816497, 0, 2), (3, 0.5, 0, 1)]
+    assert list(similarity.top_similar(graph, positions=[0], limit=1)) == [
+        (1, [(2, 0.816497, 2, 0)])]
+
+
+def _similar(backend, recids):
+    return dict(
+        (recid, backend.ranked_neighbours(
+            SIMILAR, LITERATURE, LITERATURE, recid, 'score'))
+        for recid in recids)
+
+
+def test_similar_papers_are_refreshed_incrementally(records):
+    """Test only the papers close to changed citations are recomputed."""
+    records = records + [literature(20), literature(21, references=[20])]
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    assert similarity.compute_similar(backend, batch_size=2) == {
+        'literature': 6, 'similar': 10}
+    assert similarity.compute_similar(backend) == {
+        'literature': 0, 'similar': 0}
+
+    added = literature(5, references=[3])
+    backend.load([json.dumps(added)])
+    assert similarity.compute_similar(backend)['literature'] == 5
+
+    expected = MemoryBackend()
+    expected.load(json.dumps(record) for record in records + [added])
+    similarity.compute_similar(expected, full=True)
+    recids = [1, 2, 3, 4, 5, 20, 21]
+    assert _similar(backend, recids) == _similar(expected, recids)
+    assert _similar(backend, [5])[5] == [
+        (4, {'score': 0.57735, 'cocitations': 0, 'couplings': 1})]
+
+
+def test_norm_changes_are_refreshed():
+    """Test papers co-cited with a paper gaining a citation are refreshed."""
+    records = [literature(10), literature(11),
+               literature(1, references=[10, 11]),
+               literature(2, references=[10])]
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    similarity.compute_similar(backend)
+
+    added = literature(3, references=[10])
+    backend.load([json.dumps(added)])
+    similarity.compute_similar(backend)
+
+    expected = MemoryBackend()
+    expected.load(json.dumps(record) for record in records + [added])
+    similarity.compute_similar(expected, full=True)
+    recids = [1, 2, 3, 10, 11]
+    assert _similar(backend, recids) == _similar(expected, recids)
+    assert _similar(backend, [11])[11] == [
+        (10, {'score': 0.57735, 'cocitations': 1, 'couplings': 0})]
+
+
+def test_similar_endpoint(app, records):
+    """Test the similar papers are computed and read back."""
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='memory',
+        INSPIRE_RELATIONS_SIMILAR_LIMIT=2,
+    )
+    ext = InspireRelations(app)
+    ext.backend.load(json.dumps(record) for record in records)
+
+    result = CliRunner().invoke(
+        relations, ['similar', '--full'],
+        obj=ScriptInfo(create_app=lambda *args: app))
+    assert result.exit_code == 0
+    assert 'Computed the similar papers of 4 literature records: 8 ' \
+        'relations.' in result.output
+
+    with app.test_client() as client:
+        res = client.get('/relations/lit/1/similar?size=5')
+        assert res.status_code == 200
+        assert json.loads(res.get_data(as_text=True))['hits'] == [
+            {'recid': 2, 'score': 0.816497, 'cocitations': 2,
+             'couplings': 0},
+            {'recid': 3, 'score': 0.57735, 'cocitations': 1,
+             'couplings': 0},
+        ]
+        res = client.get('/relations/lit/404/similar')
+        assert json.loads(res.get_data(as_text=True))['hits'] == []
+        assert client.get('/relations/aut/1/similar').status_code == 404
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Citation snapshot tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import pytest
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+
+from inspire_relations import InspireRelations
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.cli import relations
+from inspire_relations.snapshot import Snapshot, SnapshotReader, write_snapshot
+
+
+def test_snapshot_lookups(tmpdir):
+    """Test a snapshot answers the citation lookups."""
+    path = str(tmpdir.join('citations.snapshot'))
+    citations = [(2, 1), (3, 1), (3, 2), (4, 1), (4, 2), (4, 3)]
+    assert write_snapshot(path, citations, version=7) == 7
+
+    snapshot = Snapshot(path)
+    assert (snapshot.version, snapshot.size, snapshot.citations) == (7, 4, 6)
+    assert snapshot.lookup('citation_count', 1) == 3
+    assert snapshot.lookup('citations', 1) == (2, 3, 4)
+    assert snapshot.lookup('references', 4) == (1, 2, 3)
+    assert snapshot.lookup('references', 1) == ()
+    assert snapshot.lookup('citations', 404) == ()
+    assert list(snapshot.page('citations', 1, after=2, limit=1)) == [3]
+    assert tmpdir.listdir() == [tmpdir.join('citations.snapshot')]
+
+
+def test_snapshot_rejects_other_files(tmpdir):
+    """Test files which are not snapshots are not mapped."""
+    path = tmpdir.join('citations.snapshot')
+    path.write('not a snapshot, but long enough to hold a header')
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+def test_reader_switches_snapshots(tmpdir):
+    """Test readers switch to a newly published snapshot."""
+    path = str(tmpdir.join('citations.snapshot'))
+    now = [0]
+    reader = SnapshotReader(path, check_interval=10, timer=lambda: now[0])
+    assert reader.current() is None
+
+    now[0] = 10
+    write_snapshot(path, [(2, 1)], version=1)
+    first = reader.current()
+    assert reader.version == 1
+
+    write_snapshot(path, [(2, 1), (3, 1)], version=2)
+    assert reader.current() is first
+    now[0] = 20
+    assert reader.version == 2
+    assert reader.current().lookup('citations', 1) == (2, 3)
+    assert first.lookup('citations', 1) == (2,)
+
+
+def test_queries_use_snapshot(app, records, tmpdir):
+    """Test citation lookups are answered by the published snapshot."""
+    path = str(tmpdir.join('citations.snapshot'))
+    app.config.update(
+        INSPIRE_RELATIONS_BACKEND='memory',
+        INSPIRE_RELATIONS_SNAPSHOT=path,
+        INSPIRE_RELATIONS_SNAPSHOT_CHECK_INTERVAL=0,
+    )
+    ext = InspireRelations(app)
+    ext.backend.load(json.dumps(record) for record in records)
+
+    result = CliRunner().invoke(
+        relations, ['export-snapshot'],
+        obj=ScriptInfo(create_app=lambda *args: app))
+    assert result.exit_code == 0
+    assert 'Published snapshot version' in result.output
+
+    backend = ext.query.backend = MemoryBackend()
+    assert ext.query.citations(1) == (2, 3, 4)
+    assert ext.query.citation_counts([1, 2]) == {1: 3, 2: 2}
+    assert list(ext.query.page('references', 4, after=1)) == [2, 3]
+    assert ext.query.author_papers(10) == ()
+    assert len(backend) == 0
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Incremental synchronization tests."""
+
+from __future__ import absolute_import, print_function
+
+from conftest import literature
+
+from inspire_relations import InspireRelations, cypher
+from inspire_relations.receivers import stash_stored_version, sync_deleted, \
+    sync_inserted, sync_updated
+from inspire_relations.records import LITERATURE, Relation
+from inspire_relations.sync import diff_relations
+
+
+class Model(object):
+    """Stand-in for a record database model."""
+
+    def __init__(self, json):
+        """Initialize the model."""
+        self.json = json
+
+
+class Record(dict):
+    """Stand-in for an Invenio record."""
+
+    def __init__(self, data, stored=None):
+        """Initialize the record with its stored version."""
+        super(Record, self).__init__(data)
+        self.id = data['control_number']
+        self.model = Model(stored)
+
+
+def cites(start, end):
+    """Return a citation relation."""
+    return Relation('CITES', (LITERATURE, start), (LITERATURE, end), {})
+
+
+def test_diff_relations():
+    """Test only changed relations are part of the diff."""
+    old = literature(1, references=[2, 3])
+    new = literature(1, references=[3, 4])
+    diff = diff_relations(old, new)
+    assert diff.node is None
+    assert diff.added == [cites(1, 4)]
+    assert diff.removed == [cites(1, 2)]
+
+    diff = diff_relations(None, new)
+    assert diff.node.key == 1
+    assert diff.added == [cites(1, 3), cites(1, 4)]
+
+    diff = diff_relations(old, None)
+    assert diff.node is None
+    assert diff.removed == [cites(1, 2), cites(1, 3)]
+
+    assert diff_relations(old, old) == (None, [], [])
+
+
+def test_sync_record(app):
+    """Test only the difference is written."""
+    ext = InspireRelations(app)
+    ext.sync_record(literature(1, references=[2]), literature(1))
+    ext.sync_record(literature(1), literature(1))
+
+    statements = ext.graph.driver.statements
+    assert len(statements) == 2
+    statement, parameters = statements[0]
+    assert statement == cypher.REMOVE_CITATIONS
+    assert parameters == {'rows': [
+        {'start': 1, 'end': 2, 'properties': {}}]}
+    statement, parameters = statements[1]
+    assert statement == cypher.stamp_nodes('Literature')
+    assert parameters['keys'] == [1, 2]
+
+
+def test_receivers(app):
+    """Test record signals are turned into relation diffs."""
+    ext = InspireRelations(app)
+    calls = []
+    ext.sync_record = lambda old, new: calls.append((old, new))
+    old = literature(1, references=[2])
+    new = literature(1, references=[3])
+
+    with app.app_context():
+        sync_inserted(app, record=Record(old))
+        record = Record(new, stored=old)
+        stash_stored_version(app, record=record)
+        sync_updated(app, record=record)
+        record = Record(new, stored=new)
+        stash_stored_version(app, record=record)
+        sync_deleted(app, record=record)
+
+    assert calls == [(None, old), (old, new), (new, None)]
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Temporal relations tests."""
+
+from __future__ import absolute_import, print_function
+
+import datetime
+import json
+
+from conftest import author, literature, ref
+
+from inspire_relations import InspireRelations, cypher
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.query import invalidated_keys
+from inspire_relations.records import AFFILIATED_WITH, CITES, INSTITUTION, \
+    LITERATURE, Relation, get_date, get_relations, normalize_date
+from inspire_relations.temporal import between, per_year, shift_month, \
+    since_month, to_month
+
+
+def institution(recid):
+    """Return a reference to an institution."""
+    return {'record': ref('institutions', recid)}
+
+
+def position(recid, **kwargs):
+    """Return a position of an author at an institution."""
+    return dict(institution=institution(recid), **kwargs)
+
+
+def test_dates():
+    """Test partial dates are completed and the earliest one is used."""
+    assert normalize_date('2016') == '2016-01-01'
+    assert normalize_date(2016) == '2016-01-01'
+    assert normalize_date('2016-3') == '2016-03-01'
+    assert normalize_date('2016-03-14T12:00') == '2016-03-14'
+    assert normalize_date('March 2016') is None
+    assert normalize_date(None) is None
+    assert get_date(literature(
+        1, preprint_date='2015-11-02',
+        publication_info=[{'year': 2016}])) == '2015-11-02'
+    assert get_date(literature(1)) is None
+
+
+def test_dated_relations():
+    """Test citations and affiliations carry their dates."""
+    paper = literature(2, references=[1], earliest_date='2016-03')
+    paper['authors'] = [{'affiliations': [institution(900)]}]
+    assert get_relations(paper) == [
+        Relation(CITES, (LITERATURE, 2), (LITERATURE, 1),
+                 {'date': '2016-03-01'}),
+        Relation(AFFILIATED_WITH, (LITERATURE, 2), (INSTITUTION, 900),
+                 {'date': '2016-03-01'}),
+    ]
+
+    positions = [
+        position(900, start_date='2010', end_date='2012-06'),
+        position(901, start_date='2012-07', current=True),
+        position(900, start_date='2014', end_date='2015'),
+        position(902),
+    ]
+    assert [relation.properties for relation in get_relations(
+        author(10, positions=positions))] == [
+        {'start_date': '2010-01-01', 'end_date': '2015-01-01'},
+        {'start_date': '2012-07-01'},
+        {},
+    ]
+
+
+def test_months():
+    """Test months are compared and summed as ``YYYYMM`` integers."""
+    assert to_month('2016-03-14') == 201603
+    assert to_month(datetime.date(2016, 3, 14)) == 201603
+    assert to_month(None) is None
+    assert shift_month(201603, -3) == 201512
+    assert shift_month(201612, 1) == 201701
+    assert since_month(12, today=datetime.date(2016, 3, 14)) == 201504
+
+    monthly = {201511: 1, 201603: 2, 201604: 3, 201701: 4}
+    assert per_year(monthly) == {2015: 1, 2016: 5, 2017: 4}
+    assert per_year(monthly, start=2016, end=2016) == {2016: 5}
+    assert between(monthly, 201603, 201612) == 5
+    assert between(monthly) == 10
+
+
+def temporal_records():
+    """Return papers citing each other over two years, and an author."""
+    return [
+        literature(1, earliest_date='2014-05'),
+        literature(2, references=[1], earliest_date='2015-02-10'),
+        literature(3, references=[1, 2], earliest_date='2016-01'),
+        literature(4, references=[1, 2], earliest_date='2016-03'),
+        literature(5, references=[1]),
+        author(10, positions=[
+            position(900, start_date='2010', end_date='2012-06'),
+            position(901, start_date='2012-07', current=True),
+            position(902, end_date='2011'),
+        ]),
+    ]
+
+
+def test_memory_temporal_queries():
+    """Test citations per month and affiliations at a date."""
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in temporal_records())
+    assert backend.monthly_citations_many([1, 2, 3, 404]) == {
+        1: {201502: 1, 201601: 1, 201603: 1},
+        2: {201601: 1, 201603: 1},
+    }
+    assert backend.rising_papers(201601, limit=1) == [(1, 2)]
+    assert backend.rising_papers(201602) == [(1, 1), (2, 1)]
+    assert backend.affiliations_at(10, '2011-06-01') == (900,)
+    assert backend.affiliations_at(10, '2009-06-01') == (902,)
+    assert backend.affiliations_at(10, '2020-01-01') == (901,)
+
+
+def test_neo4j_temporal_queries(app):
+    """Test temporal queries read the counters materialized on nodes."""
+    ext = InspireRelations(app)
+    driver = ext.graph.driver
+    driver.responder = lambda statement, params: [
+        {'recid': 1, 'months': [201502, 201601], 'counts': [1, 0]}]
+    assert ext.backend.monthly_citations_many([1]) == {1: {201502: 1}}
+    assert driver.statements[-1][1] == {'recids': [1]}
+
+    driver.responder = lambda statement, params: [
+        {'recid': 1, 'citations': 2}]
+    assert ext.backend.rising_papers(201601, limit=3) == [(1, 2)]
+    statement, params = driver.statements[-1]
+    assert 'WHERE n.last_citation_month >= $since' in statement
+    assert params == {'since': 201601, 'limit': 3}
+
+    driver.responder = lambda statement, params: [{'recid': 901}]
+    assert ext.backend.affiliations_at(10, '2020-01-01') == (901,)
+    assert driver.statements[-1][1] == {'recid': 10, 'date': '2020-01-01'}
+
+
+def test_moved_citation(app):
+    """Test a citation whose date changed is counted in its new month."""
+    app.config.update(INSPIRE_RELATIONS_BACKEND='memory')
+    ext = InspireRelations(app)
+    old = literature(2, references=[1], earliest_date='2015-03')
+    new = literature(2, references=[1], earliest_date='2019-07')
+    ext.backend.load(json.dumps(record) for record in [literature(1), old])
+    assert ext.query.monthly_citations(1) == {201503: 1}
+
+    assert ('monthly_citations', 1) in invalidated_keys(old, new)
+    ext.sync_record(old, new)
+    assert ext.query.monthly_citations(1) == {201907: 1}
+    assert ext.query.citations_per_year(1) == {2019: 1}
+
+
+def test_neo4j_moved_citation(app):
+    """Test existing citations are moved to the month of their new date."""
+    ext = InspireRelations(app)
+    ext.sync_record(literature(2, references=[1], earliest_date='2015-03'),
+                    literature(2, references=[1], earliest_date='2019-07'))
+    statement, params = ext.graph.driver.statements[-2]
+    assert statement == cypher.ADD_CITATIONS
+    assert params['rows'] == [
+        {'start': 2, 'end': 1, 'properties': {'date': '2019-07-01'}}]
+    assert 'SET e = row.properties, e.self_citation = self_citation' in \
+        statement
+    assert 'AS old_month' in statement
+    assert 'b.citations_per_month[i] - CASE WHEN b.citation_months[i] = ' \
+        'old_month' in statement
+
+
+def test_dated_citation(app):
+    """Test a citation which gets a date is counted in its month and year."""
+    app.config.update(INSPIRE_RELATIONS_BACKEND='memory')
+    ext = InspireRelations(app)
+    old = literature(2, references=[1])
+    new = literature(2, references=[1], earliest_date='2019-07')
+    ext.backend.load(json.dumps(record) for record in [literature(1), old])
+    assert ext.query.monthly_citations(1) == {}
+    assert ext.query.citations_per_year(1) == {}
+
+    ext.sync_record(old, new)
+    assert ext.query.monthly_citations(1) == {201907: 1}
+    assert ext.query.citations_per_year(1) == {2019: 1}
+
+
+def test_neo4j_dated_citation():
+    """Test a citation which gets a date is moved from no year nor month."""
+    statement = cypher.ADD_CITATIONS
+    assert "toInteger(substring(existing.date, 0, 4)) AS old_year" in \
+        statement
+    assert 'WHEN old_year IS NULL THEN b.citations_per_year' in statement
+    assert 'coalesce(old_month, 0) <> coalesce(month, 0)' in statement
+    moved = statement[statement.index('FOREACH (moved'):]
+    assert 'b.citations_per_year[i] + CASE WHEN b.citation_years[i] = year' \
+        in moved
+
+
+def test_lost_end_date(app):
+    """Test a position which is current again loses its end date."""
+    app.config.update(INSPIRE_RELATIONS_BACKEND='memory')
+    ext = InspireRelations(app)
+    old = author(10, positions=[
+        position(900, start_date='2010', end_date='2012-06')])
+    new = author(10, positions=[
+        position(900, start_date='2010', current=True)])
+    ext.backend.load([json.dumps(old)])
+    assert ext.backend.affiliations_at(10, '2020-01-01') == ()
+
+    ext.sync_record(old, new)
+    assert ext.backend.affiliations_at(10, '2020-01-01') == (900,)
+
+
+def test_neo4j_lost_end_date(app):
+    """Test relation properties are replaced rather than merged."""
+    ext = InspireRelations(app)
+    ext.sync_record(
+        author(10, positions=[
+            position(900, start_date='2010', end_date='2012-06')]),
+        author(10, positions=[position(900, start_date='2010')]))
+    statement, params = ext.graph.driver.statements[-1]
+    assert statement == cypher.add_relations(
+        AFFILIATED_WITH, 'Author', INSTITUTION)
+    assert 'SET r = row.properties' in statement
+    assert params['rows'][0]['properties'] == {'start_date': '2010-01-01'}
+
+
+def test_temporal_endpoints(app):
+    """Test citations per year, rising papers and affiliations views."""
+    app.config.update(INSPIRE_RELATIONS_BACKEND='memory')
+    ext = InspireRelations(app)
+    ext.backend.load(json.dumps(record) for record in temporal_records())
+    assert ext.query.citations_between(1, '2015', '2015-12') == 1
+
+    with app.test_client() as client:
+        res = client.get('/relations/lit/1/citations-per-year')
+        assert json.loads(res.get_data(as_text=True)) == {
+            'citations_per_year': {'2015': 1, '2016': 2}}
+        res = client.get('/relations/lit/1/citations-per-year?from=2016')
+        assert json.loads(res.get_data(as_text=True)) == {
+            'citations_per_year': {'2016': 2}}
+        assert client.get(
+            '/relations/lit/1/citations-per-year?to=x').status_code == 400
+
+        today = datetime.date.today()
+        months = (today.year - 2016) * 12 + today.month
+        res = client.get('/relations/lit/rising?months={0}&size=1'.format(
+            months))
+        assert json.loads(res.get_data(as_text=True))['hits'] == [
+            {'recid': 1, 'citations': 2}]
+        assert client.get('/relations/lit/rising?months=0').status_code == \
+            400
+
+        res = client.get('/relations/aut/10/affiliations?date=2011-06')
+        assert json.loads(res.get_data(as_text=True))['hits'] == [
+            {'recid': 900}]
+        res = client.get('/relations/aut/10/affiliations')
+        assert json.loads(res.get_data(as_text=True))['hits'] == [
+            {'recid': 901}]
+        assert client.get(
+            '/relations/aut/10/affiliations?date=soon').status_code == 400
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Multi-hop traversal tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import pytest
+
+from inspire_relations import InspireRelations
+from inspire_relations.backends.memory import MemoryBackend
+from inspire_relations.records import AUTHOR, CITES, LITERATURE, WRITTEN_BY
+from inspire_relations.traversal import Hop, traverse
+
+CITED_BY_CITERS = [
+    Hop(CITES, LITERATURE, reverse=True),
+    Hop(CITES, LITERATURE),
+]
+
+
+@pytest.fixture()
+def backend(records):
+    """A memory backend loaded with the records."""
+    backend = MemoryBackend()
+    backend.load(json.dumps(record) for record in records)
+    return backend
+
+
+def test_traverse_path(backend):
+    """Test the nodes at the end of a path are returned."""
+    assert traverse(backend, (LITERATURE, 1), CITED_BY_CITERS) == (
+        [(LITERATURE, 2), (LITERATURE, 3)], ())
+
+
+def test_traverse_within(backend):
+    """Test the nodes at any depth are returned, filtered by label."""
+    path = [Hop(WRITTEN_BY, LITERATURE, reverse=True),
+            [Hop(WRITTEN_BY, AUTHOR), Hop(CITES, LITERATURE)]]
+    result = traverse(backend, (AUTHOR, 10), path, within=True)
+    assert result.nodes == [
+        (LITERATURE, 1), (LITERATURE, 4), (AUTHOR, 11), (AUTHOR, 12),
+        (LITERATURE, 2), (LITERATURE, 3)]
+    result = traverse(backend, (AUTHOR, 10), path, within=True,
+                      labels=[AUTHOR])
+    assert result.nodes == [(AUTHOR, 11), (AUTHOR, 12)]
+
+
+def test_traverse_bounds(backend):
+    """Test bounded traversals return partial results."""
+    result = traverse(backend, (LITERATURE, 1), CITED_BY_CITERS, fan_out=1)
+    assert result.truncated == ('fan_out',)
+    assert result.nodes == []
+
+    result = traverse(backend, (LITERATURE, 1), CITED_BY_CITERS, limit=1)
+    assert result == ([(LITERATURE, 2)], ('limit',))
+
+    result = traverse(backend, (LITERATURE, 1), CITED_BY_CITERS, max_depth=1)
+    assert result.truncated == ('depth',)
+    assert len(result.nodes) == 3
+
+    result = traverse(backend, (LITERATURE, 1), CITED_BY_CITERS,
+                      max_nodes=2)
+    assert result == ([(LITERATURE, 2)], ('max_nodes',))
+
+    times = iter([0, 1, 10])
+    result = traverse(backend, (LITERATURE, 1), CITED_BY_CITERS, timeout=5,
+                      timer=lambda: next(times))
+    assert result == ([], ('timeout',))
+
+
+def test_extension_bounds(app):
+    """Test the configured bounds can not be raised by callers."""
+    app.config['INSPIRE_RELATIONS_TRAVERSAL_FAN_OUT'] = 2
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = lambda statement, parameters: [
+        {'key': 1, 'neighbours': [2, 3, 4]}]
+    with app.app_context():
+        result = ext.traverse((LITERATURE, 1), CITED_BY_CITERS[:1],
+                              fan_out=50)
+    assert result == ([(LITERATURE, 2), (LITERATURE, 3)], ('fan_out',))
+    statement, parameters = ext.graph.driver.statements[-1]
+    assert 'CASE WHEN degree <= $limit' in statement
+    assert parameters == {'keys': [1], 'limit': 3}
+    assert 0 < ext.graph.driver.transactions[-1].options['timeout'] <= \
+        app.config['INSPIRE_RELATIONS_TRAVERSAL_TIMEOUT']
+
+    with app.app_context():
+        result = ext.traverse((LITERATURE, 1), CITED_BY_CITERS[:1],
+                              fan_out=None, timeout=None)
+    assert result == ([(LITERATURE, 2), (LITERATURE, 3)], ('fan_out',))
+
+
+def test_hub_relations_are_not_expanded(app):
+    """Test the server stops expanding hub nodes at the fan-out."""
+    app.config['INSPIRE_RELATIONS_TRAVERSAL_FAN_OUT'] = 2
+
+    def respond(statement, parameters):
+        if 'key' in parameters:
+            return [{'key': 1}, {'key': 2}, {'key': 3}]
+        if parameters['keys'] == [100]:
+            return [{'key': 100, 'neighbours': [10, 11]}]
+        if parameters['keys'] == [10, 11]:
+            return [{'key': 10, 'neighbours': None},
+                    {'key': 11, 'neighbours': [4]}]
+        return []
+
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = respond
+    with app.app_context():
+        result = ext.traverse((LITERATURE, 100), [
+            Hop(WRITTEN_BY, AUTHOR), Hop(WRITTEN_BY, LITERATURE, reverse=True)
+        ])
+    assert result == ([(LITERATURE, 1), (LITERATURE, 2), (LITERATURE, 4)],
+                      ('fan_out',))
+    hubs = [parameters for statement, parameters
+            in ext.graph.driver.statements if 'LIMIT $limit' in statement]
+    assert hubs == [{'key': 10, 'limit': 3}]
+
+
+class TimedOut(Exception):
+    """Error of the driver for a transaction aborted by the server."""
+
+    code = 'Neo.ClientError.Transaction.TransactionTimedOut'
+
+
+def test_server_timeout(app):
+    """Test a traversal aborted by the server returns a partial result."""
+    def respond(statement, parameters):
+        if parameters['keys'] == [1]:
+            return [{'key': 1, 'neighbours': [2, 3]}]
+        raise TimedOut()
+
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = respond
+    with app.app_context():
+        result = ext.traverse((LITERATURE, 1), CITED_BY_CITERS,
+                              within=True)
+    assert result == ([(LITERATURE, 2), (LITERATURE, 3)], ('timeout',))
+    assert not ext.graph.driver.transactions[-1].rolled_back
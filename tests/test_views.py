@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""REST endpoint tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+from inspire_relations import InspireRelations
+from inspire_relations.views import decode_cursor, encode_cursor
+
+
+def keyset(recids):
+    """Return a responder paginating over fixed record ids."""
+    def respond(statement, parameters):
+        return [{'recid': recid} for recid in recids
+                if recid > parameters['after']][:parameters['limit']]
+    return respond
+
+
+def test_cursor_round_trip(app):
+    """Test cursors encode record ids."""
+    assert decode_cursor(encode_cursor(1234)) == 1234
+    assert decode_cursor('') is None
+
+
+def test_paginated_citations(app):
+    """Test pages are chained by cursors."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = keyset(list(range(10, 15)))
+
+    with app.test_client() as client:
+        res = client.get('/relations/lit/1/citations?size=2')
+        assert res.status_code == 200
+        assert res.mimetype == 'application/json'
+        data = json.loads(res.get_data(as_text=True))
+        assert data['hits'] == [{'recid': 10}, {'recid': 11}]
+
+        pages = [data]
+        while 'next' in pages[-1]['links']:
+            res = client.get(pages[-1]['links']['next'])
+            pages.append(json.loads(res.get_data(as_text=True)))
+
+    assert [[hit['recid'] for hit in page['hits']] for page in pages] == [
+        [10, 11], [12, 13], [14]]
+    statement, parameters = ext.graph.driver.statements[-1]
+    assert 'WHERE x.recid > $after' in statement
+    assert parameters == {'recid': 1, 'after': 13, 'limit': 3}
+
+
+def test_filtered_citations(app):
+    """Test citations are filtered in the graph and pages keep the filter."""
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = keyset([10, 11, 12])
+
+    with app.test_client() as client:
+        res = client.get('/relations/aut/1/citations?size=2&'
+                         'filter=refereed_only,exclude_self')
+        data = json.loads(res.get_data(as_text=True))
+        assert data['hits'] == [{'recid': 10}, {'recid': 11}]
+        assert 'filter=refereed_only,exclude_self' in data['links']['next']
+
+    statement, parameters = ext.graph.driver.statements[-1]
+    assert statement == (
+        'MATCH (:Author {recid: $recid})<-[:WRITTEN_BY]-(:Literature)'
+        '<-[r:CITES]-(x:Literature) '
+        'WHERE NOT coalesce(r.self_citation, false) '
+        'AND coalesce(x.refereed, false) AND x.recid > $after '
+        'RETURN DISTINCT x.recid AS recid ORDER BY recid LIMIT $limit')
+    assert parameters == {'recid': 1, 'after': -1, 'limit': 3}
+
+
+def test_relation_endpoints(app):
+    """Test the available endpoints and their errors."""
+    app.config['INSPIRE_RELATIONS_MAX_PAGE_SIZE'] = 3
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = keyset([])
+
+    with app.test_client() as client:
+        for url in ('/relations/lit/1/references', '/relations/aut/1/papers',
+                    '/relations/aut/1/coauthors?size=50'):
+            res = client.get(url)
+            assert res.status_code == 200
+            assert json.loads(res.get_data(as_text=True)) == {
+                'hits': [], 'links': {}}
+        assert ext.graph.driver.statements[-1][1]['limit'] == 4
+
+        assert client.get('/relations/aut/1/references').status_code == 404
+        assert client.get(
+            '/relations/lit/1/references?filter=exclude_self'
+        ).status_code == 400
+        assert client.get(
+            '/relations/lit/1/citations?filter=unknown').status_code == 400
+        assert client.get(
+            '/relations/lit/1/citations?size=0').status_code == 400
+        assert client.get(
+            '/relations/lit/1/citations?cursor=x').status_code == 400
+
+
+def test_batch_relations(app):
+    """Test relations of many records are returned together."""
+    app.config['INSPIRE_RELATIONS_MAX_BATCH_SIZE'] = 3
+    ext = InspireRelations(app)
+    ext.graph.driver.responder = lambda statement, parameters: [
+        {'recid': recid, 'value': [recid]} for recid in parameters['recids']]
+
+    with app.test_client() as client:
+        res = client.get('/relations/aut?ids=3,1&include=papers,coauthors')
+        assert res.status_code == 200
+        assert json.loads(res.get_data(as_text=True)) == {'hits': [
+            {'recid': 3, 'papers': [3], 'coauthors': [3]},
+            {'recid': 1, 'papers': [1], 'coauthors': [1]},
+        ]}
+        assert len(ext.graph.driver.statements) == 2
+
+        assert client.get(
+            '/relations/lit?ids=1,2,3,4&include=references').status_code == 400
+        assert client.get(
+            '/relations/lit?ids=a&include=references').status_code == 400
+        assert client.get('/relations/lit?ids=1').status_code == 400
+        assert client.get(
+            '/relations/lit?ids=1&include=papers').status_code == 404
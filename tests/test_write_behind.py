@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INSPIRE.
+# Copyright (C) 2016 CERN.
+#
+# INSPIRE is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# INSPIRE is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with INSPIRE; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Write-behind queue tests."""
+
+from __future__ import absolute_import, print_function
+
+import json
+
+import pytest
+from conftest import StandInDriver, literature
+
+from inspire_relations import InspireRelations
+from inspire_relations.sync import diff_relations, merge_diffs
+from inspire_relations.tasks import write_relation_changes
+from inspire_relations.write_behind import CeleryExecutor, PoolExecutor, \
+    QueueClosed, QueueFull, WriteBehindQueue, partition
+
+
+class RecordingExecutor(object):
+    """Executor keeping the submitted batches."""
+
+    invalidates = False
+
+    def __init__(self, complete=True):
+        """Initialize the executor."""
+        self.batches = []
+        self.partitions = []
+        self.complete = complete
+
+    def submit(self, changes, done, partition=0):
+        """Keep the batch, completing it if requested."""
+        self.batches.append(changes)
+        self.partitions.append(partition)
+        if self.complete:
+            done(True)
+
+    def close(self):
+        """Stop the executor."""
+
+
+def test_changes_are_coalesced():
+    """Test repeated changes of a record are written as one diff."""
+    executor = RecordingExecutor()
+    queue = WriteBehindQueue(executor, window=60)
+    queue.put(1, literature(1, references=[2]), literature(1, references=[3]))
+    queue.put(1, literature(1, references=[3]), literature(1, references=[4]))
+    queue.put(5, None, literature(5))
+    assert queue.depth == 2
+
+    queue.flush()
+    assert len(executor.batches) == 1
+    changes = executor.batches[0]
+    assert sorted(changes['nodes']) == ['Literature']
+    assert changes['removed'] == [['CITES', 'Literature', 'Literature', [
+        {'start': 1, 'end': 2, 'properties': {}}]]]
+    assert changes['added'] == [['CITES', 'Literature', 'Literature', [
+        {'start': 1, 'end': 4, 'properties': {}}]]]
+    assert queue.metrics() == {
+        'depth': 0, 'pending': 0, 'in_flight': 0, 'enqueued': 2,
+        'coalesced': 1, 'batches': 1, 'flushed': 2}
+
+
+def test_batches_hold_a_single_partition():
+    """Test the records of a batch all belong to the same partition."""
+    executor = RecordingExecutor()
+    queue = WriteBehindQueue(executor, window=60, partitions=3)
+    keys = [('Literature', recid) for recid in range(1, 11)]
+    for key in keys:
+        queue.put(key, None, literature(key[1]))
+    queue.flush()
+    assert sorted(executor.partitions) == sorted(
+        set(partition(key, 3) for key in keys))
+    for changes, partition_ in zip(executor.batches, executor.partitions):
+        assert set(partition(('Literature', row['key']), 3)
+                   for row in changes['nodes']['Literature']) == \
+            set([partition_])
+
+
+def test_backpressure():
+    """Test producers are rejected once the queue stays full."""
+    executor = RecordingExecutor(complete=False)
+    queue = WriteBehindQueue(
+        executor, window=0.01, batch_size=1, max_depth=2, put_timeout=0.05)
+    queue.put(1, None, literature(1))
+    queue.put(2, None, literature(2))
+    with pytest.raises(QueueFull):
+        queue.put(3, None, literature(3))
+    assert queue.depth == 2
+    assert queue.metrics()['rejected'] == 1
+
+
+def test_closed_queue():
+    """Test the flusher is stopped on close and later changes rejected."""
+    executor = RecordingExecutor()
+    queue = WriteBehindQueue(executor, window=60)
+    queue.put(1, None, literature(1))
+    queue.close()
+    assert not queue._flusher.is_alive()
+    assert queue.metrics()['flushed'] == 1
+    with pytest.raises(QueueClosed):
+        queue.put(2, None, literature(2))
+    assert queue.depth == 0
+    assert queue.metrics()['rejected'] == 1
+
+
+class FailingBackend(object):
+    """Backend whose writes fail."""
+
+    process_local = False
+
+    def write_changes(self, changes):
+        """Fail to write."""
+        raise IOError('Graph unavailable.')
+
+
+def test_pool_failure_is_logged(caplog):
+    """Test a batch failing in a worker process is logged."""
+    queue = WriteBehindQueue(PoolExecutor(FailingBackend(), max_retries=0),
+                             window=60)
+    queue.put(1, None, literature(1))
+    queue.close()
+    assert queue.metrics()['failed'] == 1
+    assert 'Writing relation changes in a worker failed.' in caplog.text
+    assert 'Graph unavailable.' in caplog.text
+
+
+class LoggingDriver(StandInDriver):
+    """Stand-in driver logging its statements to the file of its URI.
+
+    Statements run by other processes can then be read back.
+    """
+
+    def respond(self, statement, parameters):
+        """Log the statement and answer it."""
+        with open(self.uri, 'a') as log:
+            log.write(json.dumps([statement, parameters]) + '\n')
+        return super(LoggingDriver, self).respond(statement, parameters)
+
+
+def test_local_write_behind(app, tmpdir):
+    """Test changes are written by a local worker process."""
+    log = tmpdir.join('statements.log')
+    app.config.update(INSPIRE_RELATIONS_WRITE_BEHIND='local',
+                      INSPIRE_RELATIONS_WRITE_BEHIND_WINDOW=60,
+                      INSPIRE_RELATIONS_GRAPH_URI=str(log),
+                      INSPIRE_RELATIONS_GRAPH_DRIVER_FACTORY=LoggingDriver)
+    ext = InspireRelations(app)
+    assert ext.sync_record(None, literature(1, references=[2])) is None
+    assert ext.write_behind.depth == 1
+
+    with app.test_client() as client:
+        res = client.get('/relations/metrics')
+    assert 'inspire_relations_write_behind_depth 1' in \
+        res.get_data(as_text=True)
+
+    ext.write_behind.close()
+    assert ext.write_behind.metrics()['flushed'] == 1
+    assert not ext.graph.connected
+    rows = [parameters.get('rows') for _, parameters
+            in (json.loads(line) for line in log.readlines())]
+    assert [{'key': 1, 'properties': {'recid': 1}}] in rows
+    assert [{'start': 1, 'end': 2, 'properties': {}}] in rows
+
+
+def test_local_write_behind_needs_a_shared_graph(app):
+    """Test local workers refuse to write to their copy of the graph."""
+    app.config.update(INSPIRE_RELATIONS_WRITE_BEHIND='local',
+                      INSPIRE_RELATIONS_BACKEND='memory')
+    with pytest.raises(ValueError):
+        InspireRelations(app)
+
+
+def test_celery_send_failure(monkeypatch):
+    """Test a batch failing to reach the broker is not reported written."""
+    def apply_async(args, queue):
+        raise IOError('Broker unavailable.')
+
+    monkeypatch.setattr(write_relation_changes, 'apply_async', apply_async)
+    written = []
+    queue = WriteBehindQueue(CeleryExecutor(max_retries=1, backoff=0),
+                             window=60, on_written=written.extend)
+    queue.put(1, None, literature(1))
+    queue.flush()
+    assert queue.metrics()['failed'] == 1
+    assert written == []
+
+    sent = []
+    monkeypatch.setattr(write_relation_changes, 'apply_async',
+                        lambda args, queue: sent.append((args[1], queue)))
+    queue.put(1, None, literature(1, references=[2]))
+    queue.flush()
+    assert sent == [([('citation_count', 2), ('citations', 2),
+                      ('monthly_citations', 2), ('references', 1)],
+                     'inspire-relations-writes-0')]
+    assert queue.metrics()['flushed'] == 1
+    assert written == []
+
+
+def test_full_write_behind_writes_inline(app):
+    """Test changes are written inline when the queue is full."""
+    app.config.update(INSPIRE_RELATIONS_WRITE_BEHIND='local',
+                      INSPIRE_RELATIONS_WRITE_BEHIND_MAX_DEPTH=0,
+                      INSPIRE_RELATIONS_WRITE_BEHIND_PUT_TIMEOUT=0)
+    ext = InspireRelations(app)
+    diff = ext.sync_record(None, literature(1, references=[2]))
+    assert len(diff.added) == 1
+    assert len(ext.graph.driver.statements) == 3
+    ext.write_behind.close()
+
+
+def test_write_relation_changes_task(app):
+    """Test the Celery task writes the changes."""
+    ext = InspireRelations(app)
+    changes = {'nodes': {'Literature': [{'key': 1, 'properties': {}}]},
+               'added': [], 'removed': []}
+    with app.app_context():
+        write_relation_changes.apply(args=(changes,))
+    assert len(ext.graph.driver.statements) == 1
+
+
+def test_write_relation_changes_task_invalidates(app):
+    """Test the Celery task invalidates the lookups once written."""
+    app.config.update(INSPIRE_RELATIONS_BACKEND='memory')
+    ext = InspireRelations(app)
+    assert ext.query.citation_count(2) == 0
+    changes = merge_diffs([diff_relations(
+        None, literature(1, references=[2]))])
+    with app.app_context():
+        write_relation_changes.apply(
+            args=(changes, [['citation_count', 2]]))
+    assert ext.query.citation_count(2) == 1